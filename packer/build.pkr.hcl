@@ -1,28 +1,6 @@
-build {
-  name = "build"
-  source "source.qemu.packer" {
-    cd_files = ["user-data", "meta-data"]
-  }
-
-  # put files to /run instead of /tmp to avoid systemd-tmpfiles-clean.service
-  provisioner "file" {
-    source      = "modules-always/header"
-    destination = "/run/"
-  }
-
-  provisioner "file" {
-    source      = "squid.crt"
-    destination = "/run/"
-  }
-
-  provisioner "shell" {
-    scripts = var.modules
-  }
-
-  post-processor "manifest" {
-    output = "output/${var.vm_name}/manifest.json"
-  }
-}
+# The production "build" block is generated for every packer run by
+# checkpoint.py (one provisioner per module); packer.py passes the generated
+# template directory, which shares variables.pkr.hcl and sources.pkr.hcl.
 
 build {
   name = "debug"
@@ -0,0 +1,234 @@
+"""Per-module provisioners and module-level checkpoints.
+
+packer.py and layer_cache.py generate the "build" block for every packer run
+instead of using one shell provisioner for all modules: each module becomes
+its own provisioner, so packer reports exactly which module failed.
+
+In qcow2 layer stages the block also takes a checkpoint after every module:
+the guest syncs, then a shell-local provisioner asks QEMU over QMP for an
+internal snapshot of the disk (cheap, no copy). When a later module fails,
+the error-cleanup provisioner pauses the VM and extracts the newest
+checkpoint into layers/<key>.partial.qcow2 before packer tears the build
+down, so the next run of that stage starts from the last good module.
+
+Usage (from the generated templates):
+    checkpoint.py snapshot QMP_SOCKET NAME
+    checkpoint.py save QMP_SOCKET OUTPUT [BACKING]
+"""
+
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+
+PACKER_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_PREFIX = "after-"
+
+# Shared with the hand-written templates in this directory
+TEMPLATE_FILES = ["variables.pkr.hcl", "sources.pkr.hcl"]
+
+
+class CheckpointError(Exception):
+    """QEMU refused a checkpoint operation."""
+
+
+def snapshot_name(module):
+    return SNAPSHOT_PREFIX + os.path.basename(module)
+
+
+# ---------------------------------------------------------------------------
+# Templates
+# ---------------------------------------------------------------------------
+
+def _str(value):
+    # JSON string literals are valid HCL string literals
+    return json.dumps(value)
+
+
+def _path(name):
+    return _str(os.path.join(PACKER_DIR, name))
+
+
+def render_build(modules, checkpoint=None):
+    """HCL for the "build" block running *modules* one provisioner each.
+
+    *checkpoint* is None, or {"socket": QMP socket, "after": modules to
+    checkpoint, "partial": where to save the last good state on failure,
+    "backing": its backing file or None}.
+    """
+    lines = [
+        "# Generated by packer.py, see checkpoint.py",
+        "build {",
+        '  name = "build"',
+        '  source "source.qemu.packer" {',
+        f'    cd_files = [{_path("user-data")}, {_path("meta-data")}]',
+        "  }",
+        "",
+        "  # put files to /run instead of /tmp to avoid systemd-tmpfiles-clean.service",
+    ]
+    for source in ("modules-always/header", "squid.crt", "profile.sh"):
+        lines += [
+            '  provisioner "file" {',
+            f"    source      = {_path(source)}",
+            '    destination = "/run/"',
+            "  }",
+        ]
+
+    for i, module in enumerate(modules):
+        # The uploaded script has a random name, so profile.sh is told the
+        # module's name as its second argument
+        execute = ("chmod +x {{ .Path }}; {{ .Vars }} bash /run/profile.sh {{ .Path }} "
+                   + shlex.quote(os.path.basename(module)))
+        lines += [
+            "",
+            '  provisioner "shell" {',
+            f"    script          = {_str(os.path.abspath(module))}",
+            f"    execute_command = {_str(execute)}",
+            "  }",
+        ]
+        # The state after the last module is the layer itself
+        if checkpoint and i < len(modules) - 1 and module in checkpoint["after"]:
+            command = [sys.executable, os.path.join(PACKER_DIR, "checkpoint.py"),
+                       "snapshot", checkpoint["socket"], snapshot_name(module)]
+            lines += [
+                '  provisioner "shell" {',
+                '    inline = ["sync"]',
+                "  }",
+                '  provisioner "shell-local" {',
+                f"    inline = [{_str(subprocess.list2cmdline(command))}]",
+                "  }",
+            ]
+
+    if checkpoint:
+        command = [sys.executable, os.path.join(PACKER_DIR, "checkpoint.py"),
+                   "save", checkpoint["socket"], checkpoint["partial"]]
+        if checkpoint.get("backing"):
+            command.append(checkpoint["backing"])
+        lines += [
+            "",
+            '  error-cleanup-provisioner "shell-local" {',
+            f"    inline = [{_str(subprocess.list2cmdline(command))}]",
+            "  }",
+        ]
+
+    lines += [
+        "",
+        '  post-processor "manifest" {',
+        '    output = "${local.output_directory}/manifest.json"',
+        "  }",
+        "}",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def write_template(path, modules, checkpoint=None):
+    """Create a packer template directory for one run; returns *path*."""
+    os.makedirs(path, exist_ok=True)
+    for name in TEMPLATE_FILES:
+        link = os.path.join(path, name)
+        if not os.path.lexists(link):
+            os.symlink(os.path.join(PACKER_DIR, name), link)
+    with open(os.path.join(path, "build.pkr.hcl"), "w") as f:
+        f.write(render_build(modules, checkpoint))
+    return path
+
+
+# ---------------------------------------------------------------------------
+# QEMU
+# ---------------------------------------------------------------------------
+
+def qmp(path, *commands):
+    """Run (command, arguments) pairs on a QMP socket; returns their results."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        stream = sock.makefile("rw")
+        json.loads(stream.readline())  # greeting
+        results = []
+        for command, arguments in (("qmp_capabilities", {}),) + commands:
+            stream.write(json.dumps({"execute": command, "arguments": arguments}) + "\n")
+            stream.flush()
+            while True:
+                reply = json.loads(stream.readline())
+                if "return" in reply:
+                    results.append(reply["return"])
+                    break
+                if "error" in reply:
+                    raise CheckpointError(f"{command}: {reply['error'].get('desc')}")
+                # anything else is an asynchronous event
+        return results[1:]
+
+
+def _system_disk(path):
+    """The writable qcow2 disk of the VM (cd_files are read-only)."""
+    for device in qmp(path, ("query-block", {}))[0]:
+        inserted = device.get("inserted")
+        if inserted and not inserted.get("ro") and inserted.get("drv") == "qcow2":
+            return device.get("device") or inserted["node-name"], inserted
+    raise CheckpointError("no writable qcow2 disk attached")
+
+
+def snapshot(path, name):
+    device, _ = _system_disk(path)
+    qmp(path, ("blockdev-snapshot-internal-sync", {"device": device, "name": name}))
+
+
+def save(path, output, backing=None):
+    """Extract the newest checkpoint of the paused VM into *output*.
+
+    Returns the snapshot name, or None when no module had finished yet.
+    """
+    qmp(path, ("stop", {}))
+    _, inserted = _system_disk(path)
+    snapshots = inserted.get("image", {}).get("snapshots") or []
+    snapshots = [s for s in snapshots if s["name"].startswith(SNAPSHOT_PREFIX)]
+    if not snapshots:
+        return None
+    name = max(snapshots, key=lambda s: int(s["id"]))["name"]
+    tmp = output + ".tmp"
+    cmd = ["qemu-img", "convert", "-U", "-f", "qcow2", "-O", "qcow2",
+           "-l", f"snapshot.name={name}"]
+    if backing:
+        cmd += ["-B", backing, "-F", "qcow2"]
+    subprocess.run(cmd + [inserted["file"], tmp], check=True)
+    os.replace(tmp, output)
+    with open(output + ".json", "w") as f:
+        json.dump({"snapshot": name}, f)
+    return name
+
+
+def drop_snapshots(image):
+    """Delete internal snapshots so a published layer keeps no stale clusters."""
+    info = json.loads(subprocess.run(
+        ["qemu-img", "info", "--output=json", image],
+        check=True, capture_output=True, text=True,
+    ).stdout)
+    for s in info.get("snapshots") or []:
+        subprocess.run(["qemu-img", "snapshot", "-d", s["name"], image], check=True)
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "snapshot":
+        snapshot(sys.argv[2], sys.argv[3])
+        print(f"checkpoint {sys.argv[3]}")
+    elif len(sys.argv) in (4, 5) and sys.argv[1] == "save":
+        try:
+            name = save(*sys.argv[2:])
+        except (CheckpointError, OSError, subprocess.CalledProcessError) as e:
+            # Never mask the provisioning error packer is about to report
+            print(f"warning: could not save checkpoint: {e}", file=sys.stderr)
+            return
+        if name:
+            print(f"saved checkpoint {name} to {sys.argv[3]}")
+        else:
+            print("no module finished in this stage, nothing to save")
+    else:
+        print("usage: checkpoint.py snapshot QMP_SOCKET NAME\n"
+              "       checkpoint.py save QMP_SOCKET OUTPUT [BACKING]", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
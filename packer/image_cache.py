@@ -0,0 +1,255 @@
+"""Content-addressed store for packer base images.
+
+Images live under download/<algorithm>/<digest>, keyed by the checksum that
+config.yaml pins them to, so every target built from the same cloud image
+shares one verified copy. Downloads resume from a partial file with HTTP
+Range requests and are hashed while they stream; a file only enters the
+store once its digest matches.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+STORE_DIR = "download"
+INDEX_FILE = "index.json"  # "url checksum" -> "algorithm/digest"
+CHUNK = 4 << 20
+USER_AGENT = "zjusct-packer/1.0"
+
+# hex digest length -> hashlib algorithm, for checksum files without a type
+ALGORITHM_BY_LENGTH = {
+    32: "md5",
+    40: "sha1",
+    64: "sha256",
+    128: "sha512",
+}
+
+# "SHA256 (file.qcow2) = abc..." (BSD / Fedora / Rocky style)
+_BSD_LINE = re.compile(r"^(\w+) \((.+)\) = ([0-9a-fA-F]+)$")
+# "abc...  file.qcow2" or "abc... *file.qcow2" (GNU coreutils style)
+_GNU_LINE = re.compile(r"^([0-9a-fA-F]+)\s+\*?(.+)$")
+
+
+class ChecksumError(Exception):
+    """The pinned checksum could not be resolved or did not match."""
+
+
+def _open(url, headers=None, timeout=60):
+    req = urllib.request.Request(url, headers={"User-Agent": USER_AGENT, **(headers or {})})
+    return urllib.request.urlopen(req, timeout=timeout)
+
+
+def probe(url):
+    """None if *url* answers, else a short error; reads at most one byte."""
+    try:
+        with _open(url, {"Range": "bytes=0-0"}, timeout=15):
+            return None
+    except urllib.error.HTTPError as e:
+        return f"HTTP {e.code} {e.reason}"
+    except (urllib.error.URLError, OSError) as e:
+        return str(getattr(e, "reason", e))
+
+
+# ---------------------------------------------------------------------------
+# Checksums
+# ---------------------------------------------------------------------------
+
+def fetch_text(url):
+    with _open(url) as resp:
+        return resp.read().decode("utf-8", "replace")
+
+
+def parse_checksum_file(text, filename):
+    """Find *filename*'s (algorithm, digest) in a checksum file."""
+    for raw in text.splitlines():
+        line = raw.strip()
+        m = _BSD_LINE.match(line)
+        if m and os.path.basename(m.group(2)) == filename:
+            return m.group(1).lower().replace("-", ""), m.group(3).lower()
+        m = _GNU_LINE.match(line)
+        if m and os.path.basename(m.group(2).strip()) == filename:
+            digest = m.group(1).lower()
+            algorithm = ALGORITHM_BY_LENGTH.get(len(digest))
+            if algorithm:
+                return algorithm, digest
+    raise ChecksumError(f"{filename} not listed in checksum file")
+
+
+def resolve_checksum(url, checksum, checksum_files=None):
+    """Turn packer's iso_checksum syntax into (algorithm, hex digest).
+
+    *checksum_files* maps already-fetched checksum file URLs to their text.
+    """
+    if checksum.startswith("file:"):
+        source = checksum[len("file:"):]
+        text = (checksum_files or {}).get(source)
+        if text is None:
+            text = fetch_text(source)
+        filename = os.path.basename(urllib.parse.urlparse(url).path)
+        return parse_checksum_file(text, filename)
+    if ":" in checksum:
+        algorithm, digest = checksum.split(":", 1)
+        return algorithm.lower(), digest.lower()
+    algorithm = ALGORITHM_BY_LENGTH.get(len(checksum))
+    if algorithm is None:
+        raise ChecksumError(f"cannot tell the algorithm of checksum {checksum!r}")
+    return algorithm, checksum.lower()
+
+
+def fetch_checksum_files(pairs, workers=8):
+    """Fetch the distinct ``file:`` checksum sources of *pairs* concurrently."""
+    sources = sorted({c[len("file:"):] for _, c in pairs if c.startswith("file:")})
+    if not sources:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(sources))) as pool:
+        texts = list(pool.map(fetch_text, sources))
+    return dict(zip(sources, texts))
+
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+
+def store_path(algorithm, digest, store_dir=STORE_DIR):
+    return os.path.join(store_dir, algorithm, digest)
+
+
+def download(url, algorithm, digest, store_dir=STORE_DIR, log=print):
+    """Return the local path of the verified image, downloading it if needed."""
+    path = store_path(algorithm, digest, store_dir)
+    if os.path.isfile(path):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = path + ".part"
+    # Serialize with other packer.py processes fetching the same image
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isfile(path):
+            return path
+
+        hasher = hashlib.new(algorithm)
+        offset = 0
+        if os.path.isfile(part):
+            # Re-hash what we already have so verification stays streaming
+            with open(part, "rb") as f:
+                while chunk := f.read(CHUNK):
+                    hasher.update(chunk)
+                    offset += len(chunk)
+
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            resp = _open(url, headers)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            resp = None  # the partial file is already complete
+
+        if resp is not None:
+            with resp:
+                if offset and resp.status != 206:
+                    log(f"  {url}: server ignored Range, restarting download")
+                    hasher, offset = hashlib.new(algorithm), 0
+                total = resp.headers.get("Content-Length")
+                total = int(total) + offset if total else None
+                log(f"  downloading {url}"
+                    + (f" (resuming at {offset >> 20} MiB)" if offset else "")
+                    + (f", {total >> 20} MiB" if total else ""))
+                with open(part, "ab" if offset else "wb") as out:
+                    while chunk := resp.read(CHUNK):
+                        out.write(chunk)
+                        hasher.update(chunk)
+
+        actual = hasher.hexdigest()
+        if actual != digest:
+            os.remove(part)
+            raise ChecksumError(f"{url}: {algorithm} mismatch, got {actual}, want {digest}")
+        os.chmod(part, 0o444)
+        os.replace(part, path)
+        with open(path + ".json", "w") as f:
+            json.dump({"url": url, "algorithm": algorithm, "digest": digest}, f)
+    return path
+
+
+def _load_index(store_dir):
+    try:
+        with open(os.path.join(store_dir, INDEX_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(store_dir, index):
+    os.makedirs(store_dir, exist_ok=True)
+    tmp = os.path.join(store_dir, f".{INDEX_FILE}.{os.getpid()}")
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(store_dir, INDEX_FILE))
+
+
+def _indexed(index, store_dir, url, checksum):
+    """(algorithm, digest) of a stored (url, checksum), or None."""
+    known = index.get(f"{url} {checksum}")
+    if known and os.path.isfile(os.path.join(store_dir, known)):
+        return tuple(known.split("/", 1))
+    return None
+
+
+def cached(url, checksum, store_dir=STORE_DIR):
+    """Whether (url, checksum) is in the store, so localize() needs no network."""
+    return _indexed(_load_index(store_dir), store_dir, url, checksum) is not None
+
+
+def localize(pairs, store_dir=STORE_DIR, workers=4):
+    """Download every distinct (url, checksum) of *pairs* into the store.
+
+    Pairs seen before are answered from the index without any network
+    access. For the rest, checksum files are fetched in parallel first, then
+    images (at most *workers* at a time). Returns {(url, checksum): local
+    absolute path}.
+    """
+    pairs = sorted(set(pairs))
+    index = _load_index(store_dir)
+    resolved = {}
+    for url, checksum in pairs:
+        known = _indexed(index, store_dir, url, checksum)
+        if known:
+            resolved[(url, checksum)] = known
+
+    missing = [p for p in pairs if p not in resolved]
+    checksum_files = fetch_checksum_files(missing)
+    for p in missing:
+        resolved[p] = resolve_checksum(p[0], p[1], checksum_files)
+
+    def _fetch(pair):
+        algorithm, digest = resolved[pair]
+        return os.path.abspath(download(pair[0], algorithm, digest, store_dir))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(pairs) or 1))) as pool:
+        paths = list(pool.map(_fetch, pairs))
+
+    if missing:
+        index = _load_index(store_dir)
+        index.update({f"{url} {checksum}": "/".join(resolved[(url, checksum)])
+                      for url, checksum in missing})
+        _save_index(store_dir, index)
+    return dict(zip(pairs, paths))
+
+
+def main():
+    """Populate the store: image_cache.py URL CHECKSUM."""
+    if len(sys.argv) != 3:
+        print("usage: image_cache.py URL CHECKSUM", file=sys.stderr)
+        sys.exit(2)
+    print(localize([(sys.argv[1], sys.argv[2])])[(sys.argv[1], sys.argv[2])])
+
+
+if __name__ == "__main__":
+    main()
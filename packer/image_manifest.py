@@ -0,0 +1,233 @@
+"""Block-level manifests and delta distribution of built images.
+
+A manifest splits an image into fixed 4 MiB blocks and records the sha256 of
+each; blocks that are holes or all zeros are recorded as null and never
+stored. Blocks live content-addressed in the bucket under blocks/xx/<sha256>, so
+a rebuilt image only adds the blocks that actually changed, and a node that
+already holds the previous image only fetches those.
+
+Usage:
+    image_manifest.py create IMAGE                 # writes IMAGE.blocks.json
+    image_manifest.py diff OLD.blocks.json NEW.blocks.json
+    image_manifest.py push IMAGE.blocks.json [--since OLD.blocks.json] [--key KEY]
+    image_manifest.py apply NEW.blocks.json TARGET --since OLD.blocks.json
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import upload
+
+BLOCK_SIZE = 4 << 20
+BLOCK_PREFIX = "blocks"
+WORKERS = 8
+
+_ZERO_DIGESTS = {}
+
+
+def manifest_path(image):
+    return f"{image}.blocks.json"
+
+
+def _zero_digest(length):
+    if length not in _ZERO_DIGESTS:
+        _ZERO_DIGESTS[length] = hashlib.sha256(bytes(length)).hexdigest()
+    return _ZERO_DIGESTS[length]
+
+
+def create(image, block_size=BLOCK_SIZE, workers=WORKERS):
+    """Hash every block of *image*; holes are skipped without being read."""
+    size = os.path.getsize(image)
+    count = (size + block_size - 1) // block_size
+    blocks = [None] * count
+    with open(image, "rb") as f:
+        extents = upload.data_extents(f.fileno(), size)
+        starts = [e[0] for e in extents]
+        todo = [i for i in range(count)
+                if upload.overlaps(extents, starts, i * block_size,
+                                   min(block_size, size - i * block_size))]
+        if todo:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+
+                def _hash(i):
+                    with view[i * block_size:(i + 1) * block_size] as block:
+                        digest = hashlib.sha256(block).hexdigest()
+                        # allocated but zero-filled blocks are elided too
+                        return None if digest == _zero_digest(len(block)) else digest
+
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    for i, digest in zip(todo, pool.map(_hash, todo, chunksize=64)):
+                        blocks[i] = digest
+                view.release()
+    return {
+        "image": os.path.basename(image),
+        "size": size,
+        "block_size": block_size,
+        "algorithm": "sha256",
+        "blocks": blocks,
+    }
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(manifest, path):
+    with open(path, "w") as f:
+        json.dump(manifest, f)
+
+
+def changed_blocks(old, new):
+    """Indexes of *new* whose content differs from the same block in *old*."""
+    if old is None:
+        return list(range(len(new["blocks"])))
+    if old["block_size"] != new["block_size"]:
+        raise ValueError("manifests use different block sizes")
+    previous = old["blocks"]
+    return [i for i, digest in enumerate(new["blocks"])
+            if i >= len(previous) or previous[i] != digest]
+
+
+def summary(old, new):
+    changed = changed_blocks(old, new)
+    known = set(old["blocks"]) if old else set()
+    fetch = {new["blocks"][i] for i in changed} - known - {None}
+    data = sum(1 for d in new["blocks"] if d)
+    return {
+        "blocks": len(new["blocks"]),
+        "data_blocks": data,
+        "changed_blocks": len(changed),
+        "new_unique_blocks": len(fetch),
+        "transfer_bytes": len(fetch) * new["block_size"],
+        "full_bytes": data * new["block_size"],
+    }
+
+
+def _fmt_mib(n):
+    return f"{n / (1 << 20):.0f} MiB"
+
+
+# ---------------------------------------------------------------------------
+# Bucket
+# ---------------------------------------------------------------------------
+
+def block_key(digest):
+    return f"{BLOCK_PREFIX}/{digest[:2]}/{digest}"
+
+
+def push(client, image, manifest, since=None, key=None, workers=WORKERS, log=print):
+    """Upload the blocks of *image* missing from the bucket, then the manifest.
+
+    Blocks listed in *since* are assumed present; every other block is
+    checked with HEAD first, so the store stays correct without it.
+    """
+    known = set(since["blocks"]) if since else set()
+    wanted = {}
+    for i, digest in enumerate(manifest["blocks"]):
+        if digest and digest not in known:
+            wanted.setdefault(digest, i)
+    block_size = manifest["block_size"]
+    start = time.monotonic()
+    log(f"pushing {image}: {len(wanted)} candidate block(s) of "
+        f"{sum(1 for d in manifest['blocks'] if d)} with data")
+
+    with open(image, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+
+        def _push(item):
+            digest, i = item
+            if client.exists(block_key(digest)):
+                return 0
+            with view[i * block_size:(i + 1) * block_size] as block:
+                client.request("PUT", block_key(digest), body=block, payload_hash=digest)
+                return len(block)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sent = list(pool.map(_push, wanted.items()))
+        view.release()
+
+    key = key or manifest["image"]
+    client.put_object(f"{key}.blocks.json", json.dumps(manifest).encode(), "application/json")
+    uploaded = sum(1 for n in sent if n)
+    log(f"pushed {uploaded} block(s), {_fmt_mib(sum(sent))} in "
+        f"{time.monotonic() - start:.0f}s; manifest at {key}.blocks.json")
+    return uploaded
+
+
+def apply(client, manifest, target, since, workers=WORKERS, log=print):
+    """Bring *target*, currently holding the image of *since*, up to *manifest*."""
+    block_size = manifest["block_size"]
+    changed = changed_blocks(since, manifest)
+    log(f"updating {target}: {len(changed)} of {len(manifest['blocks'])} block(s) changed")
+    fd = os.open(target, os.O_WRONLY)
+    try:
+        def _write(i):
+            digest = manifest["blocks"][i]
+            length = min(block_size, manifest["size"] - i * block_size)
+            if digest is None:
+                data = bytes(length)
+            else:
+                _, _, data = client.request("GET", block_key(digest))
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise upload.S3Error(f"block {digest} is corrupt")
+            os.pwrite(fd, data, i * block_size)
+            return len(data) if digest else 0
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fetched = sum(pool.map(_write, changed))
+        if os.path.isfile(target) and os.path.getsize(target) != manifest["size"]:
+            os.truncate(target, manifest["size"])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    log(f"fetched {_fmt_mib(fetched)} for {target}")
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Block manifests for packer images")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("create", help="Write IMAGE.blocks.json")
+    p.add_argument("image")
+    p = sub.add_parser("diff", help="Show what moving from OLD to NEW transfers")
+    p.add_argument("old")
+    p.add_argument("new")
+    p = sub.add_parser("push", help="Upload new blocks and the manifest")
+    p.add_argument("manifest")
+    p.add_argument("--since", help="Manifest of a previous build whose blocks are already stored")
+    p.add_argument("--key", help="Object key of the image (default: image file name)")
+    p = sub.add_parser("apply", help="Patch TARGET from OLD to NEW with fetched blocks")
+    p.add_argument("manifest")
+    p.add_argument("target")
+    p.add_argument("--since", required=True, help="Manifest of the image TARGET holds now")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        manifest = create(args.image)
+        save(manifest, manifest_path(args.image))
+        print(manifest_path(args.image))
+    elif args.command == "diff":
+        print(json.dumps(summary(load(args.old), load(args.new)), indent=2))
+    elif args.command == "push":
+        upload.check_credentials()
+        manifest = load(args.manifest)
+        image = os.path.join(os.path.dirname(args.manifest), manifest["image"])
+        since = load(args.since) if args.since else None
+        push(upload.S3Client(), image, manifest, since, args.key)
+    elif args.command == "apply":
+        upload.check_credentials()
+        apply(upload.S3Client(), load(args.manifest), args.target, load(args.since))
+
+
+if __name__ == "__main__":
+    main()
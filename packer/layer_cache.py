@@ -0,0 +1,297 @@
+"""Layered build cache for packer images.
+
+Modules are grouped into stages by the tens digit of their numeric prefix
+(00-09 base setup, 20-29 software, 30-39 drivers and toolkits, 70-79 cluster,
+90-99 finalize). Every stage but the last is built as its own packer run whose
+output is kept under layers/<key>.qcow2, a qcow2 image backed by the previous
+stage's layer. The key hashes the base image, the files every stage uploads,
+and the ordered module contents up to and including that stage, so changing a
+module invalidates its own stage and everything after it, nothing before.
+
+A build resumes from the deepest layer whose key still exists, and the last
+stage always runs to produce the raw image in output/<vm_name>/ as before.
+Layers are read-only once published: other layers use them as backing files.
+Within a layer stage every module is checkpointed (see checkpoint.py), so a
+failed stage continues from its last good module on the next run.
+
+packer.py writes a plan and runs this module as the build command:
+
+    layer_cache.py PLAN -- packer build ... -var-file=VARS .
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import checkpoint
+
+LAYER_DIR = "layers"
+STAGE_WIDTH = 10  # modules 20-29 form one stage, 30-39 the next, ...
+
+# Uploaded or seeded into every stage; a change rebuilds all layers
+COMMON_FILES = ["modules-always/header", "squid.crt", "user-data", "meta-data"]
+
+# /run/header is rebuilt on every boot, so a build that resumes from a layer
+# re-runs this module before its own stage
+BOOT_MODULE = "modules-always/01-wait-cloud-init.sh"
+
+
+def stage_of(module):
+    prefix = os.path.basename(module).split("-", 1)[0]
+    return int(prefix) // STAGE_WIDTH if prefix.isdigit() else 0
+
+
+def split_stages(modules):
+    """Group an ordered module list into [(label, [modules])]."""
+    stages = []
+    for module in modules:
+        label = f"{stage_of(module) * STAGE_WIDTH:02d}"
+        if stages and stages[-1][0] == label:
+            stages[-1][1].append(module)
+        else:
+            stages.append((label, [module]))
+    return stages
+
+
+def _hash_file(h, path):
+    h.update(os.path.basename(path).encode() + b"\0")
+    with open(path, "rb") as f:
+        h.update(hashlib.sha256(f.read()).digest())
+
+
+def layer_keys(base, stages, common_files=COMMON_FILES):
+    """Chained keys, one per stage: key(n) = H(key(n-1), modules of stage n)."""
+    h = hashlib.sha256(b"base\0" + base.encode())
+    for path in common_files:
+        _hash_file(h, path)
+    key = h.hexdigest()
+    keys = []
+    for _, modules in stages:
+        h = hashlib.sha256(key.encode())
+        for module in modules:
+            _hash_file(h, module)
+        key = h.hexdigest()
+        keys.append(key)
+    return keys
+
+
+def layer_path(key, layer_dir=LAYER_DIR):
+    return os.path.join(layer_dir, f"{key}.qcow2")
+
+
+def plan_layers(vm_name, base, modules, layer_dir=LAYER_DIR):
+    """Describe the stages of one build; see run() for how it is executed."""
+    stages = split_stages(modules)
+    keys = layer_keys(base, stages)
+    return {
+        "vm_name": vm_name,
+        "layer_dir": os.path.abspath(layer_dir),
+        "stages": [
+            {"label": label, "key": key, "modules": stage_modules}
+            for (label, stage_modules), key in zip(stages, keys)
+        ],
+    }
+
+
+def resume_point(plan):
+    """Index of the first stage to run and the layer it starts from."""
+    stages = plan["stages"]
+    # The last stage cleans the image for deployment and is never cached
+    for i in range(len(stages) - 1, 0, -1):
+        path = layer_path(stages[i - 1]["key"], plan["layer_dir"])
+        if os.path.isfile(path):
+            return i, path
+    return 0, None
+
+
+def describe(plan):
+    start, _ = resume_point(plan)
+    parts = []
+    for i, stage in enumerate(plan["stages"]):
+        mark = "cached" if i < start else "build"
+        parts.append(f"{stage['label']}:{mark}")
+    return " ".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def _stage_log(log, label):
+    root, ext = os.path.splitext(log)
+    return f"{root}.stage-{label}{ext}"
+
+
+def _run_packer(packer_args, template, var_file, variables, env, keep_on_error=True):
+    with open(var_file, "w") as f:
+        json.dump(variables, f, indent=2)
+    args = packer_args[:-1]
+    if not keep_on_error:
+        # let packer run the error-cleanup provisioner and tear down the VM
+        args = [a for a in args if not a.startswith("-on-error=")]
+    # A later -var-file overrides the build's own variables
+    cmd = args + [f"-var-file={var_file}", template]
+    try:
+        return subprocess.run(cmd, env=env, stdin=subprocess.DEVNULL).returncode
+    finally:
+        os.remove(var_file)
+
+
+def _stage_modules(modules, parent):
+    if parent is not None and BOOT_MODULE not in modules:
+        return [BOOT_MODULE] + modules
+    return modules
+
+
+def _from(parent):
+    return {"iso_url": parent, "iso_checksum": "none"} if parent else {}
+
+
+def _partial(layer_dir, key):
+    """The saved checkpoint of an unfinished stage and the modules it completed."""
+    path = os.path.join(layer_dir, f"{key}.partial.qcow2")
+    try:
+        with open(path + ".json") as f:
+            name = json.load(f)["snapshot"]
+    except (OSError, ValueError, KeyError):
+        return None, None
+    return (path, name) if os.path.isfile(path) else (None, None)
+
+
+def _discard_partial(path):
+    for p in (path, path + ".json"):
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def build_layer(plan, index, parent, packer_args, env):
+    """Build stage *index* into its layer unless another build already did.
+
+    Every module is checkpointed; if one fails, the state after the last
+    good module is kept and the next run of this stage continues from there.
+    """
+    stage = plan["stages"][index]
+    key = stage["key"]
+    layer_dir = plan["layer_dir"]
+    path = layer_path(key, layer_dir)
+    os.makedirs(layer_dir, exist_ok=True)
+    # Parallel targets often share their first stages; build each layer once
+    with open(os.path.join(layer_dir, f"{key}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isfile(path):
+            print(f"==> stage {stage['label']}: layer {key[:12]} built meanwhile")
+            return 0, path
+
+        modules = stage["modules"]
+        base = parent
+        partial, done = _partial(layer_dir, key)
+        if partial:
+            names = [checkpoint.snapshot_name(m) for m in modules]
+            if done in names[:-1]:
+                modules = modules[names.index(done) + 1:]
+                base = partial
+                print(f"==> stage {stage['label']}: resuming after "
+                      f"{done[len(checkpoint.SNAPSHOT_PREFIX):]}")
+            else:
+                _discard_partial(partial)
+                partial = None
+
+        work = os.path.join(layer_dir, f".build-{key}")
+        shutil.rmtree(work, ignore_errors=True)  # left over from an aborted run
+        disk = os.path.join(work, f"{plan['vm_name']}.qcow2")
+        saved = os.path.join(layer_dir, f"{key}.partial.qcow2.new")
+        # unix socket paths are limited to 108 bytes
+        socket_path = os.path.join(tempfile.gettempdir(), f"packer-{key[:16]}.qmp")
+        template = checkpoint.write_template(
+            os.path.join(layer_dir, f".template-{key}"),
+            _stage_modules(modules, base),
+            {"socket": socket_path, "after": modules, "partial": saved, "backing": parent},
+        )
+        variables = {
+            **_from(base),
+            "disk_format": "qcow2",
+            "use_backing_file": base is not None,
+            "output_directory": work,
+            "qmp_socket": socket_path,
+        }
+        log = _stage_log(env.get("PACKER_LOG_PATH", "packer.log"), stage["label"])
+        stage_env = {**env, "PACKER_LOG_PATH": log}
+        var_file = os.path.join(layer_dir, f".{key}.pkrvars.json")
+        print(f"==> stage {stage['label']}: building layer {key[:12]} "
+              f"({', '.join(os.path.basename(m) for m in modules)})")
+        start = time.monotonic()
+        code = _run_packer(packer_args, template, var_file, variables, stage_env,
+                           keep_on_error=False)
+        shutil.rmtree(template, ignore_errors=True)
+        if code != 0:
+            if os.path.isfile(saved):
+                os.replace(saved + ".json", os.path.join(layer_dir, f"{key}.partial.qcow2.json"))
+                os.replace(saved, os.path.join(layer_dir, f"{key}.partial.qcow2"))
+                print(f"==> stage {stage['label']}: kept checkpoint, the next run resumes from it")
+            shutil.rmtree(work, ignore_errors=True)
+            return code, None
+
+        if partial:
+            # Fold the resumed modules into the checkpoint, which is backed by parent
+            subprocess.run(["qemu-img", "commit", "-q", disk], check=True)
+            disk = partial
+            os.remove(partial + ".json")
+        checkpoint.drop_snapshots(disk)
+        os.chmod(disk, 0o444)
+        os.replace(disk, path)
+        with open(os.path.join(layer_dir, f"{key}.json"), "w") as f:
+            json.dump({
+                "vm_name": plan["vm_name"],
+                "stage": stage["label"],
+                "modules": stage["modules"],
+                "parent": parent,
+                "seconds": round(time.monotonic() - start),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            }, f, indent=2)
+        shutil.rmtree(work, ignore_errors=True)
+    return 0, path
+
+
+def run(plan, packer_args, env):
+    """Run the stages of *plan* from the deepest cached layer; returns an exit code."""
+    start, parent = resume_point(plan)
+    stages = plan["stages"]
+    if parent:
+        print(f"==> resuming from layer {stages[start - 1]['key'][:12]} "
+              f"(stages {', '.join(s['label'] for s in stages[:start])} cached)")
+
+    for index in range(start, len(stages) - 1):
+        code, parent = build_layer(plan, index, parent, packer_args, env)
+        if code != 0:
+            return code
+
+    stage = stages[-1]
+    print(f"==> stage {stage['label']}: building {plan['vm_name']}")
+    template = checkpoint.write_template(
+        os.path.join(plan["layer_dir"], f".template-{plan['vm_name']}"),
+        _stage_modules(stage["modules"], parent),
+    )
+    var_file = os.path.join(plan["layer_dir"], f".{plan['vm_name']}.final.pkrvars.json")
+    code = _run_packer(packer_args, template, var_file, _from(parent), env)
+    shutil.rmtree(template, ignore_errors=True)
+    return code
+
+
+def main():
+    """layer_cache.py PLAN -- PACKER_COMMAND..."""
+    if len(sys.argv) < 4 or sys.argv[2] != "--":
+        print("usage: layer_cache.py PLAN -- PACKER_COMMAND...", file=sys.stderr)
+        sys.exit(2)
+    with open(sys.argv[1]) as f:
+        plan = json.load(f)
+    sys.exit(run(plan, sys.argv[3:], os.environ.copy()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Per-module provisioning profiles.
+
+profile.sh wraps every module on the build VM and prints one PACKER-PROFILE
+line with its wall time, CPU time, bytes received (downloads go through the
+squid proxy) and root filesystem growth. This module collects those lines
+from a build's packer logs, prints a per-target report and appends the run to
+output/profile-history.jsonl so slow modules can be tracked across builds.
+
+Usage:
+    module_profile.py [TARGET]         # summarize the history
+"""
+
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+HISTORY_FILE = "profile-history.jsonl"
+
+_PROFILE_LINE = re.compile(r"PACKER-PROFILE (\{.*?\})\s*$")
+
+
+def build_logs(log, since):
+    """The packer log of a build and its layer stage logs written after *since*."""
+    root, ext = os.path.splitext(log)
+    paths = [log] + sorted(glob.glob(f"{root}.stage-*{ext}"))
+    return [p for p in paths if os.path.isfile(p) and os.path.getmtime(p) >= since]
+
+
+def parse_logs(paths):
+    """Module records in execution order; each line is logged more than once."""
+    records = {}
+    for path in paths:
+        with open(path, errors="replace") as f:
+            for line in f:
+                m = _PROFILE_LINE.search(line)
+                if not m:
+                    continue
+                try:
+                    record = json.loads(m.group(1))
+                except ValueError:
+                    continue
+                records[(record["module"], record["start"])] = record
+    return sorted(records.values(), key=lambda r: r["start"])
+
+
+def _fmt_bytes(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(n) < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def _fmt_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m{seconds:02d}s"
+
+
+def print_report(target, records):
+    total = sum(r["seconds"] for r in records) or 1
+    print()
+    print(f"profile of {target}:")
+    print(f"  {'MODULE':28s} {'TIME':>7s} {'SHARE':>6s} {'CPU':>7s} {'DOWNLOAD':>10s} {'DISK':>10s}")
+    for r in sorted(records, key=lambda r: -r["seconds"]):
+        flag = "" if r["exit"] == 0 else f"  exit {r['exit']}"
+        print(
+            f"  {r['module']:28s} {_fmt_seconds(r['seconds']):>7s} "
+            f"{r['seconds'] / total:6.0%} {_fmt_seconds(r['cpu_seconds']):>7s} "
+            f"{_fmt_bytes(r['rx_bytes']):>10s} {_fmt_bytes(r['disk_bytes']):>10s}{flag}"
+        )
+    print(f"  {'total':28s} {_fmt_seconds(total):>7s}")
+
+
+def append_history(path, target, records, commit=None):
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": target,
+        "commit": commit,
+        "modules": records,
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def load_history(path, target=None):
+    runs = []
+    try:
+        with open(path) as f:
+            for line in f:
+                run = json.loads(line)
+                if target is None or run["target"] == target:
+                    runs.append(run)
+    except FileNotFoundError:
+        pass
+    return runs
+
+
+def print_history(runs):
+    """Median and latest wall time per module across *runs*."""
+    times = {}
+    for run in runs:
+        for r in run["modules"]:
+            times.setdefault(r["module"], []).append(r["seconds"])
+    print(f"{'MODULE':28s} {'RUNS':>5s} {'MEDIAN':>8s} {'LATEST':>8s} {'MAX':>8s}")
+    for module, series in sorted(times.items(), key=lambda kv: -sorted(kv[1])[len(kv[1]) // 2]):
+        median = sorted(series)[len(series) // 2]
+        print(f"{module:28s} {len(series):5d} {_fmt_seconds(median):>8s} "
+              f"{_fmt_seconds(series[-1]):>8s} {_fmt_seconds(max(series)):>8s}")
+
+
+def main():
+    """module_profile.py [TARGET]"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output", HISTORY_FILE)
+    target = sys.argv[1] if len(sys.argv) > 1 else None
+    runs = load_history(path, target)
+    if not runs:
+        print(f"no profiles in {path}", file=sys.stderr)
+        sys.exit(1)
+    print_history(runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 
 import argparse
+import hashlib
 import json
 import os
 import platform
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 import yaml
 
+import checkpoint
+import image_cache
+import image_manifest
+import layer_cache
+import module_profile
+import upload
+
 CONFIG_PATH = "config.yaml"
 MODULES_ALWAYS = "modules-always"
 MODULES_DEPRECATED = "modules-deprecated"
@@ -45,6 +56,22 @@ FIRMWARE_PATHS = {
     ),
 }
 
+# VM size, keep in sync with cpus/memory in sources.pkr.hcl
+VM_CPUS = 8
+VM_MEMORY_MB = 16384
+
+# Parallel builds: each concurrent build gets its own VNC/SSH port window so
+# that packer's free-port probing in one build never races another.
+VNC_PORT_BASE = 5900
+SSH_PORT_BASE = 2222
+PORT_WINDOW = 10
+
+# Host memory kept free for the OS and page cache while building
+HOST_RESERVED_MB = 2048
+
+# How long a successful base image URL probe is trusted
+URL_CHECK_TTL = 24 * 3600
+
 # platform.machine() returns "x86_64" on Linux, normalize to Go-style
 GOARCH_MAP = {
     "x86_64": "amd64",
@@ -71,6 +98,10 @@ def get_base_image(entry):
     return iso_url, iso_checksum
 
 
+class ConfigError(Exception):
+    """A config.yaml entry cannot be built on this host."""
+
+
 def gather_modules(entry):
     modules = []
 
@@ -83,14 +114,9 @@ def gather_modules(entry):
     for m in entry.get("modules", []):
         path = f"{MODULES_OPTIONAL}/{m}.sh"
         if not os.path.isfile(path):
-            print(f"error: optional module not found: {m}.sh", file=sys.stderr)
-            sys.exit(1)
+            raise ConfigError(f"optional module not found: {m}.sh")
         if os.path.isfile(f"{MODULES_DEPRECATED}/{m}.sh"):
-            print(
-                f'error: module "{m}" is deprecated and cannot be selected',
-                file=sys.stderr,
-            )
-            sys.exit(1)
+            raise ConfigError(f'module "{m}" is deprecated and cannot be selected')
         modules.append(path)
 
     # Sort all modules together by filename for correct execution order
@@ -99,34 +125,32 @@ def gather_modules(entry):
     return modules
 
 
-def resolve_variables(entry):
+def host_facts():
     host_os = platform.system().lower()
     host_arch = GOARCH_MAP.get(platform.machine(), platform.machine())
+    return host_os, host_arch, os.path.exists("/dev/kvm")
+
+
+def resolve_variables(entry, host=None):
+    host_os, host_arch, has_kvm = host or host_facts()
 
     arch = entry.get("arch")
     if not arch:
-        print(f'error: "{entry["name"]}" missing arch', file=sys.stderr)
-        sys.exit(1)
+        raise ConfigError("missing arch")
+    if arch not in QEMU_ARCH:
+        raise ConfigError(f"unknown arch {arch}, expected one of {', '.join(QEMU_ARCH)}")
 
     # macOS only supports arm64
     if host_os == "darwin" and arch != "arm64":
-        print(
-            f"error: macOS only supports arm64 targets, got {arch}",
-            file=sys.stderr,
-        )
-        sys.exit(1)
+        raise ConfigError(f"macOS only supports arm64 targets, got {arch}")
 
     # Accelerator
-    if host_os == "linux" and host_arch == arch and os.path.exists("/dev/kvm"):
+    if host_os == "linux" and host_arch == arch and has_kvm:
         accelerator = "kvm"
     elif host_os == "darwin" and host_arch == arch:
         accelerator = "hvf"
     else:
         accelerator = "tcg"
-        print(
-            "warning: accelerator not found, build will use TCG emulation (slow)",
-            file=sys.stderr,
-        )
 
     # CPU model
     cpu_model = "host" if accelerator != "tcg" else "max"
@@ -138,12 +162,11 @@ def resolve_variables(entry):
     # EFI firmware
     firmware_key = (host_os, arch)
     if firmware_key not in FIRMWARE_PATHS:
-        print(
-            f"error: no firmware path defined for {host_os}/{arch}",
-            file=sys.stderr,
-        )
-        sys.exit(1)
+        raise ConfigError(f"no firmware path defined for {host_os}/{arch}")
     efi_firmware_code, efi_firmware_vars = FIRMWARE_PATHS[firmware_key]
+    for path in (efi_firmware_code, efi_firmware_vars):
+        if not os.path.isfile(path):
+            raise ConfigError(f"firmware not installed: {path}")
 
     return {
         "qemu_binary": qemu_binary,
@@ -155,37 +178,137 @@ def resolve_variables(entry):
     }
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("target")
-    parser.add_argument("--debug", action="store_true")
-    parser.add_argument(
-        "--iso-url",
-        help="Override the base image URL from config.yaml",
-    )
-    parser.add_argument(
-        "--iso-checksum",
-        help="Override the base image checksum from config.yaml",
-    )
-    args = parser.parse_args()
+# ---------------------------------------------------------------------------
+# Preflight
+# ---------------------------------------------------------------------------
 
-    target = args.target
-    debug = args.debug
-    config = load_config()
-    entry = find_entry(config, target)
-
-    if entry is None:
-        available = [e["name"] for e in config if "name" in e]
-        print(f'error: unknown target "{target}"', file=sys.stderr)
-        print("available targets:", file=sys.stderr)
-        for name in available:
-            print(f"  {name}", file=sys.stderr)
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(path, data):
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _entry_key(entry, host):
+    """Everything the resolved variables of *entry* depend on."""
+    firmware = FIRMWARE_PATHS.get((host[0], entry.get("arch")), ())
+    state = {
+        "entry": entry,
+        "host": host,
+        "firmware": [os.path.isfile(p) for p in firmware],
+        "modules": {d: sorted(os.listdir(d))
+                    for d in (MODULES_ALWAYS, MODULES_OPTIONAL, MODULES_DEPRECATED)},
+    }
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+
+def check_urls(urls, cache_path):
+    """Probe base image and checksum URLs, remembering recent successes.
+
+    Returns {url: error} for the URLs that could not be reached.
+    """
+    cache = _load_json(cache_path)
+    now = time.time()
+    todo = sorted(u for u in urls if now - cache.get(u, 0) > URL_CHECK_TTL)
+    if not todo:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(16, len(todo))) as pool:
+        results = dict(zip(todo, pool.map(image_cache.probe, todo)))
+    cache.update({u: now for u, error in results.items() if error is None})
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    _save_json(cache_path, cache)
+    return {u: error for u, error in results.items() if error is not None}
+
+
+def preflight(config, targets, base_images, cache_dir):
+    """Validate every config entry at once before any build starts.
+
+    Problems in *targets* are fatal; problems in other entries are reported
+    so they are fixed before someone builds them. *base_images* maps targets
+    to their (iso_url, iso_checksum) whose reachability should be checked.
+    Resolved modules and variables are cached per entry under *cache_dir*.
+    Returns {target: {"modules": [...], "variables": {...}}}.
+    """
+    start = time.monotonic()
+    host = host_facts()
+    cache_path = os.path.join(cache_dir, ".preflight.json")
+    cache = _load_json(cache_path)
+    errors, warnings, resolved = [], [], {}
+
+    names = [e.get("name") for e in config]
+    for name in sorted({n for n in names if names.count(n) > 1}):
+        errors.append(f"{name}: defined more than once")
+
+    for entry in config:
+        name = entry.get("name")
+        if not name:
+            errors.append(f"entry without a name: {entry}")
+            continue
+        key = _entry_key(entry, host)
+        cached = cache.get(name)
+        if cached and cached["key"] == key:
+            resolved[name] = cached
+            continue
+        try:
+            resolved[name] = cache[name] = {
+                "key": key,
+                "modules": gather_modules(entry),
+                "variables": resolve_variables(entry, host),
+            }
+        except ConfigError as e:
+            if name in targets:
+                errors.append(f"{name}: {e}")
+            else:
+                warnings.append(f"{name}: {e} (not selected)")
+    cache = {name: cache[name] for name in resolved}
+    _save_json(cache_path, cache)
+
+    for target in targets:
+        r = resolved.get(target)
+        if r and r["variables"]["accelerator"] == "tcg":
+            warnings.append(f"{target}: no hardware accelerator, build will use TCG emulation (slow)")
+
+    # Images already in the download store need no network access at all
+    urls = set()
+    for url, checksum in base_images.values():
+        if urlparse(url).scheme not in ("http", "https") or image_cache.cached(url, checksum):
+            continue
+        urls.add(url)
+        if checksum.startswith("file:"):
+            urls.add(checksum[len("file:"):])
+    unreachable = check_urls(urls, os.path.join(image_cache.STORE_DIR, "urls.json"))
+    for target, (url, checksum) in base_images.items():
+        for u in (url, checksum[len("file:"):] if checksum.startswith("file:") else None):
+            if u in unreachable:
+                errors.append(f"{target}: cannot reach {u}: {unreachable[u]}")
+
+    for message in warnings:
+        print(f"warning: {message}", file=sys.stderr)
+    for message in errors:
+        print(f"error: {message}", file=sys.stderr)
+    if errors:
         sys.exit(1)
+    print(
+        f"preflight: checked {len(config)} entries and {len(urls)} URL(s) "
+        f"in {(time.monotonic() - start) * 1000:.0f} ms"
+    )
+    return resolved
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(script_dir, "output")
-    os.makedirs(output_dir, exist_ok=True)
 
+def prepare_build(entry, target, args, output_dir, checked):
+    """Build description for one target from its preflight result.
+
+    Returns None when the target is skipped.
+    """
+    debug = args.debug
     if debug:
         iso_url = os.path.join(output_dir, target, f"{target}.raw")
         if not os.path.isfile(iso_url):
@@ -203,18 +326,17 @@ def main():
 
         if not iso_url:
             print(f'skipping "{target}": missing iso_url', file=sys.stderr)
-            sys.exit(0)
+            return None
 
         if not iso_checksum:
             print(f'skipping "{target}": missing iso_checksum', file=sys.stderr)
-            sys.exit(0)
+            return None
 
         vm_name = target
-        modules = gather_modules(entry)
+        modules = checked["modules"]
 
-    resolved = resolve_variables(entry)
+    resolved = checked["variables"]
 
-    var_file = os.path.join(output_dir, f".{vm_name}.auto.pkrvars.json")
     variables = {
         **resolved,
         "vm_name": vm_name,
@@ -222,8 +344,6 @@ def main():
         "iso_checksum": iso_checksum,
         "modules": modules,
     }
-    with open(var_file, "w") as f:
-        json.dump(variables, f, indent=2)
 
     env = os.environ.copy()
     env["PACKER_LOG"] = "1"
@@ -233,8 +353,366 @@ def main():
     cmd = ["packer", "build", "-only=" + build_target]
     if not debug:
         cmd.append("-on-error=abort")
-    cmd += [f"-var-file={var_file}", "."]
-    sys.exit(subprocess.run(cmd, env=env).returncode)
+
+    if modules and not args.no_layer_cache:
+        # Identify the base image by what config.yaml pins, before
+        # localize_base_images() swaps in a local path
+        plan = layer_cache.plan_layers(vm_name, f"{iso_url} {iso_checksum}", modules)
+        plan_file = os.path.join(output_dir, f".{vm_name}.layers.json")
+        with open(plan_file, "w") as f:
+            json.dump(plan, f, indent=2)
+        print(f"{target}: layers {layer_cache.describe(plan)}")
+        runner = os.path.join(os.path.dirname(os.path.abspath(__file__)), "layer_cache.py")
+        cmd = [sys.executable, runner, plan_file, "--"] + cmd
+        template = "."  # replaced per stage by the runner
+    elif modules:
+        template = checkpoint.write_template(os.path.join(output_dir, f".{vm_name}.pkr"), modules)
+    else:
+        template = "."
+
+    return {
+        "target": target,
+        "vm_name": vm_name,
+        "variables": variables,
+        "var_file": os.path.join(output_dir, f".{vm_name}.auto.pkrvars.json"),
+        "cmd": cmd,
+        "template": template,
+        "env": env,
+        "log": env["PACKER_LOG_PATH"],
+        "image": os.path.join(output_dir, vm_name, f"{vm_name}.raw"),
+    }
+
+
+def write_var_file(build, extra=None):
+    with open(build["var_file"], "w") as f:
+        json.dump({**build["variables"], **(extra or {})}, f, indent=2)
+    return build["cmd"] + [f"-var-file={build['var_file']}", build["template"]]
+
+
+def localize_base_images(builds):
+    """Point builds at verified copies in the shared download/ store.
+
+    Each distinct (iso_url, iso_checksum) is downloaded once for all targets.
+    The store only holds files whose checksum matched, so packer is told to
+    skip its own (full re-read) verification.
+    """
+    pairs = {}
+    for build in builds:
+        v = build["variables"]
+        if urlparse(v["iso_url"]).scheme in ("http", "https") and v["iso_checksum"] != "none":
+            pairs[build["target"]] = (v["iso_url"], v["iso_checksum"])
+    if not pairs:
+        return
+    print(f"resolving {len(set(pairs.values()))} base image(s) in {image_cache.STORE_DIR}/")
+    try:
+        local = image_cache.localize(pairs.values())
+    except (image_cache.ChecksumError, OSError) as e:
+        print(f"error: base image download failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    for build in builds:
+        pair = pairs.get(build["target"])
+        if pair:
+            build["variables"]["iso_url"] = local[pair]
+            build["variables"]["iso_checksum"] = "none"
+
+
+def report_profile(build):
+    """Print where a build spent its time and add it to the profile history."""
+    logs = module_profile.build_logs(build["log"], build["started"])
+    records = module_profile.parse_logs(logs)
+    if not records:
+        return
+    module_profile.print_report(build["target"], records)
+    output_dir = os.path.dirname(build["log"])
+    with open(os.path.join(output_dir, f"{build['vm_name']}.profile.json"), "w") as f:
+        json.dump(records, f, indent=2)
+    try:
+        commit = upload.default_prefix()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    module_profile.append_history(
+        os.path.join(output_dir, module_profile.HISTORY_FILE), build["target"], records, commit
+    )
+
+
+def finish_build(build, prefix=None):
+    """Write the block manifest of a finished image and optionally upload it.
+
+    The raw image goes up sparsely with its block map; its blocks also go to
+    the content-addressed store so nodes can fetch only what changed.
+    """
+    image = build["image"]
+    manifest = image_manifest.create(image)
+    image_manifest.save(manifest, image_manifest.manifest_path(image))
+    if prefix is None:
+        return True
+    key = f"{prefix}/{os.path.basename(image)}"
+    client = upload.S3Client()
+    try:
+        blockmap = upload.upload_image(client, image, key)
+        image_manifest.push(client, image, manifest, key=key)
+    except (upload.S3Error, OSError) as e:
+        print(f"error: upload of {build['target']} failed: {e}", file=sys.stderr)
+        return False
+    with open(f"{image}.blockmap.json", "w") as f:
+        json.dump(blockmap, f, indent=2)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Parallel builds
+# ---------------------------------------------------------------------------
+
+def host_resources():
+    """Cores and MiB of memory available for build VMs."""
+    cores = os.cpu_count() or 1
+    memory_mb = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    memory_mb = int(line.split()[1]) // 1024
+                    break
+    except OSError:
+        pass
+    if memory_mb is None:
+        memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1 << 20)
+    return cores, max(memory_mb - HOST_RESERVED_MB, 0)
+
+
+def build_cost(build):
+    """(cores, MiB) a build occupies on the host.
+
+    TCG runs one busy host thread per vCPU for the whole build, while KVM/HVF
+    guests mostly wait on downloads and package installs.
+    """
+    if build["variables"]["accelerator"] == "tcg":
+        cores = VM_CPUS
+    else:
+        cores = max(VM_CPUS // 2, 1)
+    return cores, VM_MEMORY_MB
+
+
+def run_parallel(builds, jobs=None):
+    """Run builds concurrently within the host's cores and memory.
+
+    A build that is larger than the whole budget still runs, alone. Returns
+    one status dict per build, in input order.
+    """
+    total_cores, total_mem = host_resources()
+    max_jobs = jobs or len(builds)
+    print(
+        f"scheduling {len(builds)} build(s): {total_cores} cores, "
+        f"{total_mem} MiB available, at most {max_jobs} at a time"
+    )
+
+    pending = list(builds)
+    running = {}  # slot -> (build, process, stdout file, start time)
+    status = {b["target"]: {"target": b["target"], "result": "pending"} for b in builds}
+    used_cores = used_mem = 0
+
+    while pending or running:
+        # Start every pending build that fits, in config order
+        for build in list(pending):
+            cores, mem = build_cost(build)
+            fits = used_cores + cores <= total_cores and used_mem + mem <= total_mem
+            if len(running) >= max_jobs or (running and not fits):
+                continue
+            slot = min(set(range(max_jobs)) - set(running))
+            vnc = VNC_PORT_BASE + slot * PORT_WINDOW
+            ssh = SSH_PORT_BASE + slot * PORT_WINDOW
+            cmd = write_var_file(build, {
+                "vnc_port_min": vnc,
+                "vnc_port_max": vnc + PORT_WINDOW - 1,
+                "ssh_port_min": ssh,
+                "ssh_port_max": ssh + PORT_WINDOW - 1,
+            })
+            out_path = os.path.join(os.path.dirname(build["log"]), f"{build['vm_name']}.out")
+            out = open(out_path, "w")
+            proc = subprocess.Popen(
+                cmd, env=build["env"], stdout=out, stderr=subprocess.STDOUT,
+                stdin=subprocess.DEVNULL,
+            )
+            build["started"] = time.time()
+            running[slot] = (build, proc, out, time.monotonic())
+            pending.remove(build)
+            used_cores += cores
+            used_mem += mem
+            status[build["target"]].update(result="running", output=out_path)
+            print(
+                f"started {build['target']} ({build['variables']['accelerator']}, "
+                f"vnc {vnc}-{vnc + PORT_WINDOW - 1}, ssh {ssh}-{ssh + PORT_WINDOW - 1})"
+            )
+
+        time.sleep(1)
+
+        for slot, (build, proc, out, started) in list(running.items()):
+            code = proc.poll()
+            if code is None:
+                continue
+            out.close()
+            del running[slot]
+            cores, mem = build_cost(build)
+            used_cores -= cores
+            used_mem -= mem
+            st = status[build["target"]]
+            st.update(
+                result="ok" if code == 0 else "failed",
+                code=code,
+                seconds=time.monotonic() - started,
+            )
+            print(f"finished {build['target']}: {st['result']} ({format_duration(st['seconds'])})")
+
+    return [status[b["target"]] for b in builds]
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def print_status(results, builds_by_target):
+    print()
+    print(f"{'TARGET':28s} {'ARCH':8s} {'ACCEL':5s} {'RESULT':8s} {'TIME':>10s}  OUTPUT")
+    for st in results:
+        build = builds_by_target.get(st["target"])
+        arch = accel = "-"
+        if build:
+            accel = build["variables"]["accelerator"]
+            arch = build["arch"]
+        duration = format_duration(st["seconds"]) if "seconds" in st else "-"
+        print(
+            f"{st['target']:28s} {arch:8s} {accel:5s} {st['result']:8s} "
+            f"{duration:>10s}  {st.get('output', '')}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("targets", nargs="*", metavar="target")
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Build every target in config.yaml",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Maximum concurrent builds (default: as many as cores and memory allow)",
+    )
+    parser.add_argument("--debug", action="store_true")
+    parser.add_argument(
+        "--no-download-cache",
+        action="store_true",
+        help="Let packer download base images itself instead of using download/",
+    )
+    parser.add_argument(
+        "--no-layer-cache",
+        action="store_true",
+        help="Run every module in one packer build instead of resuming from layers/ "
+        "(use when layers/ does not persist between builds, e.g. in CI)",
+    )
+    parser.add_argument(
+        "--upload",
+        action="store_true",
+        help="Upload each successfully built image to the packer-images bucket",
+    )
+    parser.add_argument(
+        "--upload-prefix",
+        help="Object key prefix for --upload (default: short git commit)",
+    )
+    parser.add_argument(
+        "--iso-url",
+        help="Override the base image URL from config.yaml",
+    )
+    parser.add_argument(
+        "--iso-checksum",
+        help="Override the base image checksum from config.yaml",
+    )
+    args = parser.parse_args()
+
+    config = load_config()
+    available = [e["name"] for e in config if "name" in e]
+    targets = available if args.all else args.targets
+    if not targets:
+        parser.error("specify a target or --all")
+    if len(targets) > 1 and (args.debug or args.iso_url or args.iso_checksum):
+        parser.error("--debug, --iso-url and --iso-checksum take a single target")
+    if args.upload and args.debug:
+        parser.error("--upload cannot be used with --debug")
+    prefix = None
+    if args.upload:
+        # Fail before spending an hour building
+        upload.check_credentials()
+        prefix = args.upload_prefix or upload.default_prefix()
+
+    entries = []
+    for target in targets:
+        entry = find_entry(config, target)
+        if entry is None:
+            print(f'error: unknown target "{target}"', file=sys.stderr)
+            print("available targets:", file=sys.stderr)
+            for name in available:
+                print(f"  {name}", file=sys.stderr)
+            sys.exit(1)
+        entries.append(entry)
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    output_dir = os.path.join(script_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    base_images = {}
+    if not args.debug:
+        for entry, target in zip(entries, targets):
+            iso_url, iso_checksum = get_base_image(entry)
+            iso_url = args.iso_url or iso_url
+            iso_checksum = args.iso_checksum or iso_checksum
+            if iso_url and iso_checksum:
+                base_images[target] = (iso_url, iso_checksum)
+    checked = preflight(config, targets, base_images, output_dir)
+
+    if len(entries) == 1:
+        build = prepare_build(entries[0], targets[0], args, output_dir, checked[targets[0]])
+        if build is None:
+            sys.exit(0)
+        if not args.no_download_cache:
+            localize_base_images([build])
+        cmd = write_var_file(build)
+        build["started"] = time.time()
+        code = subprocess.run(cmd, env=build["env"]).returncode
+        if not args.debug:
+            report_profile(build)
+        if code == 0 and not args.debug and not finish_build(build, prefix):
+            code = 1
+        sys.exit(code)
+
+    # Validate and prepare every target before starting any build
+    builds = []
+    skipped = []
+    for entry, target in zip(entries, targets):
+        build = prepare_build(entry, target, args, output_dir, checked[target])
+        if build is None:
+            skipped.append({"target": target, "result": "skipped"})
+            continue
+        build["arch"] = entry["arch"]
+        builds.append(build)
+
+    if not args.no_download_cache:
+        localize_base_images(builds)
+
+    results = run_parallel(builds, args.jobs) if builds else []
+    builds_by_target = {b["target"]: b for b in builds}
+    for st in results:
+        if "seconds" in st:
+            report_profile(builds_by_target[st["target"]])
+        if st["result"] == "ok" and not finish_build(builds_by_target[st["target"]], prefix):
+            st["result"] = "failed"
+    order = {t: i for i, t in enumerate(targets)}
+    results = sorted(results + skipped, key=lambda st: order[st["target"]])
+    print_status(results, builds_by_target)
+    sys.exit(1 if any(st["result"] == "failed" for st in results) else 0)
 
 
 if __name__ == "__main__":
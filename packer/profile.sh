@@ -0,0 +1,36 @@
+#!/usr/bin/env bash
+# Run one provisioning module and report what it cost.
+# Installed as each module's shell provisioner execute_command, with the module
+# name as second argument; packer.py collects the PACKER-PROFILE lines from the
+# packer log.
+
+script="$1"
+module="${2:-$(basename "$script")}"
+
+# Downloads all go through the squid proxy, so received bytes approximate them
+rx_bytes() {
+    cat /sys/class/net/*/statistics/rx_bytes 2>/dev/null | awk '{ s += $1 } END { print s + 0 }'
+}
+disk_used() {
+    df --output=used -B1 / | tail -n 1 | tr -d ' '
+}
+
+start=$(date +%s.%N)
+rx_start=$(rx_bytes)
+disk_start=$(disk_used)
+
+code=0
+"$script" || code=$?
+
+end=$(date +%s.%N)
+rx_end=$(rx_bytes)
+disk_end=$(disk_used)
+# utime/stime of reaped children of this shell, in clock ticks
+read -r cutime cstime < <(awk '{ print $16, $17 }' /proc/$$/stat)
+
+awk -v m="$module" -v c="$code" -v s="$start" -v e="$end" \
+    -v cpu="$((cutime + cstime))" -v hz="$(getconf CLK_TCK)" \
+    -v rx="$((rx_end - rx_start))" -v disk="$((disk_end - disk_start))" \
+    'BEGIN { printf "PACKER-PROFILE {\"module\":\"%s\",\"exit\":%d,\"start\":%.3f,\"seconds\":%.3f,\"cpu_seconds\":%.2f,\"rx_bytes\":%d,\"disk_bytes\":%d}\n", m, c, s, e - s, cpu / hz, rx, disk }'
+
+exit "$code"
@@ -26,9 +26,14 @@ source "qemu" "packer" {
   disk_size        = "100G"
   iso_url          = var.iso_url
   iso_checksum     = var.iso_checksum
-  format           = "raw"
-  output_directory = "output/${var.vm_name}"
-  vm_name          = "${var.vm_name}.raw"
+  format           = var.disk_format
+  use_backing_file = var.use_backing_file
+  # compaction would flatten a layer into a standalone copy of its backing chain
+  skip_compaction  = var.use_backing_file
+  output_directory = local.output_directory
+  qmp_enable       = var.qmp_socket != ""
+  qmp_socket_path  = var.qmp_socket
+  vm_name          = "${var.vm_name}.${var.disk_format}"
 
   # Boot configuration
   efi_boot          = true
@@ -44,6 +49,10 @@ source "qemu" "packer" {
   net_device     = "virtio-net"
   disk_interface = "virtio"
   headless       = true
+  vnc_port_min   = var.vnc_port_min
+  vnc_port_max   = var.vnc_port_max
+  host_port_min  = var.ssh_port_min
+  host_port_max  = var.ssh_port_max
 
   # SSH Configuration
   ssh_username = "root"
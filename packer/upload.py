@@ -0,0 +1,353 @@
+"""Sparse-aware multipart upload of built images to the radosgw bucket.
+
+The raw images are 100G virtual disks that are mostly holes. Data extents are
+found with SEEK_DATA/SEEK_HOLE; parts containing data are uploaded straight
+from an mmap of the image (no copies in process memory), and parts that are
+entirely holes are filled server-side with UploadPartCopy from a shared zero
+object, so only real data crosses the network. The object stays a plain raw
+image for Ironic; <key>.blockmap.json next to it records where the data is.
+
+Requests are signed with AWS Signature Version 4; credentials come from
+AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY as in upload.sh.
+
+Usage:
+    upload.py output/<vm>/<vm>.raw [s3_prefix]
+"""
+
+import bisect
+import errno
+import hashlib
+import hmac
+import http.client
+import json
+import mmap
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+BUCKET_NAME = "packer-images"
+BUCKET_HOST = "radosgw.clusters.zjusct.io"
+ENDPOINT = os.environ.get("S3_ENDPOINT", f"https://{BUCKET_HOST}")
+REGION = os.environ.get("AWS_REGION", "us-east-1")
+
+PART_SIZE = 64 << 20
+MIN_PART_SIZE = 5 << 20  # S3 minimum for every part but the last
+MAX_PARTS = 10000
+ZERO_PREFIX = ".zero"
+WORKERS = 8
+RETRIES = 3
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+class S3Error(Exception):
+    """An S3 request failed."""
+
+
+# ---------------------------------------------------------------------------
+# S3 client
+# ---------------------------------------------------------------------------
+
+def _quote(s, safe="-_.~"):
+    return urllib.parse.quote(s, safe=safe)
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+class S3Client:
+    """Minimal path-style S3 client; one keep-alive connection per thread."""
+
+    def __init__(self, endpoint=ENDPOINT, bucket=BUCKET_NAME, access_key=None,
+                 secret_key=None, region=REGION, timeout=300):
+        url = urllib.parse.urlparse(endpoint)
+        self.scheme = url.scheme
+        self.host = url.netloc
+        self.bucket = bucket
+        self.access_key = access_key or os.environ["AWS_ACCESS_KEY_ID"]
+        self.secret_key = secret_key or os.environ["AWS_SECRET_ACCESS_KEY"]
+        self.region = region
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, timeout=self.timeout)
+        return conn
+
+    def _sign(self, method, path, query, headers, payload_hash):
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date = amz_date[:8]
+        headers = {**headers, "host": self.host, "x-amz-date": amz_date,
+                   "x-amz-content-sha256": payload_hash}
+        names = sorted(k.lower() for k in headers)
+        lower = {k.lower(): str(v).strip() for k, v in headers.items()}
+        canonical = "\n".join([
+            method,
+            _quote(path, safe="/-_.~"),
+            "&".join(f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items())),
+            "".join(f"{k}:{lower[k]}\n" for k in names),
+            ";".join(names),
+            payload_hash,
+        ])
+        scope = f"{date}/{self.region}/s3/aws4_request"
+        to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope,
+            hashlib.sha256(canonical.encode()).hexdigest(),
+        ])
+        key = _hmac(_hmac(_hmac(_hmac(("AWS4" + self.secret_key).encode(), date),
+                                self.region), "s3"), "aws4_request")
+        signature = hmac.new(key, to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={';'.join(names)}, Signature={signature}"
+        )
+        return headers
+
+    def request(self, method, key, query=None, headers=None, body=b"", payload_hash=None):
+        """Send one signed request; returns (status, headers, body bytes)."""
+        query = query or {}
+        path = f"/{self.bucket}/{key}" if key else f"/{self.bucket}"
+        if payload_hash is None:
+            payload_hash = hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256
+        url = _quote(path, safe="/-_.~")
+        if query:
+            url += "?" + "&".join(f"{_quote(k)}={_quote(v)}" if v != "" else _quote(k)
+                                  for k, v in sorted(query.items()))
+        for attempt in range(RETRIES):
+            signed = self._sign(method, path, query, headers or {}, payload_hash)
+            signed["Content-Length"] = str(len(body))
+            conn = self._conn()
+            try:
+                conn.request(method, url, body=body, headers=signed)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._local.conn = None
+                if attempt == RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            if resp.status >= 500 and attempt < RETRIES - 1:
+                time.sleep(2 ** attempt)
+                continue
+            if resp.status >= 300 and not (method == "HEAD" and resp.status == 404):
+                code = re.search(rb"<Code>(.*?)</Code>", data)
+                raise S3Error(f"{method} {path}: HTTP {resp.status}"
+                              + (f" {code.group(1).decode()}" if code else ""))
+            return resp.status, resp.headers, data
+        raise RuntimeError("unreachable")
+
+    def exists(self, key):
+        return self.request("HEAD", key)[0] == 200
+
+    def put_object(self, key, body, content_type="application/octet-stream"):
+        self.request("PUT", key, headers={"Content-Type": content_type}, body=body)
+
+    def create_multipart(self, key):
+        _, _, data = self.request("POST", key, {"uploads": ""})
+        return re.search(rb"<UploadId>(.*?)</UploadId>", data).group(1).decode()
+
+    def upload_part(self, key, upload_id, number, body, sha256):
+        _, headers, _ = self.request("PUT", key, {"partNumber": str(number), "uploadId": upload_id},
+                                     body=body, payload_hash=sha256)
+        return headers["ETag"]
+
+    def upload_part_copy(self, key, upload_id, number, source, length):
+        _, _, data = self.request("PUT", key, {"partNumber": str(number), "uploadId": upload_id},
+                                  headers={
+                                      "x-amz-copy-source": f"/{self.bucket}/{source}",
+                                      "x-amz-copy-source-range": f"bytes=0-{length - 1}",
+                                  })
+        return re.search(rb"<ETag>(.*?)</ETag>", data).group(1).decode().replace("&quot;", '"')
+
+    def complete_multipart(self, key, upload_id, etags):
+        body = "<CompleteMultipartUpload>" + "".join(
+            f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>"
+            for n, etag in sorted(etags.items())
+        ) + "</CompleteMultipartUpload>"
+        self.request("POST", key, {"uploadId": upload_id}, body=body.encode())
+
+    def abort_multipart(self, key, upload_id):
+        self.request("DELETE", key, {"uploadId": upload_id})
+
+
+# ---------------------------------------------------------------------------
+# Sparse files
+# ---------------------------------------------------------------------------
+
+def data_extents(fd, size):
+    """[(offset, length)] of the allocated regions of *fd*.
+
+    Falls back to a single extent when the filesystem cannot report holes.
+    """
+    extents = []
+    offset = 0
+    try:
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:  # only a hole up to EOF remains
+                    break
+                raise
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+            extents.append((start, end - start))
+            offset = end
+    except (AttributeError, OSError) as e:
+        if isinstance(e, OSError) and e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+        return [(0, size)] if size else []
+    return extents
+
+
+def overlaps(extents, starts, offset, length):
+    """Whether [offset, offset+length) touches any extent; *starts* is the sorted offsets."""
+    i = bisect.bisect_right(starts, offset) - 1
+    if i >= 0 and extents[i][0] + extents[i][1] > offset:
+        return True
+    return i + 1 < len(extents) and extents[i + 1][0] < offset + length
+
+
+def part_size_for(size, part_size=PART_SIZE):
+    while size > part_size * MAX_PARTS:
+        part_size *= 2
+    return max(part_size, MIN_PART_SIZE)
+
+
+# ---------------------------------------------------------------------------
+# Upload
+# ---------------------------------------------------------------------------
+
+def _fmt_mib(n):
+    return f"{n / (1 << 20):.0f} MiB"
+
+
+def ensure_zero_object(client, length):
+    """Key of a server-side object of *length* zero bytes, creating it once."""
+    key = f"{ZERO_PREFIX}/{length}"
+    if not client.exists(key):
+        client.put_object(key, bytes(length))
+    return key
+
+
+def upload_image(client, path, key, workers=WORKERS, part_size=PART_SIZE, log=print):
+    """Upload *path* to *key*, skipping holes; returns the block map."""
+    size = os.path.getsize(path)
+    part_size = part_size_for(size, part_size)
+    with open(path, "rb") as f:
+        extents = data_extents(f.fileno(), size)
+        starts = [e[0] for e in extents]
+        data_bytes = sum(e[1] for e in extents)
+        parts = [
+            {"number": i + 1, "offset": off, "length": min(part_size, size - off)}
+            for i, off in enumerate(range(0, size, part_size))
+        ]
+        for p in parts:
+            p["zero"] = not overlaps(extents, starts, p["offset"], p["length"])
+        zero_parts = [p for p in parts if p["zero"]]
+        log(f"uploading {path} to s3://{client.bucket}/{key}: {_fmt_mib(size)} virtual, "
+            f"{_fmt_mib(data_bytes)} data, {len(parts)} parts of {_fmt_mib(part_size)} "
+            f"({len(zero_parts)} holes copied server-side)")
+
+        # One full-size zero object also serves a short tail via the copy range
+        zero_key = ensure_zero_object(client, part_size) if zero_parts else None
+
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        view = memoryview(mm) if mm is not None else None
+        upload_id = client.create_multipart(key)
+        etags = {}
+        start = time.monotonic()
+        try:
+            def _upload(p):
+                if p["zero"]:
+                    return client.upload_part_copy(key, upload_id, p["number"],
+                                                   zero_key, p["length"])
+                body = view[p["offset"]:p["offset"] + p["length"]]
+                p["sha256"] = hashlib.sha256(body).hexdigest()
+                try:
+                    return client.upload_part(key, upload_id, p["number"], body, p["sha256"])
+                finally:
+                    body.release()
+
+            done = sent = 0
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_upload, p): p for p in parts}
+                for fut in as_completed(futures):
+                    p = futures[fut]
+                    etags[p["number"]] = fut.result()
+                    done += 1
+                    sent += 0 if p["zero"] else p["length"]
+                    if done % max(1, len(parts) // 10) == 0 or done == len(parts):
+                        elapsed = time.monotonic() - start
+                        log(f"  {done}/{len(parts)} parts, {_fmt_mib(sent)} sent "
+                            f"({sent / (1 << 20) / max(elapsed, 1e-3):.0f} MiB/s)")
+            client.complete_multipart(key, upload_id, etags)
+        except BaseException:
+            try:
+                client.abort_multipart(key, upload_id)
+            except (S3Error, OSError):
+                pass
+            raise
+        finally:
+            if view is not None:
+                view.release()
+                mm.close()
+
+    blockmap = {
+        "object": key,
+        "size": size,
+        "data_bytes": data_bytes,
+        "part_size": part_size,
+        "extents": extents,
+        "parts": [{k: p[k] for k in ("number", "offset", "length", "zero", "sha256") if k in p}
+                  for p in parts],
+    }
+    client.put_object(f"{key}.blockmap.json", json.dumps(blockmap).encode(), "application/json")
+    log(f"uploaded s3://{client.bucket}/{key} in {time.monotonic() - start:.0f}s")
+    return blockmap
+
+
+def default_prefix():
+    """Short git commit of the tree, as upload.sh uses."""
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def check_credentials():
+    missing = [v for v in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY") if not os.environ.get(v)]
+    if missing:
+        print(f"error: {' and '.join(missing)} required for upload", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    """upload.py FILE [S3_PREFIX]"""
+    if len(sys.argv) not in (2, 3):
+        print("usage: upload.py FILE [S3_PREFIX]", file=sys.stderr)
+        sys.exit(2)
+    check_credentials()
+    path = sys.argv[1]
+    if not os.path.isfile(path):
+        print(f"error: file not found: {path}", file=sys.stderr)
+        sys.exit(1)
+    prefix = sys.argv[2] if len(sys.argv) == 3 else default_prefix()
+    key = f"{prefix}/{os.path.basename(path)}"
+    blockmap = upload_image(S3Client(), path, key)
+    with open(f"{path}.blockmap.json", "w") as f:
+        json.dump(blockmap, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -47,3 +47,52 @@ variable "efi_firmware_vars" {
   type    = string
   default = "/usr/share/OVMF/OVMF_VARS_4M.fd"
 }
+
+# Port windows; packer.py narrows these per build when running targets in
+# parallel so concurrent builds never probe the same ports.
+variable "vnc_port_min" {
+  type    = number
+  default = 5900
+}
+
+variable "vnc_port_max" {
+  type    = number
+  default = 6000
+}
+
+variable "ssh_port_min" {
+  type    = number
+  default = 2222
+}
+
+variable "ssh_port_max" {
+  type    = number
+  default = 4444
+}
+
+# Layered builds (layer_cache.py) write intermediate stages as qcow2 images
+# backed by the previous stage; regular builds keep these defaults.
+variable "disk_format" {
+  type    = string
+  default = "raw"
+}
+
+variable "use_backing_file" {
+  type    = bool
+  default = false
+}
+
+variable "output_directory" {
+  type    = string
+  default = ""
+}
+
+# QMP socket for module checkpoints in layer stages, see checkpoint.py
+variable "qmp_socket" {
+  type    = string
+  default = ""
+}
+
+locals {
+  output_directory = var.output_directory != "" ? var.output_directory : "output/${var.vm_name}"
+}
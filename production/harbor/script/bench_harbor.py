@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark configure_harbor.py against the local Harbor stand-in.
+
+For each size, generates a synthetic config.yaml-shaped dict with that many
+resources (registries, proxy-cache projects, project robots and replication
+policies in equal parts) and measures, on a fresh stand-in:
+
+  cold    plan + apply on an empty Harbor
+  noop    plan again once everything exists (should issue no writes)
+  drift   plan + apply after a quarter of the resources were changed
+
+Reports wall time and request counts per phase. Use --latency to mimic a
+remote Harbor; that is where request count and concurrency dominate.
+
+Usage:
+    python bench_harbor.py                        # sizes 10 100 1000
+    python bench_harbor.py --sizes 100 --latency 5 --workers 1 8
+    python bench_harbor.py --json                 # machine-readable results
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+import configure_harbor as ch
+from harbor_standin import HarborStandin
+
+
+def synthetic_config(size: int) -> dict:
+    """Config with *size* resources split across the four resource kinds."""
+    n = max(1, size // 4)
+    registries = [
+        {"name": f"reg-{i}", "type": "docker-registry",
+         "url": f"https://registry-{i}.example.com", "insecure": False}
+        for i in range(n)
+    ]
+    projects = [
+        {"name": f"proxy-{i}", "public": True, "registry": f"reg-{i}",
+         "metadata": {"auto_scan": False}}
+        for i in range(n)
+    ]
+    robots = [
+        {"name": f"bot-{i}", "level": "project", "duration": -1,
+         "description": f"robot {i}",
+         "permissions": [{"kind": "project", "namespace": f"proxy-{i}",
+                          "access": [{"resource": "repository", "action": "pull"}]}]}
+        for i in range(n)
+    ]
+    policies = [
+        {"name": f"mirror-{i}", "src_registry": f"reg-{i % n}", "dest_registry": "local",
+         "dest_namespace": f"mirror-{i}", "trigger": {"type": "manual"},
+         "filters": [{"type": "name", "value": f"library/app-{i}"}]}
+        for i in range(size - 3 * n)
+    ]
+    return {
+        "system": {"self_registration": False, "project_creation_restriction": "adminonly"},
+        "registries": registries,
+        "projects": projects,
+        "robot_accounts": robots,
+        "replication": policies,
+    }
+
+
+def drift(config: dict) -> dict:
+    """Copy of *config* with every fourth resource of each kind changed."""
+    out = json.loads(json.dumps(config))
+    for i, reg in enumerate(out["registries"]):
+        if i % 4 == 0:
+            reg["description"] = "changed"
+    for i, proj in enumerate(out["projects"]):
+        if i % 4 == 0:
+            proj["public"] = False
+    for i, robot in enumerate(out["robot_accounts"]):
+        if i % 4 == 0:
+            robot["description"] = "changed"
+    for i, policy in enumerate(out["replication"]):
+        if i % 4 == 0:
+            policy["enabled"] = True
+    return out
+
+
+def run_phase(harbor: HarborStandin, config: dict, workers: int) -> dict:
+    harbor.data.reset_counters()
+    start = time.monotonic()
+    client = ch.HarborClient(harbor.url, "admin", "Harbor12345", pool_size=workers)
+    changes = ch.plan(client, config)
+    planned = time.monotonic()
+    failed = ch.apply_plan(client, changes, workers) if changes else []
+    end = time.monotonic()
+    return {
+        "changes": len(changes),
+        "failed": len(failed),
+        "plan_s": round(planned - start, 4),
+        "apply_s": round(end - planned, 4),
+        "wall_s": round(end - start, 4),
+        "requests": harbor.data.total_requests(),
+        "by_method": harbor.data.by_method(),
+        "connections": harbor.data.connections,
+    }
+
+
+def bench(size: int, workers: int, latency: float) -> dict:
+    config = synthetic_config(size)
+    result = {"size": size, "workers": workers, "latency_ms": latency * 1000}
+    with HarborStandin(latency=latency) as harbor:
+        result["cold"] = run_phase(harbor, config, workers)
+        result["noop"] = run_phase(harbor, config, workers)
+        result["drift"] = run_phase(harbor, drift(config), workers)
+    return result
+
+
+def print_table(results: list[dict]) -> None:
+    header = (f"{'size':>6s} {'workers':>7s} {'phase':6s} {'changes':>7s} {'failed':>6s} "
+              f"{'requests':>8s} {'GET':>6s} {'write':>6s} {'conns':>5s} "
+              f"{'plan':>8s} {'apply':>8s} {'wall':>8s}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        for phase in ("cold", "noop", "drift"):
+            p = r[phase]
+            gets = p["by_method"].get("GET", 0)
+            print(f"{r['size']:6d} {r['workers']:7d} {phase:6s} {p['changes']:7d} {p['failed']:6d} "
+                  f"{p['requests']:8d} {gets:6d} {p['requests'] - gets:6d} {p['connections']:5d} "
+                  f"{p['plan_s']:7.3f}s {p['apply_s']:7.3f}s {p['wall_s']:7.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark configure_harbor.py offline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Number of resources per synthetic config (default: 10 100 1000)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[ch.DEFAULT_WORKERS],
+                        help=f"Apply worker counts to compare (default: {ch.DEFAULT_WORKERS})")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="MS",
+                        help="Delay added to every stand-in request, in milliseconds")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format="%(message)s")
+
+    results = []
+    for size in args.sizes:
+        for workers in args.workers:
+            r = bench(size, workers, args.latency / 1000)
+            results.append(r)
+            if r["cold"]["failed"] or r["drift"]["failed"] or r["noop"]["changes"]:
+                print(f"size {size}: apply did not converge: {json.dumps(r)}", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+    sys.exit(1 if any(r["cold"]["failed"] or r["drift"]["failed"] or r["noop"]["changes"]
+                      for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,26 +3,41 @@
 Harbor declarative configuration script.
 
 Reads config.yaml and .env, then applies Harbor settings via REST API (v2.0).
-Idempotent: checks existing resources before creating/updating.
+Declarative: loads the current Harbor state once, computes a plan of the
+creates/updates (and, with --prune, deletes) needed to match config.yaml and
+applies only those.
 
 Usage:
-    python configure_harbor.py              # dry-run (print planned changes)
-    python configure_harbor.py --apply      # apply changes to Harbor
-    python configure_harbor.py --apply -v   # verbose output
+    python configure_harbor.py                  # dry-run (print the plan)
+    python configure_harbor.py --apply          # apply the plan to Harbor
+    python configure_harbor.py --apply --prune  # also delete unlisted resources
+    python configure_harbor.py --apply -v       # verbose output
+    python configure_harbor.py --report         # artifact storage usage report
 """
 
 import argparse
+import heapq
+import json
 import logging
 import os
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
+from urllib.parse import quote, urljoin
 
 import requests
 import yaml
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 BASE_PATH = Path(__file__).resolve().parent
 API_BASE = "/api/v2.0"
+PAGE_SIZE = 100
+DEFAULT_WORKERS = 8
 
 logger = logging.getLogger("harbor-config")
 
@@ -35,12 +50,46 @@ class HarborError(Exception):
     """Raised when a Harbor API call fails."""
 
 
+def robot_key(level: str, project: str, name: str) -> tuple[str, str, str]:
+    """Index key for a robot account: (level, project name or "", short name)."""
+    return (level, project if level == "project" else "", name)
+
+
+def robot_key_from_api(rb: dict) -> tuple[str, str, str]:
+    """Index key for a robot as returned by the API.
+
+    Harbor reports full names: ``robot$name`` for system robots and
+    ``robot$project+name`` for project robots.
+    """
+    short = rb["name"].split("$", 1)[-1]
+    if rb.get("level") == "project" and "+" in short:
+        project, short = short.split("+", 1)
+        return robot_key("project", project, short)
+    return robot_key(rb.get("level", "system"), "", short)
+
+
+@dataclass
+class HarborState:
+    """Name-indexed snapshot of the Harbor resources this script manages."""
+    registries: dict[str, dict] = field(default_factory=dict)
+    projects: dict[str, dict] = field(default_factory=dict)
+    robots: dict[tuple[str, str, str], dict] = field(default_factory=dict)
+    policies: dict[str, dict] = field(default_factory=dict)
+    # project names whose project-level robots have been listed
+    robot_projects: set[str] = field(default_factory=set)
+
+
 class HarborClient:
-    def __init__(self, url: str, username: str, password: str):
+    def __init__(self, url: str, username: str, password: str,
+                 pool_size: int = DEFAULT_WORKERS):
         self.session = requests.Session()
         self.session.auth = (username, password)
+        # One keep-alive pool shared by all apply workers.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.base = url.rstrip("/")
-        self._registry_cache: dict[str, int] = {}
+        self._state: HarborState | None = None
         self._dry_run = False
         self._csrf_token: str = ""
         self._fetch_csrf_token()
@@ -82,244 +131,1148 @@ class HarborClient:
         r = self.session.put(self._url(path), **kwargs)
         return r
 
-    # -- registry helpers --
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        if self._dry_run:
+            return requests.Response()
+        r = self.session.delete(self._url(path), **kwargs)
+        return r
 
-    def list_registries(self) -> list[dict]:
-        r = self.get("/registries", params={"page_size": 100})
-        if r.status_code == 200:
-            return r.json()
-        return []
+    def paginate(self, path: str, params: dict | None = None) -> list[dict]:
+        """GET every page of a Harbor list endpoint.
 
-    def registry_id_by_name(self, name: str) -> int | None:
-        if name in self._registry_cache:
-            return self._registry_cache[name]
-        for reg in self.list_registries():
-            self._registry_cache[reg["name"]] = reg["id"]
-        return self._registry_cache.get(name)
-
-    def create_registry(self, reg: dict) -> int:
-        """Create a registry endpoint. Returns the ID."""
-        payload = {
-            "name": reg["name"],
-            "type": reg["type"],
-            "insecure": reg.get("insecure", False),
-        }
-        if reg.get("url"):
-            payload["url"] = reg["url"]
-        if reg.get("description"):
-            payload["description"] = reg["description"]
-        if reg.get("credential"):
-            payload["credential"] = reg["credential"]
-
-        r = self.post("/registries", json=payload)
-        if r.status_code == 201:
-            loc = r.headers.get("Location", "")
-            new_id = int(loc.split("/")[-1]) if loc else 0
-            logger.info("  Created registry '%s' (id=%s)", reg["name"], new_id)
-            self._registry_cache[reg["name"]] = new_id
-            return new_id
-        if r.status_code == 409:
-            # already exists
-            existing_id = self.registry_id_by_name(reg["name"])
-            if existing_id:
-                logger.info("  Registry '%s' already exists (id=%d)", reg["name"], existing_id)
-            return existing_id
-        logger.error("  Failed to create registry '%s': %d %s",
-                     reg["name"], r.status_code, r.text)
-        return None
-
-    # -- project helpers --
+        Follows the ``Link: <...>; rel="next"`` header, falling back to
+        ``X-Total-Count`` when Harbor omits it.  A 404 yields an empty list.
+        """
+        items: list[dict] = []
+        page = 1
+        url = self._url(path)
+        query: dict | None = {**(params or {}), "page": page, "page_size": PAGE_SIZE}
+        while True:
+            r = self.session.get(url, params=query)
+            if r.status_code == 404:
+                break
+            if r.status_code != 200:
+                r.raise_for_status()
+            batch = r.json() or []
+            items.extend(batch)
+
+            next_link = r.links.get("next", {}).get("url")
+            if next_link:
+                url, query = urljoin(self.base + "/", next_link), None
+                continue
+            total = r.headers.get("X-Total-Count")
+            if batch and total is not None and len(items) < int(total):
+                page += 1
+                url = self._url(path)
+                query = {**(params or {}), "page": page, "page_size": PAGE_SIZE}
+                continue
+            break
+        return items
+
+    def get_page(self, path: str, page: int, params: dict | None = None,
+                 page_size: int = PAGE_SIZE) -> tuple[list[dict], int]:
+        """GET one page of a list endpoint: (items, X-Total-Count). 404 -> ([], 0)."""
+        r = self.session.get(self._url(path),
+                             params={**(params or {}), "page": page, "page_size": page_size})
+        if r.status_code == 404:
+            return [], 0
+        if r.status_code != 200:
+            r.raise_for_status()
+        items = r.json() or []
+        total = r.headers.get("X-Total-Count")
+        return items, int(total) if total is not None else len(items)
+
+    @staticmethod
+    def _created_id(r: requests.Response) -> int:
+        """ID of a resource created by POST, taken from the Location header."""
+        loc = r.headers.get("Location", "")
+        return int(loc.rstrip("/").split("/")[-1]) if loc else 0
+
+    # -- state snapshot --
+
+    @property
+    def state(self) -> HarborState:
+        """Current Harbor state, loaded with one paginated pass on first use."""
+        if self._state is None:
+            self._state = self.load_state()
+        return self._state
+
+    def load_state(self) -> HarborState:
+        state = HarborState(
+            registries={reg["name"]: reg for reg in self.list_registries()},
+            projects={p["name"]: p for p in self.list_projects()},
+            robots={robot_key_from_api(rb): rb for rb in self.list_robots()},
+            policies={p["name"]: p for p in self.list_policies()},
+        )
+        logger.debug("Loaded state: %d registries, %d projects, %d robots, %d policies",
+                     len(state.registries), len(state.projects),
+                     len(state.robots), len(state.policies))
+        return state
+
+    # -- listing --
+
+    def list_registries(self) -> list[dict]:
+        return self.paginate("/registries")
 
     def list_projects(self) -> list[dict]:
-        r = self.get("/projects", params={"page_size": 100})
-        if r.status_code == 200:
-            return r.json()
-        return []
+        return self.paginate("/projects")
+
+    def list_robots(self, params: dict | None = None) -> list[dict]:
+        return self.paginate("/robots", params)
+
+    def list_policies(self) -> list[dict]:
+        return self.paginate("/replication/policies")
+
+    def get_system_config(self) -> dict:
+        """Current system configuration as ``{key: value}``."""
+        r = self.get("/configurations")
+        if r.status_code != 200:
+            return {}
+        return {k: v.get("value") if isinstance(v, dict) else v for k, v in r.json().items()}
+
+    # -- lookups --
+
+    def registry_id_by_name(self, name: str) -> int | None:
+        reg = self.state.registries.get(name)
+        return reg["id"] if reg else None
 
     def project_by_name(self, name: str) -> dict | None:
-        for p in self.list_projects():
-            if p["name"] == name:
-                return p
-        return None
-
-    def create_project(self, proj: dict) -> None:
-        existing = self.project_by_name(proj["name"])
-        if existing:
-            logger.info("  Project '%s' already exists (id=%d)", proj["name"], existing["project_id"])
+        return self.state.projects.get(name)
+
+    def load_project_robots(self, project_name: str) -> None:
+        """Index the robots of one project (listed once per project)."""
+        if project_name in self.state.robot_projects:
+            return
+        self.state.robot_projects.add(project_name)
+        project = self.project_by_name(project_name)
+        if not project:
             return
+        for rb in self.list_robots({"q": f"Level=project,ProjectID={project['project_id']}"}):
+            self.state.robots[robot_key_from_api(rb)] = rb
 
-        payload: dict = {
-            "project_name": proj["name"],
-            "metadata": {
-                "public": str(proj.get("public", False)).lower(),
-            },
-        }
+    def registry_ref(self, name: str) -> dict | None:
+        """Build a minimal registry reference for replication policy."""
+        if name == "local":
+            return {"id": 0}
+        reg_id = self.registry_id_by_name(name)
+        if reg_id is None:
+            return None
+        return {"id": reg_id}
 
-        if proj.get("registry"):
-            reg_id = self.registry_id_by_name(proj["registry"])
-            if reg_id is None:
-                logger.warning("  Registry '%s' not found, skipping proxy cache project '%s'",
-                               proj["registry"], proj["name"])
-                return
-            payload["registry_id"] = reg_id
-
-        if proj.get("storage_limit") is not None:
-            payload["storage_limit"] = proj["storage_limit"]
-
-        if proj.get("metadata"):
-            payload["metadata"].update({k: str(v).lower() for k, v in proj["metadata"].items()})
-
-        r = self.post("/projects", json=payload)
-        if r.status_code == 201:
-            logger.info("  Created project '%s'", proj["name"])
-        else:
-            logger.error("  Failed to create project '%s': %d %s",
-                         proj["name"], r.status_code, r.text)
+    def get_retention(self, retention_id) -> dict | None:
+        r = self.get(f"/retentions/{retention_id}")
+        return r.json() if r.status_code == 200 else None
+
+    def list_immutable_rules(self, project_name: str) -> list[dict]:
+        return self.paginate(f"/projects/{quote(project_name, safe='')}/immutabletagrules")
+
+    # -- applying planned changes --
 
-    # -- robot account helpers --
+    def apply_change(self, change: "Change", log=logger) -> bool:
+        """Execute one planned change. Returns True on success.
 
-    def list_robots(self) -> list[dict]:
-        r = self.get("/robots", params={"page_size": 100})
+        Messages go to *log*, which the concurrent executor replaces with a
+        per-change buffer so output stays in plan order.
+        """
+        if change.kind == "system":
+            return self._apply_system(change, log)
+
+        path = collection_path(change)
+        if change.action == "delete":
+            r = self.delete(f"{path}/{change.resource_id}")
+            if r.status_code == 200:
+                log.info("  Deleted %s '%s'", change.kind, change.name)
+                self._forget(change)
+                return True
+            log.error("  Failed to delete %s '%s': %d %s",
+                      change.kind, change.name, r.status_code, r.text)
+            return False
+
+        try:
+            payload = build_payload(self, change.kind, change.spec)
+        except HarborError as e:
+            log.warning("  Skipping %s '%s': %s", change.kind, change.name, e)
+            return False
+
+        if change.action == "create":
+            r = self.post(path, json=payload)
+            if r.status_code == 201:
+                log.info("  Created %s '%s'", change.kind, change.name)
+                self._remember(change, payload, r, log)
+                return True
+            if r.status_code == 409:
+                log.info("  %s '%s' already exists", change.kind.capitalize(), change.name)
+                return True
+            log.error("  Failed to create %s '%s': %d %s",
+                      change.kind, change.name, r.status_code, r.text)
+            return False
+
+        if change.kind == "project":
+            # Only metadata is mutable; registry_id and storage_limit are create-only.
+            payload = {"metadata": payload["metadata"]}
+        elif change.kind == "registry":
+            payload = registry_update_payload(payload)
+        elif change.kind == "robot":
+            # Harbor rejects updates that change the (prefixed) robot name.
+            payload["name"] = self.state.robots[change.key]["name"]
+        r = self.put(f"{path}/{change.resource_id}", json=payload)
         if r.status_code == 200:
-            return r.json()
-        return []
+            log.info("  Updated %s '%s' (%s)", change.kind, change.name, ", ".join(change.diff))
+            return True
+        log.error("  Failed to update %s '%s': %d %s",
+                  change.kind, change.name, r.status_code, r.text)
+        return False
+
+    def _apply_system(self, change: "Change", log=logger) -> bool:
+        r = self.put("/configurations", json=change.spec)
+        if r.status_code == 200:
+            log.info("  System configuration updated (%s)", ", ".join(change.diff))
+            return True
+        log.warning("  Failed to update system config: %d %s", r.status_code, r.text)
+        return False
+
+    def _remember(self, change: "Change", payload: dict, r: requests.Response,
+                  log=logger) -> None:
+        """Add a newly created resource to the state index."""
+        state = self.state
+        new_id = self._created_id(r)
+        if change.kind == "registry":
+            state.registries[change.name] = {**payload, "id": new_id}
+        elif change.kind == "project":
+            state.projects[change.name] = {
+                "project_id": new_id,
+                "name": change.name,
+                "registry_id": payload.get("registry_id"),
+                "metadata": payload["metadata"],
+            }
+        elif change.kind == "robot":
+            data = r.json() if r.text else {}
+            if data.get("secret"):
+                log.info("    Token: %s", data["secret"])
+            state.robots[change.key] = {
+                "id": data.get("id") or new_id,
+                "name": data.get("name", change.spec["name"]),
+                "level": change.spec["level"],
+            }
+        elif change.kind == "replication":
+            state.policies[change.name] = {**payload, "id": new_id}
+        elif change.kind == "retention":
+            project = state.projects.get(change.spec["project"])
+            if project is not None:
+                project.setdefault("metadata", {})["retention_id"] = str(new_id)
+
+    def _forget(self, change: "Change") -> None:
+        """Drop a deleted resource from the state index."""
+        index = {
+            "registry": self.state.registries,
+            "project": self.state.projects,
+            "robot": self.state.robots,
+            "replication": self.state.policies,
+        }.get(change.kind)
+        if index is not None:
+            index.pop(change.key, None)
+
+
+# API collection path per resource kind
+COLLECTIONS = {
+    "registry": "/registries",
+    "project": "/projects",
+    "robot": "/robots",
+    "replication": "/replication/policies",
+    "retention": "/retentions",
+}
+
+
+def collection_path(change: "Change") -> str:
+    if change.kind == "immutable":
+        return f"/projects/{quote(change.spec['project'], safe='')}/immutabletagrules"
+    return COLLECTIONS[change.kind]
+
+
+# ---------------------------------------------------------------------------
+# Payloads
+# ---------------------------------------------------------------------------
+
+def registry_payload(reg: dict) -> dict:
+    payload = {
+        "name": reg["name"],
+        "type": reg["type"],
+        "insecure": reg.get("insecure", False),
+    }
+    if reg.get("url"):
+        payload["url"] = reg["url"]
+    if reg.get("description"):
+        payload["description"] = reg["description"]
+    if reg.get("credential"):
+        payload["credential"] = reg["credential"]
+    return payload
+
+
+def registry_update_payload(payload: dict) -> dict:
+    """PUT /registries/{id} takes the credential flattened into the body."""
+    update = {k: v for k, v in payload.items() if k not in ("type", "credential")}
+    cred = payload.get("credential") or {}
+    if cred:
+        update["credential_type"] = cred.get("type", "basic")
+        update["access_key"] = cred.get("access_key", "")
+        update["access_secret"] = cred.get("access_secret", "")
+    return update
+
+
+def project_metadata(proj: dict) -> dict:
+    metadata = {"public": str(proj.get("public", False)).lower()}
+    if proj.get("metadata"):
+        metadata.update({k: str(v).lower() for k, v in proj["metadata"].items()})
+    return metadata
+
+
+def project_payload(client: HarborClient, proj: dict) -> dict:
+    payload: dict = {
+        "project_name": proj["name"],
+        "metadata": project_metadata(proj),
+    }
+    if proj.get("registry"):
+        reg_id = client.registry_id_by_name(proj["registry"])
+        if reg_id is None:
+            raise HarborError(f"registry '{proj['registry']}' not found")
+        payload["registry_id"] = reg_id
+    if proj.get("storage_limit") is not None:
+        payload["storage_limit"] = proj["storage_limit"]
+    return payload
+
+
+def robot_project(robot: dict) -> str:
+    """Project a project-level robot entry from config.yaml belongs to."""
+    if robot.get("permissions"):
+        return robot["permissions"][0]["namespace"]
+    return robot.get("project", "")
+
+
+def robot_payload(robot: dict) -> dict:
+    payload: dict = {
+        "name": robot["name"],
+        "level": robot["level"],
+        "duration": robot.get("duration", -1),
+        "disable": robot.get("disable", False),
+        "permissions": robot.get("permissions", []),
+    }
+    if robot.get("description"):
+        payload["description"] = robot["description"]
+    if robot.get("secret"):
+        payload["secret"] = robot["secret"]
+    return payload
+
+
+def policy_payload(client: HarborClient, policy: dict) -> dict:
+    src_ref = client.registry_ref(policy["src_registry"])
+    dst_ref = client.registry_ref(policy["dest_registry"])
+    if src_ref is None or dst_ref is None:
+        missing = policy["src_registry"] if src_ref is None else policy["dest_registry"]
+        raise HarborError(f"registry '{missing}' not found")
+
+    payload: dict = {
+        "name": policy["name"],
+        "src_registry": src_ref,
+        "dest_registry": dst_ref,
+        "override": policy.get("override", False),
+        "enabled": policy.get("enabled", False),
+    }
+    if policy.get("description"):
+        payload["description"] = policy["description"]
+    if policy.get("dest_namespace"):
+        payload["dest_namespace"] = policy["dest_namespace"]
+    if policy.get("dest_namespace_replace_count") is not None:
+        payload["dest_namespace_replace_count"] = policy["dest_namespace_replace_count"]
+    if policy.get("replicate_deletion") is not None:
+        payload["replicate_deletion"] = policy["replicate_deletion"]
+    if policy.get("speed") is not None:
+        payload["speed"] = policy["speed"]
+
+    # trigger
+    if policy.get("trigger"):
+        trigger = {"type": policy["trigger"]["type"]}
+        if policy["trigger"].get("settings"):
+            trigger["trigger_settings"] = policy["trigger"]["settings"]
+        payload["trigger"] = trigger
+
+    # filters
+    if policy.get("filters"):
+        payload["filters"] = [
+            {"type": f["type"], "value": f["value"],
+             "decoration": f.get("decoration", "matches")}
+            for f in policy["filters"]
+        ]
+    return payload
+
+
+# Retention rule templates and the unit of their parameter
+RETENTION_TEMPLATES = {
+    "latestPushedK": "count",
+    "latestPulledN": "count",
+    "nDaysSinceLastPush": "days",
+    "nDaysSinceLastPull": "days",
+    "always": None,
+}
+
+
+def _tag_selectors(rule: dict) -> list[dict]:
+    return [{
+        "kind": "doublestar",
+        "decoration": "excludes" if rule.get("exclude_tags") else "matches",
+        "pattern": rule.get("tags", "**"),
+        "extras": json.dumps({"untagged": rule.get("untagged", True)}),
+    }]
+
+
+def _scope_selectors(rule: dict) -> dict:
+    return {"repository": [{
+        "kind": "doublestar",
+        "decoration": "repoExcludes" if rule.get("exclude_repositories") else "repoMatches",
+        "pattern": rule.get("repositories", "**"),
+    }]}
+
+
+def retention_rule_payload(rule: dict) -> dict:
+    template = rule["template"]
+    if template not in RETENTION_TEMPLATES:
+        raise HarborError(f"unknown retention template '{template}'")
+    params = {template: rule["value"]} if RETENTION_TEMPLATES[template] else {}
+    return {
+        "disabled": rule.get("disabled", False),
+        "action": "retain",
+        "template": template,
+        "params": params,
+        "tag_selectors": _tag_selectors(rule),
+        "scope_selectors": _scope_selectors(rule),
+    }
+
+
+def retention_payload(client: HarborClient, spec: dict) -> dict:
+    project = client.project_by_name(spec["project"])
+    if project is None:
+        raise HarborError(f"project '{spec['project']}' not found")
+    trigger: dict = {"kind": "Schedule", "settings": {"cron": spec.get("schedule", "")}}
+    return {
+        "algorithm": "or",
+        "rules": [retention_rule_payload(rule) for rule in spec.get("rules") or []],
+        "trigger": trigger,
+        "scope": {"level": "project", "ref": project["project_id"]},
+    }
+
+
+def immutable_payload(spec: dict) -> dict:
+    return {
+        "disabled": spec.get("disabled", False),
+        "action": "immutable",
+        "template": "immutable_template",
+        "tag_selectors": [{k: v for k, v in sel.items() if k != "extras"}
+                          for sel in _tag_selectors(spec)],
+        "scope_selectors": _scope_selectors(spec),
+    }
+
+
+def build_payload(client: HarborClient, kind: str, spec: dict) -> dict:
+    """Request body for creating/updating *spec*; resolves names to IDs."""
+    if kind == "registry":
+        return registry_payload(spec)
+    if kind == "project":
+        return project_payload(client, spec)
+    if kind == "robot":
+        return robot_payload(spec)
+    if kind == "retention":
+        return retention_payload(client, spec)
+    if kind == "immutable":
+        return immutable_payload(spec)
+    return policy_payload(client, spec)
+
+
+# ---------------------------------------------------------------------------
+# Plan
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Change:
+    """One API call needed to reconcile Harbor with config.yaml."""
+    action: str                    # create, update or delete
+    kind: str                      # system, registry, project, robot, replication,
+                                   # retention, immutable
+    name: str
+    spec: dict = field(default_factory=dict)
+    resource_id: int | None = None
+    key: object = None             # state index key
+    diff: dict = field(default_factory=dict)  # field -> (actual, desired)
+
+    def describe(self) -> str:
+        sign = {"create": "+", "update": "~", "delete": "-"}[self.action]
+        line = f"  {sign} {self.kind:12s} {self.name}"
+        for fld, (old, new) in self.diff.items():
+            line += f"\n      {fld}: {old!r} -> {new!r}"
+        return line
+
+
+def _diff(actual: dict, desired: dict) -> dict:
+    """Fields of *desired* whose value differs in *actual*."""
+    return {k: (actual.get(k), v) for k, v in desired.items() if actual.get(k) != v}
+
+
+def _norm_permissions(perms: list | None) -> list:
+    return sorted(
+        (p.get("kind", ""), p.get("namespace", ""),
+         sorted((a.get("resource", ""), a.get("action", ""), a.get("effect", "allow"))
+                for a in p.get("access") or []))
+        for p in perms or []
+    )
 
-    def create_robot(self, robot: dict) -> None:
-        # Check for existing robot (project-level robots need different query)
-        if robot["level"] == "project":
-            namespace = robot["permissions"][0]["namespace"] if robot.get("permissions") else robot.get("project", "")
-            project = self.project_by_name(namespace)
-            if project:
-                r = self.get("/robots", params={
-                    "q": f"Level=project,ProjectID={project['project_id']}",
-                    "page_size": 100,
-                })
-                existing = [rb for rb in (r.json() if r.status_code == 200 else [])
-                            if rb["name"].endswith(f"+{robot['name']}")]
-            else:
-                existing = []
-        else:
-            existing = [
-                rb for rb in self.list_robots()
-                if rb["name"] == robot["name"] and rb["level"] == robot["level"]
-            ]
-        if existing:
-            logger.info("  Robot '%s' (%s) already exists (id=%d)",
-                        robot["name"], robot["level"], existing[0]["id"])
-            return
 
-        payload: dict = {
-            "name": robot["name"],
-            "level": robot["level"],
+def _registry_fields(reg: dict) -> dict:
+    fields = {"type": reg.get("type"), "url": (reg.get("url") or "").rstrip("/"),
+              "insecure": bool(reg.get("insecure", False))}
+    if reg.get("description"):
+        fields["description"] = reg["description"]
+    cred = reg.get("credential")
+    if cred and cred.get("access_key"):
+        fields["access_key"] = cred.get("access_key")
+    return fields
+
+
+def _policy_fields(policy: dict) -> dict:
+    """Comparable replication policy fields, from config.yaml or the API."""
+    def _reg_id(ref) -> int:
+        return (ref or {}).get("id", 0) if isinstance(ref, dict) else ref
+
+    trigger = policy.get("trigger") or {}
+    return {
+        "src_registry": _reg_id(policy.get("src_registry")),
+        "dest_registry": _reg_id(policy.get("dest_registry")),
+        "description": policy.get("description") or "",
+        "dest_namespace": policy.get("dest_namespace") or "",
+        "override": bool(policy.get("override", False)),
+        "enabled": bool(policy.get("enabled", False)),
+        "trigger": (trigger.get("type", "manual"),
+                    (trigger.get("trigger_settings") or trigger.get("settings") or {}).get("cron", "")),
+        "filters": sorted((f["type"], str(f["value"]), f.get("decoration", "matches"))
+                          for f in policy.get("filters") or []),
+    }
+
+
+def _selector_fields(rule: dict) -> tuple:
+    """Comparable (repositories, tags) selectors of a rule from the API."""
+    repo = ((rule.get("scope_selectors") or {}).get("repository") or [{}])[0]
+    tag = (rule.get("tag_selectors") or [{}])[0]
+    try:
+        untagged = json.loads(tag.get("extras") or "{}").get("untagged", True)
+    except ValueError:
+        untagged = True
+    return (repo.get("pattern", "**"), repo.get("decoration", "repoMatches"),
+            tag.get("pattern", "**"), tag.get("decoration", "matches"), untagged)
+
+
+def _retention_rules(rules: list[dict]) -> list[tuple]:
+    """Normalized retention rules from the API, comparable across both sides."""
+    return [
+        (r.get("template"), (r.get("params") or {}).get(r.get("template")),
+         bool(r.get("disabled", False))) + _selector_fields(r)
+        for r in rules
+    ]
+
+
+def check_tag_policies(projects: list[dict]) -> list[str]:
+    """Config errors in the ``retention`` and ``immutable_tags`` entries.
+
+    Checked before planning, so a typo is reported as one line naming the
+    project and rule instead of failing halfway through the plan.
+    """
+    errors = []
+    for proj in projects:
+        name = proj.get("name", "?")
+        retention = proj.get("retention")
+        if retention is not None:
+            rules = (retention.get("rules") or []) if isinstance(retention, dict) else None
+            if not isinstance(rules, list):
+                errors.append(f"project '{name}': retention needs a list of rules")
+                rules = []
+            for i, rule in enumerate(rules, 1):
+                where = f"project '{name}' retention rule {i}"
+                template = rule.get("template") if isinstance(rule, dict) else None
+                if template not in RETENTION_TEMPLATES:
+                    errors.append(f"{where}: unknown template {template!r} "
+                                  f"(one of {', '.join(RETENTION_TEMPLATES)})")
+                elif RETENTION_TEMPLATES[template]:
+                    value = rule.get("value")
+                    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+                        errors.append(f"{where}: {template} needs a positive value "
+                                      f"({RETENTION_TEMPLATES[template]})")
+        immutable = proj.get("immutable_tags")
+        if immutable is not None:
+            if not isinstance(immutable, list):
+                errors.append(f"project '{name}': immutable_tags needs a list of rules")
+                continue
+            for i, rule in enumerate(immutable, 1):
+                if not isinstance(rule, dict):
+                    errors.append(f"project '{name}' immutable_tags rule {i}: "
+                                  "needs repositories/tags patterns")
+    return errors
+
+
+def plan_tag_policies(client: HarborClient, projects: list[dict]) -> list[Change]:
+    """Retention and tag-immutability changes for projects that declare them.
+
+    A project's ``retention`` and ``immutable_tags`` entries are authoritative
+    for that project: retention rules are replaced as a whole and immutable
+    rules not listed are deleted.  Projects without these keys are left alone.
+    """
+    changes: list[Change] = []
+    for proj in projects:
+        name = proj["name"]
+        actual_project = client.project_by_name(name)
+
+        retention = proj.get("retention")
+        if retention is not None:
+            spec = {**retention, "project": name}
+            desired = {
+                "schedule": retention.get("schedule", ""),
+                "rules": _retention_rules(
+                    [retention_rule_payload(r) for r in retention.get("rules") or []]),
+            }
+            retention_id = ((actual_project or {}).get("metadata") or {}).get("retention_id")
+            actual = client.get_retention(retention_id) if retention_id else None
+            if actual is None:
+                changes.append(Change("create", "retention", name, spec=spec))
+            else:
+                current = {
+                    "schedule": ((actual.get("trigger") or {}).get("settings") or {}).get("cron", ""),
+                    "rules": _retention_rules(actual.get("rules") or []),
+                }
+                diff = _diff(current, desired)
+                if diff:
+                    changes.append(Change("update", "retention", name, spec=spec,
+                                          resource_id=int(retention_id), diff=diff))
+
+        immutable = proj.get("immutable_tags")
+        if immutable is not None:
+            existing = {}
+            if actual_project is not None:
+                for rule in client.list_immutable_rules(name):
+                    existing.setdefault(_selector_fields(rule)[:4], rule)
+            for rule in immutable:
+                spec = {**rule, "project": name}
+                key = _selector_fields(immutable_payload(spec))[:4]
+                label = f"{name}:{rule.get('repositories', '**')}:{rule.get('tags', '**')}"
+                actual = existing.pop(key, None)
+                if actual is None:
+                    changes.append(Change("create", "immutable", label, spec=spec))
+                elif bool(actual.get("disabled", False)) != rule.get("disabled", False):
+                    changes.append(Change(
+                        "update", "immutable", label, spec=spec, resource_id=actual["id"],
+                        diff={"disabled": (actual.get("disabled", False), rule.get("disabled", False))}))
+            for key, actual in existing.items():
+                changes.append(Change("delete", "immutable", f"{name}:{key[0]}:{key[2]}",
+                                      spec={"project": name}, resource_id=actual["id"]))
+    return changes
+
+
+def plan(client: HarborClient, config: dict, prune: bool = False) -> list[Change]:
+    """Compute the changes that make Harbor match *config*.
+
+    Works on one state snapshot (``client.state``) plus the current system
+    configuration; no resource is listed twice.  Changes are ordered so
+    that dependencies come first: registries, projects, robots and
+    replication policies, then deletes in reverse order.
+    """
+    state = client.state
+    changes: list[Change] = []
+
+    system = config.get("system") or {}
+    if system:
+        current = client.get_system_config()
+        diff = _diff(current, system)
+        if diff:
+            changes.append(Change("update", "system", "configurations",
+                                  spec={k: system[k] for k in diff}, diff=diff))
+
+    registries = config.get("registries") or []
+    for reg in registries:
+        actual = state.registries.get(reg["name"])
+        if actual is None:
+            changes.append(Change("create", "registry", reg["name"], spec=reg, key=reg["name"]))
+            continue
+        diff = _diff(_registry_fields(actual), _registry_fields(reg))
+        if diff:
+            changes.append(Change("update", "registry", reg["name"], spec=reg,
+                                  resource_id=actual["id"], key=reg["name"], diff=diff))
+
+    projects = config.get("projects") or []
+    for proj in projects:
+        actual = state.projects.get(proj["name"])
+        if actual is None:
+            changes.append(Change("create", "project", proj["name"], spec=proj, key=proj["name"]))
+            continue
+        diff = {f"metadata.{k}": d for k, d in
+                _diff(actual.get("metadata") or {}, project_metadata(proj)).items()}
+        if proj.get("registry"):
+            want = client.registry_id_by_name(proj["registry"])
+            if want is not None and actual.get("registry_id") not in (None, want):
+                logger.warning("  Project '%s' proxies registry id %s, config wants '%s'; "
+                               "proxy registry cannot be changed in place",
+                               proj["name"], actual.get("registry_id"), proj["registry"])
+        if diff:
+            changes.append(Change("update", "project", proj["name"], spec=proj,
+                                  resource_id=actual["project_id"], key=proj["name"], diff=diff))
+
+    robots = config.get("robot_accounts") or []
+    wanted_robots = set()
+    for robot in robots:
+        project = ""
+        if robot["level"] == "project":
+            project = robot_project(robot)
+            client.load_project_robots(project)
+        key = robot_key(robot["level"], project, robot["name"])
+        wanted_robots.add(key)
+        actual = state.robots.get(key)
+        label = f"{project}+{robot['name']}" if project else robot["name"]
+        if actual is None:
+            changes.append(Change("create", "robot", label, spec=robot, key=key))
+            continue
+        desired = {
+            "description": robot.get("description", ""),
             "duration": robot.get("duration", -1),
             "disable": robot.get("disable", False),
-            "permissions": robot.get("permissions", []),
+            "permissions": _norm_permissions(robot.get("permissions")),
         }
-        if robot.get("description"):
-            payload["description"] = robot["description"]
-        if robot.get("secret"):
-            payload["secret"] = robot["secret"]
-
-        r = self.post("/robots", json=payload)
-        if r.status_code == 201:
-            logger.info("  Created robot '%s' (%s)", robot["name"], robot["level"])
-            if r.text:
-                data = r.json()
-                logger.info("    Token: %s", data.get("secret", "(not returned)"))
-        elif r.status_code == 409:
-            logger.info("  Robot '%s' (%s) already exists", robot["name"], robot["level"])
-        else:
-            logger.error("  Failed to create robot '%s': %d %s",
-                         robot["name"], r.status_code, r.text)
+        current = {
+            "description": actual.get("description", ""),
+            "duration": actual.get("duration", -1),
+            "disable": actual.get("disable", False),
+            "permissions": _norm_permissions(actual.get("permissions")),
+        }
+        diff = _diff(current, desired)
+        if diff:
+            changes.append(Change("update", "robot", label, spec=robot,
+                                  resource_id=actual["id"], key=key, diff=diff))
+
+    replications = config.get("replication") or []
+    for policy in replications:
+        actual = state.policies.get(policy["name"])
+        if actual is None:
+            changes.append(Change("create", "replication", policy["name"],
+                                  spec=policy, key=policy["name"]))
+            continue
+        desired = _policy_fields({
+            **policy,
+            "src_registry": (client.registry_ref(policy["src_registry"]) or {}).get("id"),
+            "dest_registry": (client.registry_ref(policy["dest_registry"]) or {}).get("id"),
+        })
+        diff = _diff(_policy_fields(actual), desired)
+        if diff:
+            changes.append(Change("update", "replication", policy["name"], spec=policy,
+                                  resource_id=actual["id"], key=policy["name"], diff=diff))
+
+    changes.extend(plan_tag_policies(client, projects))
+
+    if prune:
+        wanted = {p["name"] for p in replications}
+        for name, pol in sorted(state.policies.items()):
+            if name not in wanted:
+                changes.append(Change("delete", "replication", name,
+                                      resource_id=pol["id"], key=name))
+        for key, rb in sorted(state.robots.items()):
+            if key not in wanted_robots:
+                label = f"{key[1]}+{key[2]}" if key[1] else key[2]
+                changes.append(Change("delete", "robot", label, resource_id=rb["id"], key=key))
+        wanted = {p["name"] for p in projects}
+        for name, proj in sorted(state.projects.items()):
+            if name not in wanted:
+                changes.append(Change("delete", "project", name,
+                                      resource_id=proj["project_id"], key=name))
+        wanted = {r["name"] for r in registries}
+        for name, reg in sorted(state.registries.items()):
+            if name not in wanted:
+                changes.append(Change("delete", "registry", name,
+                                      resource_id=reg["id"], key=name))
+
+    return changes
+
+
+def print_plan(changes: list[Change]) -> None:
+    if not changes:
+        logger.info("No changes. Harbor matches config.yaml.")
+        return
+    for change in changes:
+        logger.info(change.describe())
+    counts = {a: sum(1 for c in changes if c.action == a) for a in ("create", "update", "delete")}
+    logger.info("Plan: %d to create, %d to update, %d to delete.",
+                counts["create"], counts["update"], counts["delete"])
 
-    # -- replication policy helpers --
 
-    def list_policies(self) -> list[dict]:
-        r = self.get("/replication/policies", params={"page_size": 100})
-        if r.status_code == 200:
-            return r.json()
-        return []
+# ---------------------------------------------------------------------------
+# Apply
+# ---------------------------------------------------------------------------
 
-    def _registry_ref(self, name: str) -> dict | None:
-        """Build a minimal registry reference for replication policy."""
-        if name == "local":
-            return {"id": 0}
-        reg_id = self.registry_id_by_name(name)
-        if reg_id is None:
-            return None
-        return {"id": reg_id}
+class ChangeLog:
+    """Buffers the log messages of one change until it can be printed in order."""
+
+    def __init__(self):
+        self.records: list[tuple[int, str, tuple]] = []
+
+    def _add(self, level: int, msg: str, *args) -> None:
+        self.records.append((level, msg, args))
+
+    def debug(self, msg: str, *args) -> None:
+        self._add(logging.DEBUG, msg, *args)
+
+    def info(self, msg: str, *args) -> None:
+        self._add(logging.INFO, msg, *args)
+
+    def warning(self, msg: str, *args) -> None:
+        self._add(logging.WARNING, msg, *args)
+
+    def error(self, msg: str, *args) -> None:
+        self._add(logging.ERROR, msg, *args)
+
+    def flush(self) -> None:
+        for level, msg, args in self.records:
+            logger.log(level, msg, *args)
+        self.records.clear()
+
+
+# Delete order: a resource is deleted only after everything referencing it.
+_DELETE_AFTER = {
+    "project": ("robot", "replication", "immutable"),
+    "registry": ("project", "replication"),
+}
+
+
+def dependencies(changes: list[Change]) -> list[set[int]]:
+    """For each change, the indexes of the changes that must finish first.
+
+    Creates/updates: proxy-cache projects wait for their registry, project
+    robots, retention and immutability rules for their project, replication
+    policies for both registries.
+    Deletes run in the opposite direction.
+    """
+    by_name: dict[tuple[str, str], int] = {}
+    for i, c in enumerate(changes):
+        if c.action != "delete":
+            by_name[(c.kind, c.name)] = i
+
+    deps: list[set[int]] = [set() for _ in changes]
+    for i, c in enumerate(changes):
+        if c.action == "delete":
+            after = _DELETE_AFTER.get(c.kind, ())
+            deps[i] = {j for j, d in enumerate(changes)
+                       if d.action == "delete" and d.kind in after}
+            continue
+        refs: list[tuple[str, str]] = []
+        if c.kind == "project" and c.spec.get("registry"):
+            refs.append(("registry", c.spec["registry"]))
+        elif c.kind == "robot" and c.spec.get("level") == "project":
+            refs.append(("project", robot_project(c.spec)))
+        elif c.kind == "replication":
+            refs += [("registry", c.spec["src_registry"]), ("registry", c.spec["dest_registry"])]
+        elif c.kind in ("retention", "immutable"):
+            refs.append(("project", c.spec["project"]))
+        deps[i] = {by_name[r] for r in refs if r in by_name}
+    return deps
+
+
+def apply_plan(client: HarborClient, changes: list[Change],
+               workers: int = DEFAULT_WORKERS, continue_on_error: bool = False) -> list[Change]:
+    """Apply *changes* concurrently, respecting :func:`dependencies`.
+
+    Independent changes run on a pool of *workers* threads sharing the
+    client's connection pool; logs are printed in plan order.  A change
+    whose dependency failed is skipped.  Unless *continue_on_error*, no new
+    change is started after the first failure.  Returns failed/skipped changes.
+    """
+    deps = dependencies(changes)
+    logs = [ChangeLog() for _ in changes]
+    done: dict[int, bool] = {}          # index -> succeeded
+    running: dict[Future, int] = {}
+    printed = 0
+    stop = False
+
+    def _ready(i: int) -> bool:
+        return i not in done and all(d in done for d in deps[i])
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = set(range(len(changes)))
+        while pending or running:
+            for i in sorted(pending):
+                if stop or not _ready(i):
+                    continue
+                pending.discard(i)
+                failed_dep = [d for d in deps[i] if not done[d]]
+                if failed_dep:
+                    logs[i].warning("  Skipping %s '%s': depends on failed %s",
+                                    changes[i].kind, changes[i].name,
+                                    ", ".join(f"{changes[d].kind} '{changes[d].name}'"
+                                              for d in failed_dep))
+                    done[i] = False
+                    continue
+                running[pool.submit(client.apply_change, changes[i], logs[i])] = i
+
+            if not running:
+                break  # stopped, or nothing left that can start
+            if running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    i = running.pop(fut)
+                    try:
+                        ok = fut.result()
+                    except requests.RequestException as e:
+                        logs[i].error("  Failed to apply %s '%s': %s",
+                                      changes[i].kind, changes[i].name, e)
+                        ok = False
+                    done[i] = ok
+                    if not ok and not continue_on_error:
+                        stop = True
+
+            while printed < len(changes) and printed in done:
+                logs[printed].flush()
+                printed += 1
+
+    for i in range(printed, len(changes)):
+        logs[i].flush()
+    return [c for i, c in enumerate(changes) if not done.get(i, False)]
 
-    def create_replication_policy(self, policy: dict) -> None:
-        existing = [p for p in self.list_policies() if p["name"] == policy["name"]]
-        if existing:
-            logger.info("  Replication policy '%s' already exists (id=%d)",
-                        policy["name"], existing[0]["id"])
-            return
 
-        src_ref = self._registry_ref(policy["src_registry"])
-        dst_ref = self._registry_ref(policy["dest_registry"])
-        if src_ref is None or dst_ref is None:
-            missing = policy["src_registry"] if src_ref is None else policy["dest_registry"]
-            logger.warning("  Registry '%s' not found, skipping replication policy '%s'",
-                           missing, policy["name"])
-            return
+# ---------------------------------------------------------------------------
+# Usage report
+# ---------------------------------------------------------------------------
 
-        payload: dict = {
-            "name": policy["name"],
-            "src_registry": src_ref,
-            "dest_registry": dst_ref,
-            "override": policy.get("override", False),
-            "enabled": policy.get("enabled", False),
+def _epoch(ts: str | None) -> float:
+    """Harbor timestamp to epoch seconds; 0.0 for empty or "never" (year 1)."""
+    if not ts or ts.startswith("0001-"):
+        return 0.0
+    try:
+        return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _fmt_time(epoch: float) -> str:
+    if not epoch:
+        return "never"
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _fmt_size(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if n < 1024 or unit == "TiB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{int(n)} B"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+class RepoUsage:
+    """Aggregated usage of one repository."""
+    __slots__ = ("artifacts", "size", "pulls", "last_pull", "last_push",
+                 "stale", "stale_size")
+
+    def __init__(self, pulls: int = 0):
+        self.artifacts = 0
+        self.size = 0
+        self.pulls = pulls
+        self.last_pull = 0.0
+        self.last_push = 0.0
+        self.stale = 0
+        self.stale_size = 0
+
+
+class UsageReport:
+    """Streaming aggregation of artifact pages into per-repository totals.
+
+    Pages are folded in as they arrive and dropped, so memory grows with the
+    number of repositories and *top*, not with the number of artifacts.  Only
+    the *top* stalest artifacts are kept (a bounded heap).
+    """
+
+    def __init__(self, stale_before: float, top: int = 20):
+        self.stale_before = stale_before
+        self.top = top
+        self.repos: dict[tuple[str, str], RepoUsage] = {}
+        self.projects_seen: set[str] = set()
+        # max-heap on last use via negation: (-last_used, size, project, repo, digest, tags)
+        self._stale: list[tuple[float, int, str, str, str, str]] = []
+        self._lock = threading.Lock()
+        self.requests = 0
+        # Pages that could not be fetched; their projects/repositories are incomplete
+        self.failures: list[dict] = []
+
+    def add_repositories(self, project: str, repos: list[dict]) -> None:
+        with self._lock:
+            self.projects_seen.add(project)
+            for repo in repos:
+                name = repo["name"].split("/", 1)[-1]
+                self.repos.setdefault((project, name), RepoUsage(repo.get("pull_count", 0)))
+
+    def add_failure(self, project: str, repo: str | None, page: int, error: str) -> None:
+        with self._lock:
+            self.failures.append({"project": project, "repository": repo, "page": page,
+                                  "error": error})
+
+    def add_artifacts(self, project: str, repo: str, artifacts: list[dict]) -> None:
+        rows = []
+        for a in artifacts:
+            pulled = _epoch(a.get("pull_time"))
+            pushed = _epoch(a.get("push_time"))
+            tags = ",".join(t["name"] for t in a.get("tags") or [])
+            rows.append((a.get("size", 0), pulled, pushed, a.get("digest", "")[:19], tags))
+
+        with self._lock:
+            usage = self.repos.setdefault((project, repo), RepoUsage())
+            for size, pulled, pushed, digest, tags in rows:
+                usage.artifacts += 1
+                usage.size += size
+                usage.last_pull = max(usage.last_pull, pulled)
+                usage.last_push = max(usage.last_push, pushed)
+                last_used = pulled or pushed
+                if last_used >= self.stale_before:
+                    continue
+                usage.stale += 1
+                usage.stale_size += size
+                entry = (-last_used, size, project, repo, digest, tags)
+                if len(self._stale) < self.top:
+                    heapq.heappush(self._stale, entry)
+                elif entry > self._stale[0]:
+                    heapq.heapreplace(self._stale, entry)
+
+    # -- results --
+
+    def projects(self) -> list[dict]:
+        def _total(project: str) -> dict:
+            return {"project": project, "repositories": 0, "artifacts": 0, "size": 0,
+                    "pulls": 0, "last_pull": 0.0, "stale": 0, "stale_size": 0}
+
+        totals = {p: _total(p) for p in self.projects_seen}
+        for (project, _), u in self.repos.items():
+            t = totals.setdefault(project, _total(project))
+            t["repositories"] += 1
+            t["artifacts"] += u.artifacts
+            t["size"] += u.size
+            t["pulls"] += u.pulls
+            t["last_pull"] = max(t["last_pull"], u.last_pull)
+            t["stale"] += u.stale
+            t["stale_size"] += u.stale_size
+        return sorted(totals.values(), key=lambda t: t["size"], reverse=True)
+
+    def top_repositories(self) -> list[dict]:
+        top = heapq.nlargest(self.top, self.repos.items(), key=lambda kv: kv[1].size)
+        return [{"project": p, "repository": r, "artifacts": u.artifacts, "size": u.size,
+                 "pulls": u.pulls, "last_pull": u.last_pull, "last_push": u.last_push}
+                for (p, r), u in top]
+
+    def stale_artifacts(self) -> list[dict]:
+        return [{"project": p, "repository": r, "digest": d, "tags": t, "size": size,
+                 "last_used": -neg}
+                for neg, size, p, r, d, t in sorted(self._stale, reverse=True)]
+
+    def to_dict(self) -> dict:
+        return {
+            "stale_before": self.stale_before,
+            "projects": self.projects(),
+            "top_repositories": self.top_repositories(),
+            "stale_artifacts": self.stale_artifacts(),
+            "failures": self.failures,
         }
-        if policy.get("description"):
-            payload["description"] = policy["description"]
-        if policy.get("dest_namespace"):
-            payload["dest_namespace"] = policy["dest_namespace"]
-        if policy.get("dest_namespace_replace_count") is not None:
-            payload["dest_namespace_replace_count"] = policy["dest_namespace_replace_count"]
-        if policy.get("replicate_deletion") is not None:
-            payload["replicate_deletion"] = policy["replicate_deletion"]
-        if policy.get("speed") is not None:
-            payload["speed"] = policy["speed"]
-
-        # trigger
-        if policy.get("trigger"):
-            trigger = {"type": policy["trigger"]["type"]}
-            if policy["trigger"].get("settings"):
-                trigger["trigger_settings"] = policy["trigger"]["settings"]
-            payload["trigger"] = trigger
-
-        # filters
-        if policy.get("filters"):
-            payload["filters"] = [
-                {"type": f["type"], "value": f["value"],
-                 "decoration": f.get("decoration", "matches")}
-                for f in policy["filters"]
-            ]
-
-        r = self.post("/replication/policies", json=payload)
-        if r.status_code == 201:
-            logger.info("  Created replication policy '%s'", policy["name"])
-        else:
-            logger.error("  Failed to create replication policy '%s': %d %s",
-                         policy["name"], r.status_code, r.text)
 
-    # -- system configuration --
 
-    def update_system_config(self, config: dict) -> None:
-        """Apply system configuration settings."""
-        if not config:
-            return
-        logger.info("Applying system configuration (%d keys)", len(config))
-        if self._dry_run:
-            for k, v in config.items():
-                logger.info("  %s = %s", k, v)
-            return
-        r = self.put("/configurations", json=config)
-        if r.status_code == 200:
-            logger.info("  System configuration updated")
-        else:
-            logger.warning("  Failed to update system config: %d %s", r.status_code, r.text)
+def collect_usage(client: HarborClient, report: UsageReport, projects: list[str] | None = None,
+                  workers: int = DEFAULT_WORKERS) -> UsageReport:
+    """Walk projects -> repositories -> artifacts with concurrent page requests.
+
+    Every page is an independent task: the first page of a listing reports
+    X-Total-Count and schedules the remaining pages, so large repositories
+    are fetched in parallel as well.  At most *workers* pages are in flight.
+    A page that fails is recorded in ``report.failures`` and the walk goes on.
+    """
+    names = projects if projects is not None else sorted(client.state.projects)
+
+    def repos_page(project: str, page: int) -> list[tuple]:
+        items, total = client.get_page(f"/projects/{quote(project, safe='')}/repositories", page)
+        report.add_repositories(project, items)
+        follow = [("art", project, repo["name"].split("/", 1)[-1], 1) for repo in items]
+        if page == 1:
+            follow += [("repo", project, p) for p in range(2, _pages(total) + 1)]
+        return follow
+
+    def artifacts_page(project: str, repo: str, page: int) -> list[tuple]:
+        # Repository names containing "/" must be double-encoded in the path.
+        path = (f"/projects/{quote(project, safe='')}/repositories/"
+                f"{quote(quote(repo, safe=''), safe='')}/artifacts")
+        items, total = client.get_page(path, page, {"with_tag": "true", "with_label": "false",
+                                                    "with_scan_overview": "false"})
+        report.add_artifacts(project, repo, items)
+        if page == 1:
+            return [("art", project, repo, p) for p in range(2, _pages(total) + 1)]
+        return []
+
+    def run(task: tuple) -> list[tuple]:
+        try:
+            if task[0] == "repo":
+                return repos_page(task[1], task[2])
+            return artifacts_page(task[1], task[2], task[3])
+        except (requests.RequestException, ValueError) as e:
+            project, repo = task[1], (task[2] if task[0] == "art" else None)
+            page = task[-1]
+            logger.warning("  Failed to list %s page %d: %s",
+                           f"{project}/{repo}" if repo else project, page, e)
+            report.add_failure(project, repo, page, str(e))
+            return []
+
+    pending = [("repo", name, 1) for name in names]
+    running: set[Future] = set()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while pending or running:
+            while pending and len(running) < workers:
+                running.add(pool.submit(run, pending.pop()))
+                report.requests += 1
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                pending.extend(fut.result())
+    return report
+
+
+def _pages(total: int) -> int:
+    return (total + PAGE_SIZE - 1) // PAGE_SIZE
+
+
+def print_report(report: UsageReport, wall: float) -> None:
+    projects = report.projects()
+    artifacts = sum(p["artifacts"] for p in projects)
+    logger.info("Usage: %d projects, %d repositories, %d artifacts, %s "
+                "(%d requests in %.1fs)",
+                len(projects), len(report.repos), artifacts,
+                _fmt_size(sum(p["size"] for p in projects)), report.requests, wall)
+
+    logger.info("")
+    logger.info("%-28s %6s %9s %11s %9s %11s %8s %11s", "PROJECT", "REPOS", "ARTIFACTS",
+                "SIZE", "PULLS", "LAST PULL", "STALE", "STALE SIZE")
+    for p in projects:
+        logger.info("%-28s %6d %9d %11s %9d %11s %8d %11s", p["project"][:28], p["repositories"],
+                    p["artifacts"], _fmt_size(p["size"]), p["pulls"], _fmt_time(p["last_pull"]),
+                    p["stale"], _fmt_size(p["stale_size"]))
+
+    logger.info("")
+    logger.info("Top %d repositories by size:", report.top)
+    for r in report.top_repositories():
+        logger.info("  %11s  %6d artifacts  last pull %-10s  %s/%s", _fmt_size(r["size"]),
+                    r["artifacts"], _fmt_time(r["last_pull"]), r["project"], r["repository"])
+
+    logger.info("")
+    logger.info("Stalest artifacts (unused since before %s):", _fmt_time(report.stale_before))
+    for a in report.stale_artifacts():
+        logger.info("  %11s  last used %-10s  %s/%s@%s %s", _fmt_size(a["size"]),
+                    _fmt_time(a["last_used"]), a["project"], a["repository"], a["digest"],
+                    a["tags"])
+
+    if report.failures:
+        logger.info("")
+        logger.warning("Incomplete: %d page request(s) failed, totals above are partial for:",
+                       len(report.failures))
+        for f in sorted(report.failures, key=lambda f: (f["project"], f["repository"] or "", f["page"])):
+            target = f"{f['project']}/{f['repository']}" if f["repository"] else f["project"]
+            logger.warning("  %s (page %d): %s", target, f["page"], f["error"])
 
 
 # ---------------------------------------------------------------------------
@@ -335,6 +1288,25 @@ def load_config() -> dict:
 def main():
     parser = argparse.ArgumentParser(description="Declarative Harbor configuration")
     parser.add_argument("--apply", action="store_true", help="Apply changes (default: dry-run)")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete registries, projects, robots and replication policies "
+                             "that are not in config.yaml")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Apply independent changes concurrently (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--continue-on-error", action="store_true",
+                        help="Keep applying independent changes after a failure "
+                             "(default: stop at the first failure)")
+    parser.add_argument("--report", action="store_true",
+                        help="Report artifact storage usage instead of planning changes")
+    parser.add_argument("--report-projects", nargs="+", metavar="PROJECT",
+                        help="Limit --report to these projects (default: all)")
+    parser.add_argument("--top", type=int, default=20,
+                        help="Entries in the --report top lists (default: 20)")
+    parser.add_argument("--stale-days", type=int, default=90,
+                        help="--report: artifacts not pulled for this many days are stale "
+                             "(default: 90)")
+    parser.add_argument("--report-json", metavar="FILE",
+                        help="--report: also write the report as JSON to FILE")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
     args = parser.parse_args()
 
@@ -353,48 +1325,40 @@ def main():
         sys.exit(1)
 
     config = load_config()
-    client = HarborClient(harbor_url, harbor_user, harbor_pass)
+    client = HarborClient(harbor_url, harbor_user, harbor_pass, pool_size=args.workers)
     client._dry_run = not args.apply
 
+    if args.report:
+        start = time.monotonic()
+        report = UsageReport(time.time() - args.stale_days * 86400, args.top)
+        collect_usage(client, report, args.report_projects, args.workers)
+        print_report(report, time.monotonic() - start)
+        if args.report_json:
+            with open(args.report_json, "w") as f:
+                json.dump(report.to_dict(), f, indent=2)
+        if report.failures:
+            sys.exit(1)
+        return
+
+    config_errors = check_tag_policies(config.get("projects") or [])
+    if config_errors:
+        for error in config_errors:
+            logger.error("config.yaml: %s", error)
+        sys.exit(1)
+
     mode = "APPLY" if args.apply else "DRY-RUN"
     logger.info("=== Harbor configuration [%s] ===", mode)
 
-    system = config.get("system", {})
-    registries = config.get("registries", [])
-    projects = config.get("projects", [])
-    robots = config.get("robot_accounts", [])
-    replications = config.get("replication", [])
-    total = sum(bool(v) for v in [system, registries, projects, robots, replications])
+    changes = plan(client, config, prune=args.prune)
+    print_plan(changes)
 
-    step = 0
-    if system:
-        step += 1
-        logger.info("[%d/%d] System settings", step, total)
-        client.update_system_config(system)
-
-    if registries:
-        step += 1
-        logger.info("[%d/%d] Registry endpoints (%d)", step, total, len(registries))
-        for reg in registries:
-            client.create_registry(reg)
-
-    if projects:
-        step += 1
-        logger.info("[%d/%d] Projects (%d)", step, total, len(projects))
-        for proj in projects:
-            client.create_project(proj)
-
-    if robots:
-        step += 1
-        logger.info("[%d/%d] Robot accounts (%d)", step, total, len(robots))
-        for robot in robots:
-            client.create_robot(robot)
-
-    if replications:
-        step += 1
-        logger.info("[%d/%d] Replication policies (%d)", step, total, len(replications))
-        for policy in replications:
-            client.create_replication_policy(policy)
+    if args.apply and changes:
+        logger.info("Applying %d change(s)", len(changes))
+        failed = apply_plan(client, changes, args.workers, args.continue_on_error)
+        if failed:
+            logger.error("%d change(s) failed or not applied", len(failed))
+            logger.info("=== Done [%s] ===", mode)
+            sys.exit(1)
 
     logger.info("=== Done [%s] ===", mode)
 
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+In-process stand-in for the Harbor REST API (v2.0).
+
+Implements just enough of Harbor for configure_harbor.py to run against it
+offline: registries, projects, robot accounts, replication policies and
+system configurations, CSRF tokens via /c/ctx, page/page_size pagination
+(X-Total-Count and Link headers) and 409 conflicts on duplicate names,
+plus tag retention policies and per-project tag immutability rules.
+Repositories and artifacts can be seeded with HarborData.add_artifacts()
+to exercise the --report usage crawler.
+Every request is counted so callers can measure how chatty a client is.
+
+Usage:
+    python harbor_standin.py                 # serve on 127.0.0.1:8080
+    python harbor_standin.py --port 9000 --latency 20
+
+From Python:
+    with HarborStandin() as harbor:
+        client = HarborClient(harbor.url, "admin", "Harbor12345")
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlparse
+
+API_BASE = "/api/v2.0"
+CSRF_TOKEN = "standin-csrf-token"
+
+# collection path -> (id field, name field in POST body, name field in resource)
+COLLECTIONS = {
+    "registries": ("id", "name", "name"),
+    "projects": ("project_id", "project_name", "name"),
+    "robots": ("id", "name", "name"),
+    "replication/policies": ("id", "name", "name"),
+}
+
+DEFAULT_CONFIG = {
+    "auth_mode": "db_auth",
+    "self_registration": True,
+    "project_creation_restriction": "everyone",
+    "read_only": False,
+    "robot_token_duration": 30,
+    "robot_name_prefix": "robot$",
+}
+
+_ROUTE = re.compile(r"^/api/v2\.0/(registries|projects|robots|replication/policies)(?:/(\d+))?/?$")
+_RETENTION = re.compile(r"^/api/v2\.0/retentions(?:/(\d+))?/?$")
+_IMMUTABLE = re.compile(r"^/api/v2\.0/projects/([^/]+)/immutabletagrules(?:/(\d+))?/?$")
+_REPOS = re.compile(r"^/api/v2\.0/projects/([^/]+)/repositories(?:/([^/]+)/artifacts)?/?$")
+
+
+# ---------------------------------------------------------------------------
+# State
+# ---------------------------------------------------------------------------
+
+class HarborData:
+    """Resources held by the stand-in, guarded by one lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.collections: dict[str, dict[int, dict]] = {c: {} for c in COLLECTIONS}
+        self.config = dict(DEFAULT_CONFIG)
+        self.retentions: dict[int, dict] = {}
+        # project name -> rule id -> immutable tag rule
+        self.immutable: dict[str, dict[int, dict]] = {}
+        # project name -> repository name (without project) -> artifacts
+        self.artifacts: dict[str, dict[str, list[dict]]] = {}
+        self.requests: Counter = Counter()      # (method, route) -> count
+        self.connections = 0
+
+    def count(self, method: str, path: str) -> None:
+        route = re.sub(r"/\d+(?=/|$)", "/{id}", path)
+        with self.lock:
+            self.requests[(method, route)] += 1
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.requests.clear()
+            self.connections = 0
+
+    def total_requests(self) -> int:
+        return sum(self.requests.values())
+
+    def by_method(self) -> dict[str, int]:
+        out: Counter = Counter()
+        for (method, _), n in self.requests.items():
+            out[method] += n
+        return dict(out)
+
+    def add_artifacts(self, project: str, repo: str, artifacts: list[dict]) -> None:
+        """Seed artifacts (``digest``, ``size``, ``push_time``, ``pull_time``, ``tags``)."""
+        with self.lock:
+            self.artifacts.setdefault(project, {}).setdefault(repo, []).extend(artifacts)
+
+    def repositories(self, project: str) -> list[dict]:
+        return [
+            {"name": f"{project}/{repo}", "artifact_count": len(arts),
+             "pull_count": sum(a.get("pull_count", 0) for a in arts)}
+            for repo, arts in self.artifacts.get(project, {}).items()
+        ]
+
+    # -- resource construction --
+
+    def new_resource(self, collection: str, body: dict, new_id: int) -> dict:
+        if collection == "projects":
+            return {
+                "project_id": new_id,
+                "name": body["project_name"],
+                "registry_id": body.get("registry_id"),
+                "metadata": {k: str(v).lower() for k, v in (body.get("metadata") or {}).items()},
+            }
+        if collection == "robots":
+            short = body["name"]
+            if body.get("level") == "project":
+                project = (body.get("permissions") or [{}])[0].get("namespace", "")
+                full = f"{self.config['robot_name_prefix']}{project}+{short}"
+            else:
+                full = f"{self.config['robot_name_prefix']}{short}"
+            robot = {k: v for k, v in body.items() if k != "secret"}
+            robot.update({"id": new_id, "name": full})
+            return robot
+        resource = dict(body)
+        resource["id"] = new_id
+        if collection == "registries":
+            cred = resource.get("credential") or {}
+            if cred.get("access_secret"):
+                resource["credential"] = {**cred, "access_secret": "*****"}
+        return resource
+
+    def name_taken(self, collection: str, name: str) -> bool:
+        field = COLLECTIONS[collection][2]
+        return any(r.get(field) == name for r in self.collections[collection].values())
+
+    def project_id_of(self, robot: dict) -> int | None:
+        if robot.get("level") != "project":
+            return None
+        namespace = (robot.get("permissions") or [{}])[0].get("namespace")
+        for p in self.collections["projects"].values():
+            if p["name"] == namespace:
+                return p["project_id"]
+        return None
+
+
+# ---------------------------------------------------------------------------
+# HTTP handler
+# ---------------------------------------------------------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send headers and body in one segment; avoids Nagle/delayed-ACK stalls
+    # on keep-alive connections that would otherwise dominate timings.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.data.lock:
+            self.server.data.connections += 1
+
+    # -- helpers --
+
+    def _send(self, status: int, body=None, headers: dict | None = None) -> None:
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status: int, code: str, message: str) -> None:
+        self._send(status, {"errors": [{"code": code, "message": message}]})
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def _begin(self, method: str) -> tuple[str, dict] | None:
+        """Count, delay and authorize the request; returns (path, query)."""
+        url = urlparse(self.path)
+        data = self.server.data
+        data.count(method, url.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if url.path.startswith(API_BASE) and not self.headers.get("Authorization"):
+            self._error(401, "UNAUTHORIZED", "unauthorized")
+            return None
+        if method != "GET" and self.headers.get("X-Harbor-CSRF-Token") != CSRF_TOKEN:
+            self._error(403, "FORBIDDEN", "CSRF token invalid")
+            return None
+        return url.path, {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+    # -- retention and immutability --
+
+    def _tag_policy(self, method: str, path: str, query: dict) -> bool:
+        """Serve /retentions and /projects/{name}/immutabletagrules; True if handled."""
+        data = self.server.data
+        m = _RETENTION.match(path)
+        if m:
+            rid = int(m.group(1)) if m.group(1) else None
+            with data.lock:
+                if method == "POST" and rid is None:
+                    body = self._body()
+                    pid = (body.get("scope") or {}).get("ref")
+                    project = data.collections["projects"].get(pid)
+                    if project is None:
+                        self._error(400, "BAD_REQUEST", "project not found")
+                        return True
+                    rid = next(data.ids)
+                    data.retentions[rid] = {**body, "id": rid}
+                    project["metadata"]["retention_id"] = str(rid)
+                    self._send(201, None, {"Location": f"{API_BASE}/retentions/{rid}"})
+                elif rid not in data.retentions:
+                    self._error(404, "NOT_FOUND", path)
+                elif method == "GET":
+                    self._send(200, data.retentions[rid])
+                elif method == "PUT":
+                    data.retentions[rid] = {**self._body(), "id": rid}
+                    self._send(200)
+                else:
+                    self._error(405, "METHOD_NOT_ALLOWED", path)
+            return True
+
+        m = _IMMUTABLE.match(path)
+        if not m:
+            return False
+        project, rid = unquote(m.group(1)), int(m.group(2)) if m.group(2) else None
+        with data.lock:
+            if not data.name_taken("projects", project):
+                self._error(404, "NOT_FOUND", f"project {project} not found")
+                return True
+            rules = data.immutable.setdefault(project, {})
+            if method == "GET" and rid is None:
+                items = list(rules.values())
+            elif method == "POST" and rid is None:
+                rid = next(data.ids)
+                rules[rid] = {**self._body(), "id": rid}
+                self._send(201, None, {"Location": f"{path.rstrip('/')}/{rid}"})
+                return True
+            elif rid not in rules:
+                self._error(404, "NOT_FOUND", path)
+                return True
+            elif method == "PUT":
+                rules[rid] = {**self._body(), "id": rid}
+                self._send(200)
+                return True
+            elif method == "DELETE":
+                del rules[rid]
+                self._send(200)
+                return True
+            else:
+                self._error(405, "METHOD_NOT_ALLOWED", path)
+                return True
+        self._send_page(path, query, items)
+        return True
+
+    # -- verbs --
+
+    def do_GET(self):
+        begun = self._begin("GET")
+        if begun is None:
+            return
+        path, query = begun
+        data = self.server.data
+        if self._tag_policy("GET", path, query):
+            return
+
+        if path == "/c/ctx":
+            return self._send(200, {}, {"X-Harbor-CSRF-Token": CSRF_TOKEN})
+        if path == f"{API_BASE}/configurations":
+            with data.lock:
+                body = {k: {"value": v, "editable": True} for k, v in data.config.items()}
+            return self._send(200, body)
+
+        m = _REPOS.match(path)
+        if m:
+            project, repo = unquote(m.group(1)), m.group(2)
+            with data.lock:
+                if repo is None:
+                    items = data.repositories(project)
+                else:
+                    items = data.artifacts.get(project, {}).get(unquote(unquote(repo)))
+            if items is None:
+                return self._error(404, "NOT_FOUND", path)
+            return self._send_page(path, query, items)
+
+        m = _ROUTE.match(path)
+        if not m:
+            return self._error(404, "NOT_FOUND", path)
+        collection, rid = m.group(1), m.group(2)
+        with data.lock:
+            items = list(data.collections[collection].values())
+            if rid is not None:
+                item = data.collections[collection].get(int(rid))
+            elif collection == "robots" and query.get("q"):
+                filters = dict(f.split("=", 1) for f in query["q"].split(",") if "=" in f)
+                if "ProjectID" in filters:
+                    pid = int(filters["ProjectID"])
+                    items = [r for r in items if data.project_id_of(r) == pid]
+                if "Level" in filters:
+                    items = [r for r in items if r.get("level") == filters["Level"]]
+        if rid is not None:
+            if item is None:
+                return self._error(404, "NOT_FOUND", f"{collection} {rid} not found")
+            return self._send(200, item)
+        self._send_page(path, query, items)
+
+    def _send_page(self, path: str, query: dict, items: list[dict]) -> None:
+        page = max(1, int(query.get("page", 1)))
+        size = max(1, int(query.get("page_size", 10)))
+        chunk = items[(page - 1) * size:page * size]
+        headers = {"X-Total-Count": str(len(items))}
+        if page * size < len(items):
+            nxt = {**query, "page": page + 1, "page_size": size}
+            headers["Link"] = f'<{path}?{urlencode(nxt)}>; rel="next"'
+        self._send(200, chunk, headers)
+
+    def do_POST(self):
+        begun = self._begin("POST")
+        if begun is None:
+            return
+        path, _ = begun
+        if self._tag_policy("POST", path, {}):
+            return
+        m = _ROUTE.match(path)
+        if not m or m.group(2):
+            return self._error(404, "NOT_FOUND", path)
+        collection = m.group(1)
+        body = self._body()
+        data = self.server.data
+        name_field = COLLECTIONS[collection][1]
+        if not body.get(name_field):
+            return self._error(400, "BAD_REQUEST", f"{name_field} is required")
+
+        with data.lock:
+            resource = data.new_resource(collection, body, 0)
+            if data.name_taken(collection, resource["name"]):
+                return self._error(409, "CONFLICT", f"{collection} {resource['name']} already exists")
+            if collection == "projects" and body.get("registry_id") is not None \
+                    and body["registry_id"] not in data.collections["registries"]:
+                return self._error(400, "BAD_REQUEST", "registry not found")
+            new_id = next(data.ids)
+            resource[COLLECTIONS[collection][0]] = new_id
+            data.collections[collection][new_id] = resource
+
+        headers = {"Location": f"{API_BASE}/{collection}/{new_id}"}
+        if collection == "robots":
+            secret = body.get("secret") or f"secret-{new_id}"
+            return self._send(201, {"id": new_id, "name": resource["name"], "secret": secret}, headers)
+        self._send(201, None, headers)
+
+    def do_PUT(self):
+        begun = self._begin("PUT")
+        if begun is None:
+            return
+        path, _ = begun
+        if self._tag_policy("PUT", path, {}):
+            return
+        body = self._body()
+        data = self.server.data
+
+        if path == f"{API_BASE}/configurations":
+            with data.lock:
+                data.config.update(body)
+            return self._send(200)
+
+        m = _ROUTE.match(path)
+        if not m or not m.group(2):
+            return self._error(404, "NOT_FOUND", path)
+        collection, rid = m.group(1), int(m.group(2))
+        with data.lock:
+            resource = data.collections[collection].get(rid)
+            if resource is None:
+                return self._error(404, "NOT_FOUND", f"{collection} {rid} not found")
+            if collection == "projects":
+                resource["metadata"].update(
+                    {k: str(v).lower() for k, v in (body.get("metadata") or {}).items()})
+            elif collection == "robots":
+                if body.get("name") not in (None, resource["name"]):
+                    return self._error(400, "BAD_REQUEST", "cannot update the name of robot")
+                resource.update({k: v for k, v in body.items() if k != "secret"})
+            else:
+                resource.update(body)
+        self._send(200)
+
+    def do_DELETE(self):
+        begun = self._begin("DELETE")
+        if begun is None:
+            return
+        path, _ = begun
+        if self._tag_policy("DELETE", path, {}):
+            return
+        m = _ROUTE.match(path)
+        if not m or not m.group(2):
+            return self._error(404, "NOT_FOUND", path)
+        collection, rid = m.group(1), int(m.group(2))
+        with self.server.data.lock:
+            if self.server.data.collections[collection].pop(rid, None) is None:
+                return self._error(404, "NOT_FOUND", f"{collection} {rid} not found")
+        self._send(200)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, data: HarborData, latency: float):
+        super().__init__(address, _Handler)
+        self.data = data
+        self.latency = latency
+
+
+# ---------------------------------------------------------------------------
+# Public wrapper
+# ---------------------------------------------------------------------------
+
+class HarborStandin:
+    """Harbor stand-in served from a background thread.
+
+    *latency* (seconds) is added to every request to mimic a remote Harbor.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.data = HarborData()
+        self._server = _Server((host, port), self.data, latency)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "HarborStandin":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "HarborStandin":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Harbor API stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, metavar="MS",
+                        help="Delay added to every request, in milliseconds")
+    args = parser.parse_args()
+
+    server = _Server((args.host, args.port), HarborData(), args.latency / 1000)
+    print(f"Harbor stand-in listening on http://{args.host}:{args.port} (any credentials)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""Estimate what each Argo CD application will have to sync for a change.
+
+Argo CD gets stuck processing apps whose sync is large (see
+docs/260215-argo-cd-stuck-processing.md), and nothing in review shows how
+much a change to values or a chart bump actually moves. This script renders
+every application of production/argo-cd/resources/apps.yaml at a base and a
+head revision, through the pre-commit render path (kustomize_render.py, so
+unchanged apps come from the render cache and identical inputs are never
+rendered twice). It then compares the two object sets by their hashed
+identity index:
+
+    added / changed / removed objects, bytes to apply, CRDs among them
+
+Objects are keyed by group, kind, namespace and name and hashed over their
+canonical JSON, so reordering or reformatting alone costs nothing.
+
+Usage:
+    scripts/argo-sync-cost.py                          # working tree vs HEAD
+    scripts/argo-sync-cost.py --base origin/main --head HEAD
+    scripts/argo-sync-cost.py --all --json             # include unchanged apps
+    scripts/argo-sync-cost.py --max-bytes 2000000      # exit 1 above 2 MB
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import io
+import json
+import subprocess
+import sys
+import tarfile
+import tempfile
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import yaml
+except ImportError:
+    raise SystemExit("Error: PyYAML not installed. Install with: pip install pyyaml")
+
+# Allow importing sibling module without package setup
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from kustomize_render import CACHE_DIR, Renderer
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+APPS_FILE = Path("production") / "argo-cd" / "resources" / "apps.yaml"
+
+_YAML_LOADER = yaml.CSafeLoader if hasattr(yaml, "CSafeLoader") else yaml.SafeLoader
+
+# Identity -> (sha256 of canonical JSON, bytes, is CRD)
+ObjectIndex = Dict[Tuple[str, str, str, str], Tuple[str, int, bool]]
+
+
+@dataclass
+class Application:
+    name: str
+    path: str
+    prune: bool = False
+
+
+@dataclass
+class SyncCost:
+    """Object-level difference of one application between base and head."""
+    app: str
+    path: str
+    objects: int = 0
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    apply_bytes: int = 0
+    removed_bytes: int = 0
+    crds: int = 0
+    prune: bool = False
+    error: str = ""
+    details: List[str] = field(default_factory=list)
+
+
+# ---------------------------------------------------------------------------
+# Applications
+# ---------------------------------------------------------------------------
+
+def _prune(spec: dict) -> bool:
+    automated = ((spec or {}).get("syncPolicy") or {}).get("automated")
+    return isinstance(automated, dict) and bool(automated.get("prune"))
+
+
+def list_applications(root: Path) -> List[Application]:
+    """Applications declared in apps.yaml, as checked out under *root*.
+
+    Git directory generators of ApplicationSets are expanded against the
+    tree (``{{path.basename}}`` naming, ``exclude`` entries honoured);
+    plain Applications pointing into the repo are taken as they are.
+    """
+    apps: Dict[str, Application] = {}
+    try:
+        with open(root / APPS_FILE) as f:
+            docs = [d for d in yaml.load_all(f, Loader=_YAML_LOADER) if isinstance(d, dict)]
+    except FileNotFoundError:
+        return []
+    for doc in docs:
+        spec = doc.get("spec") or {}
+        if doc.get("kind") == "Application":
+            path = ((spec.get("source") or {}).get("path"))
+            if path:
+                name = (doc.get("metadata") or {}).get("name", Path(path).name)
+                apps[path] = Application(name, path, _prune(spec))
+        elif doc.get("kind") == "ApplicationSet":
+            prune = _prune((spec.get("template") or {}).get("spec"))
+            for generator in spec.get("generators") or []:
+                entries = ((generator or {}).get("git") or {}).get("directories") or []
+                include = [e["path"] for e in entries if not e.get("exclude")]
+                exclude = [e["path"] for e in entries if e.get("exclude")]
+                for pattern in include:
+                    for directory in sorted(root.glob(pattern)):
+                        path = directory.relative_to(root).as_posix()
+                        if directory.is_dir() and not any(fnmatch.fnmatch(path, x) for x in exclude):
+                            apps[path] = Application(directory.name, path, prune)
+    return sorted(apps.values(), key=lambda a: a.path)
+
+
+# ---------------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------------
+
+def git(*args: str, binary: bool = False) -> Any:
+    result = subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True,
+                            text=not binary, check=False)
+    if result.returncode != 0:
+        err = result.stderr.decode() if binary else result.stderr
+        raise SystemExit(f"git {' '.join(args)}: {err.strip()}")
+    return result.stdout
+
+
+def checkout(rev: str, into: Path) -> Path:
+    """Extract the tree of *rev* (no .git, no worktree bookkeeping)."""
+    commit = git("rev-parse", "--verify", f"{rev}^{{commit}}").strip()
+    with tarfile.open(fileobj=io.BytesIO(git("archive", commit, binary=True))) as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(into, filter="data")
+        else:
+            tar.extractall(into)
+    return into
+
+
+def _kustomization(directory: Path) -> bool:
+    return any((directory / n).is_file()
+               for n in ("kustomization.yaml", "kustomization.yml", "Kustomization"))
+
+
+def plain_directory(directory: Path) -> str:
+    """What Argo CD applies for a directory source without kustomization."""
+    parts = []
+    for path in sorted(directory.iterdir()):
+        if path.suffix in (".yaml", ".yml", ".json") and path.is_file():
+            parts.append(path.read_text())
+    return "\n---\n".join(parts)
+
+
+def index_objects(manifests: str) -> ObjectIndex:
+    """Hash every object of *manifests* under its identity."""
+    index: ObjectIndex = {}
+    for obj in yaml.load_all(manifests, Loader=_YAML_LOADER):
+        if not isinstance(obj, dict):
+            continue
+        meta = obj.get("metadata") or {}
+        group = str(obj.get("apiVersion", "")).rpartition("/")[0]
+        identity = (group, str(obj.get("kind", "")), str(meta.get("namespace", "")),
+                    str(meta.get("name", "")))
+        canonical = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode()
+        index[identity] = (hashlib.sha256(canonical).hexdigest(), len(canonical),
+                           obj.get("kind") == "CustomResourceDefinition")
+    return index
+
+
+def _identity(key: Tuple[str, str, str, str]) -> str:
+    group, kind, namespace, name = key
+    kind = f"{kind}.{group}" if group else kind
+    return f"{kind} {namespace}/{name}" if namespace else f"{kind} {name}"
+
+
+def diff(base: ObjectIndex, head: ObjectIndex, cost: SyncCost) -> SyncCost:
+    cost.objects = len(head)
+    for key, (digest, size, crd) in head.items():
+        before = base.get(key)
+        if before is None:
+            cost.added += 1
+            cost.details.append(f"+ {_identity(key)} ({size} B)")
+        elif before[0] != digest:
+            cost.changed += 1
+            cost.details.append(f"~ {_identity(key)} ({size} B)")
+        else:
+            cost.unchanged += 1
+            continue
+        cost.apply_bytes += size
+        cost.crds += crd
+    for key, (_, size, crd) in base.items():
+        if key not in head:
+            cost.removed += 1
+            cost.removed_bytes += size
+            cost.crds += crd
+            cost.details.append(f"- {_identity(key)}")
+    cost.details.sort(key=lambda d: (d[2:], d[0]))
+    return cost
+
+
+def estimate(apps: Dict[str, Application], base_root: Path, head_root: Path,
+             use_cache: bool, include_unchanged: bool) -> List[SyncCost]:
+    """Sync cost of every app present at base or head."""
+    cache_dir = CACHE_DIR if use_cache else None
+    with Renderer(cache_dir=cache_dir, root=base_root) as base_renderer, \
+            Renderer(cache_dir=cache_dir, root=head_root) as head_renderer:
+        jobs = {}
+        costs = []
+        for path, app in sorted(apps.items()):
+            cost = SyncCost(app.name, path, prune=app.prune)
+            sides = []
+            for renderer, root in ((base_renderer, base_root), (head_renderer, head_root)):
+                directory = root / path
+                if not directory.is_dir():
+                    sides.append(None)
+                elif _kustomization(directory):
+                    sides.append(renderer)
+                else:
+                    sides.append(plain_directory(directory))
+            # Same inputs render the same: render (or fetch from cache) once
+            if (isinstance(sides[0], Renderer) and isinstance(sides[1], Renderer)
+                    and base_renderer.key(base_root / path) == head_renderer.key(head_root / path)):
+                if include_unchanged:
+                    future = head_renderer.submit(head_root / path)
+                    jobs[path] = (cost, [future, future])
+                continue
+            futures = []
+            for side, root in zip(sides, (base_root, head_root)):
+                futures.append(side.submit(root / path) if isinstance(side, Renderer) else side)
+            jobs[path] = (cost, futures)
+
+        for path, (cost, futures) in jobs.items():
+            indexes = []
+            for side, label in zip(futures, ("base", "head")):
+                if side is None:
+                    indexes.append({})
+                    continue
+                if isinstance(side, str):
+                    manifests = side
+                else:
+                    result = side.result()
+                    if not result.ok:
+                        cost.error = f"{label} render failed: {result.error.strip()}"
+                        break
+                    manifests = result.output
+                try:
+                    indexes.append(index_objects(manifests))
+                except yaml.YAMLError as e:
+                    cost.error = f"{label} output does not parse: {e}"
+                    break
+            if not cost.error:
+                diff(indexes[0], indexes[1], cost)
+                if not (cost.added or cost.changed or cost.removed) and not include_unchanged:
+                    continue
+            costs.append(cost)
+    return costs
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _size(n: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024 or unit == "MiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return str(n)
+
+
+def print_report(costs: List[SyncCost], max_bytes: Optional[int], verbose: bool) -> None:
+    if not costs:
+        print("No application changes")
+        return
+    costs = sorted(costs, key=lambda c: (-c.apply_bytes, c.app))
+    print(f"{'APPLICATION':<28} {'OBJECTS':>7} {'ADDED':>6} {'CHANGED':>7} {'REMOVED':>7} "
+          f"{'CRDS':>5} {'APPLY':>10}")
+    for c in costs:
+        if c.error:
+            print(f"{c.app:<28} ERROR: {c.error.splitlines()[0]}")
+            continue
+        flags = []
+        if max_bytes is not None and c.apply_bytes > max_bytes:
+            flags.append("HEAVY")
+        if c.crds:
+            flags.append("CRD")
+        if c.removed and not c.prune:
+            flags.append("no-prune")
+        print(f"{c.app:<28} {c.objects:>7} {c.added:>6} {c.changed:>7} {c.removed:>7} "
+              f"{c.crds:>5} {_size(c.apply_bytes):>10}"
+              + (f"  {' '.join(flags)}" if flags else ""))
+        if verbose:
+            for line in c.details:
+                print(f"    {line}")
+    total = sum(c.apply_bytes for c in costs)
+    print(f"\n{len(costs)} application(s), {_size(total)} to apply")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Estimate per-application Argo CD sync size between two revisions."
+    )
+    parser.add_argument("--base", default="HEAD", metavar="REV",
+                        help="Revision Argo CD is synced to now (default: HEAD)")
+    parser.add_argument("--head", metavar="REV",
+                        help="Revision to compare (default: the working tree)")
+    parser.add_argument("--app", action="append", metavar="NAME",
+                        help="Only these applications, repeatable")
+    parser.add_argument("--all", action="store_true", help="List unchanged applications too")
+    parser.add_argument("--max-bytes", type=int, metavar="N",
+                        help="Flag apps applying more than N bytes and exit 1 if any does")
+    parser.add_argument("--no-render-cache", action="store_true",
+                        help="Always run kustomize, ignoring cached renders")
+    parser.add_argument("-v", "--verbose", action="store_true", help="List changed objects")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable output")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="argo-sync-cost-") as tmp:
+        base_root = checkout(args.base, Path(tmp) / "base")
+        head_root = checkout(args.head, Path(tmp) / "head") if args.head else REPO_ROOT
+        apps = {}
+        for root in (base_root, head_root):
+            for app in list_applications(root):
+                # head's settings win for apps present in both
+                apps[app.path] = app
+        if args.app:
+            apps = {p: a for p, a in apps.items() if a.name in args.app}
+        costs = estimate(apps, base_root, head_root, not args.no_render_cache, args.all)
+
+    if args.json:
+        print(json.dumps([asdict(c) for c in costs], indent=2))
+    else:
+        print_report(costs, args.max_bytes, args.verbose)
+    if any(c.error for c in costs):
+        return 1
+    if args.max_bytes is not None and any(c.apply_bytes > args.max_bytes for c in costs):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
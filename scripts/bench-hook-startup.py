@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Check that the local pre-commit hooks start fast.
+
+The hooks in .pre-commit-config.yaml run on every commit, and most commits
+leave them nothing to check once their file filters are applied. This
+script runs each hook in a fresh interpreter on such a file list and
+compares its best wall time with that of an empty interpreter
+(``python -c pass``); the difference is the hook's startup cost and must
+stay within the budget. When a hook is over budget, its slowest imports
+(from ``python -X importtime``) are listed, which is usually where a new
+top-level import crept in.
+
+Usage:
+    scripts/bench-hook-startup.py                  # exit 1 if over budget
+    scripts/bench-hook-startup.py --runs 30 --budget-ms 40
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS = Path(__file__).resolve().parent
+
+# Startup cost over an empty interpreter allowed for a hook with nothing to do
+BUDGET_MS = 25.0
+
+# A file every hook filters out, so only startup is measured
+NOOP_FILES = ["README.md"]
+
+HOOKS = [
+    ("gitops-checks", [str(SCRIPTS / "run-hooks.py")] + NOOP_FILES),
+    # Still usable on their own
+    ("check-secrets", [str(SCRIPTS / "check-secrets.py")] + NOOP_FILES),
+    ("kustomize-helm-check", [str(SCRIPTS / "pre-commit-check.py")] + NOOP_FILES),
+]
+
+
+def time_command(args: List[str], runs: int) -> float:
+    """Fastest wall time of ``python args`` in milliseconds (least noisy)."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=REPO_ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+
+def slowest_imports(args: List[str], top: int = 10) -> List[Tuple[int, str]]:
+    """Top-level imports of ``python args`` by cumulative microseconds."""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=False)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        # Nested imports are indented; their cost is part of their parent's
+        if name.startswith("  ") or name.strip() in ("site", "encodings"):
+            continue
+        imports.append((int(fields[1]), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the startup time of the pre-commit hooks.")
+    parser.add_argument("--runs", type=int, default=15,
+                        help="Runs per command, the fastest is used (default: 15)")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS,
+                        help=f"Allowed startup cost over `python -c pass` (default: {BUDGET_MS:g})")
+    args = parser.parse_args()
+
+    # Warm the page cache so the first hook is not charged for it
+    time_command(["-c", "pass"], 2)
+    baseline = time_command(["-c", "pass"], args.runs)
+    print(f"{'interpreter':<24} {baseline:7.1f} ms")
+
+    failed = False
+    for name, hook_args in HOOKS:
+        elapsed = time_command(hook_args, args.runs)
+        cost = elapsed - baseline
+        over = cost > args.budget_ms
+        print(f"{name:<24} {elapsed:7.1f} ms  (+{cost:.1f} ms)"
+              + ("  OVER BUDGET" if over else ""))
+        if over:
+            failed = True
+            for usec, module in slowest_imports(hook_args):
+                print(f"    {usec / 1000:7.1f} ms  {module}")
+
+    print(f"\n{'FAILED' if failed else 'PASSED'} - budget {args.budget_ms:g} ms per hook")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
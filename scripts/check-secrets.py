@@ -16,16 +16,12 @@ Without files: checks all YAML files in production/dev directories
 
 import os
 import sys
-import yaml
-import argparse
 from pathlib import Path
-import subprocess
 
-try:
-    import yaml
-except ImportError:
-    print("Error: PyYAML not installed. Install with: pip install pyyaml")
-    sys.exit(1)
+# yaml, subprocess and argparse are imported where they are first needed: this
+# hook runs on every commit and usually has no file left after filtering, so
+# that path must stay close to bare interpreter startup (see
+# bench-hook-startup.py).
 
 
 class SecretChecker:
@@ -43,6 +39,7 @@ class SecretChecker:
 
     def run_command(self, cmd: list, timeout: int = 30) -> tuple:
         """Run shell command. Returns (returncode, stdout, stderr)."""
+        import subprocess
         try:
             result = subprocess.run(
                 cmd, capture_output=True, text=True, timeout=timeout, check=False
@@ -80,8 +77,15 @@ class SecretChecker:
         self.fixes.append(f"  {filepath} -> {sealed_filepath}")
         return True
 
-    def check_file(self, filepath: Path, repo_root: Path) -> bool:
-        """Check a single YAML file. Returns True if passed."""
+    def check_file(self, filepath: Path, repo_root: Path, docs: list = None) -> bool:
+        """Check a single YAML file. Returns True if passed.
+
+        *docs* are the file's documents when the caller has parsed it already
+        (run-hooks.py shares one parse between checks); otherwise the file is
+        read and parsed here.
+        """
+        import yaml
+
         # Skip sealed secrets
         if 'sealedsecret' in filepath.name.lower():
             return True
@@ -94,41 +98,42 @@ class SecretChecker:
         passed = True
 
         try:
-            with open(filepath, 'r') as f:
-                # Handle multi-document YAML files
-                try:
-                    docs = list(yaml.safe_load_all(f))
-                except yaml.YAMLError as e:
-                    self.errors.append(f"  {rel_path}: YAML parse error: {e}")
-                    return False
-
-                for doc_idx, doc in enumerate(docs):
-                    if doc is None:
-                        continue
-
-                    if doc.get('kind') != 'Secret':
-                        continue
-
-                    name = doc.get('metadata', {}).get('name', 'unknown')
-                    secret_type = doc.get('type', '')
-                    namespace = doc.get('metadata', {}).get('namespace', '')
-
-                    # Check if this is a safe secret type
-                    if secret_type in self.SAFE_SECRET_TYPES:
-                        continue
-
-                    # Found a plaintext secret
-                    passed = False
-                    type_str = f" (type: {secret_type})" if secret_type else ""
-                    ns_str = f" in namespace {namespace}" if namespace else ""
-                    self.errors.append(
-                        f"  {rel_path}: Plaintext secret '{name}'{ns_str}{type_str}"
-                    )
-
-                    # Try to auto-seal if enabled
-                    if self.auto_fix and secret_type not in self.SAFE_SECRET_TYPES:
-                        if self.seal_secret(filepath):
-                            self.errors[-1] += " -> SEALED"
+            if docs is None:
+                with open(filepath, 'r') as f:
+                    # Handle multi-document YAML files
+                    try:
+                        docs = list(yaml.safe_load_all(f))
+                    except yaml.YAMLError as e:
+                        self.errors.append(f"  {rel_path}: YAML parse error: {e}")
+                        return False
+
+            for doc_idx, doc in enumerate(docs):
+                if doc is None:
+                    continue
+
+                if doc.get('kind') != 'Secret':
+                    continue
+
+                name = doc.get('metadata', {}).get('name', 'unknown')
+                secret_type = doc.get('type', '')
+                namespace = doc.get('metadata', {}).get('namespace', '')
+
+                # Check if this is a safe secret type
+                if secret_type in self.SAFE_SECRET_TYPES:
+                    continue
+
+                # Found a plaintext secret
+                passed = False
+                type_str = f" (type: {secret_type})" if secret_type else ""
+                ns_str = f" in namespace {namespace}" if namespace else ""
+                self.errors.append(
+                    f"  {rel_path}: Plaintext secret '{name}'{ns_str}{type_str}"
+                )
+
+                # Try to auto-seal if enabled
+                if self.auto_fix and secret_type not in self.SAFE_SECRET_TYPES:
+                    if self.seal_secret(filepath):
+                        self.errors[-1] += " -> SEALED"
 
         except FileNotFoundError:
             self.errors.append(f"  {rel_path}: File not found")
@@ -186,6 +191,12 @@ class SecretChecker:
             print("No YAML files to check")
             return 0
 
+        try:
+            import yaml  # noqa: F401
+        except ImportError:
+            print("Error: PyYAML not installed. Install with: pip install pyyaml")
+            return 1
+
         print(f"Checking {len(files_to_check)} YAML files for plaintext secrets...")
 
         # Check each file
@@ -216,6 +227,7 @@ class SecretChecker:
 
 def main():
     """Main entry point."""
+    import argparse
     parser = argparse.ArgumentParser(
         description="Check for plaintext secrets in YAML files (pre-commit integration)"
     )
@@ -5,30 +5,51 @@ This is a read-only notification tool — it never modifies repository files.
 """
 
 import argparse
+import ctypes
+import ctypes.util
+import json
+import os
 import re
+import select
+import struct
 import sys
+import threading
+import time
 import urllib.error
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 # Allow importing sibling module without package setup
 sys.path.insert(0, str(Path(__file__).resolve().parent))
 from version_utils import (
     HARBOR_PREFIX,
+    ItemRecord,
+    RequestRecorder,
     VersionCache,
     VersionCandidates,
+    export_otlp_spans,
+    export_snapshot,
     get_latest_github_release_version,
     get_latest_helm_version_http,
     get_latest_helm_version_oci,
     get_latest_image_tag,
+    harbor_base_url,
     has_non_semver_suffix,
+    import_snapshot,
     load_yaml,
     parse_image_ref,
     parse_semver,
+    record_item,
+    set_harbor_lookup,
+    set_offline,
+    set_recorder,
     sort_semver_tags,
     strip_harbor_prefix,
+    summarize_requests,
 )
 
 # ---------------------------------------------------------------------------
@@ -139,9 +160,10 @@ def _skip_path(p: Path) -> bool:
 # Helm chart scanner
 # ---------------------------------------------------------------------------
 
-def scan_helm_charts(repo_root: Path) -> List[HelmItem]:
+def scan_helm_charts(repo_root: Path,
+                     app_dirs: Optional[List[Path]] = None) -> List[HelmItem]:
     items: List[HelmItem] = []
-    for app_dir in _app_dirs(repo_root):
+    for app_dir in _app_dirs(repo_root) if app_dirs is None else app_dirs:
         app_name = str(app_dir.relative_to(repo_root))
         data = load_yaml(app_dir / "kustomization.yaml")
         if not data:
@@ -172,9 +194,10 @@ _GITHUB_RELEASE_RE = re.compile(
 )
 
 
-def scan_github_release_resources(repo_root: Path) -> List[GitHubReleaseItem]:
+def scan_github_release_resources(repo_root: Path,
+                                  app_dirs: Optional[List[Path]] = None) -> List[GitHubReleaseItem]:
     items: List[GitHubReleaseItem] = []
-    for app_dir in _app_dirs(repo_root):
+    for app_dir in _app_dirs(repo_root) if app_dirs is None else app_dirs:
         app_name = str(app_dir.relative_to(repo_root))
         kustomization = app_dir / "kustomization.yaml"
         data = load_yaml(kustomization)
@@ -235,9 +258,10 @@ def _walk_values_node(node, refs: List[Tuple[str, Optional[str]]]) -> None:
                     _walk_values_node(item, refs)
 
 
-def scan_values_images(repo_root: Path) -> List[ImageItem]:
+def scan_values_images(repo_root: Path,
+                       app_dirs: Optional[List[Path]] = None) -> List[ImageItem]:
     items: List[ImageItem] = []
-    for app_dir in _app_dirs(repo_root):
+    for app_dir in _app_dirs(repo_root) if app_dirs is None else app_dirs:
         app_name = str(app_dir.relative_to(repo_root))
         values_dir = app_dir / "values"
         if not values_dir.is_dir():
@@ -292,9 +316,10 @@ def _walk_resource_node(node, refs: List[str]) -> None:
                         _walk_resource_node(item, refs)
 
 
-def scan_resource_images(repo_root: Path) -> List[ImageItem]:
+def scan_resource_images(repo_root: Path,
+                         app_dirs: Optional[List[Path]] = None) -> List[ImageItem]:
     items: List[ImageItem] = []
-    for app_dir in _app_dirs(repo_root):
+    for app_dir in _app_dirs(repo_root) if app_dirs is None else app_dirs:
         app_name = str(app_dir.relative_to(repo_root))
         res_dir = app_dir / "resources"
         if not res_dir.is_dir():
@@ -443,6 +468,408 @@ def _query_image(item: ImageItem, cache: VersionCache) -> Tuple[Optional[Update]
         return None, str(e)
 
 
+def _timed_query(category: str, label: str,
+                 query: Callable[..., Tuple[Optional[Update], Optional[str]]],
+                 item, cache: VersionCache) -> Tuple[Optional[Update], Optional[str], Optional[ItemRecord]]:
+    """Run *query* for *item*, timing it as one item on the active recorder.
+
+    Returns *(update, error, item_record)*; *item_record* is ``None`` when no
+    recorder is installed.
+    """
+    with record_item(category, label) as rec:
+        upd, error = query(item, cache)
+    return upd, error, rec
+
+
+def _cache_status(rec: Optional[ItemRecord], error: Optional[str] = None) -> str:
+    """How the item's value was obtained.
+
+    ``miss`` when it needed a network request, ``hit`` when it was answered
+    from the cache, ``error`` when the lookup failed without either (e.g.
+    skipped offline), and ``unknown`` without a recorder or any lookup.
+    """
+    if rec is None:
+        return "unknown"
+    if rec.requests:
+        return "miss"
+    if error:
+        return "error"
+    return "hit" if rec.cache_hits else "unknown"
+
+
+def _item_fields(category: str, item) -> Tuple[str, str, str]:
+    """Return *(name, current_version, source_file)* for any scanned item."""
+    if category == "helm":
+        return item.chart_name, item.current_version, f"{item.app_name}/kustomization.yaml"
+    if category == "github":
+        return item.owner_repo, item.current_tag, item.source_file
+    return item.image_ref, item.current_tag, item.source_file
+
+
+def _result_record(category: str, item, upd: Optional[Update], error: Optional[str],
+                   rec: Optional[ItemRecord]) -> Dict:
+    """Build one ``--format jsonl`` result record."""
+    name, current, source_file = _item_fields(category, item)
+    record: Dict = {
+        "type": "result",
+        "category": category,
+        "app": item.app_name,
+        "name": name,
+        "current": current,
+        "source_file": source_file,
+        "status": "error" if error else ("update" if upd else "ok"),
+    }
+    if upd:
+        record["current_date"] = upd.current_date or None
+        record["candidates"] = [{"version": v, "date": d or None} for v, d in upd.candidates]
+        record["non_semver"] = upd.non_semver
+    if error:
+        record["error"] = error
+    if rec is not None:
+        record["latency_s"] = round(rec.latency, 4)
+        record["requests"] = rec.requests
+    record["cache"] = _cache_status(rec, error)
+    return record
+
+
+def _emit_jsonl(record: Dict) -> None:
+    print(json.dumps(record, separators=(",", ":")), flush=True)
+
+
+# ---------------------------------------------------------------------------
+# Watch mode
+# ---------------------------------------------------------------------------
+
+# Per-source cache lifetimes (seconds) for --watch; override with --ttl.
+DEFAULT_TTLS = {
+    "helm_index": 6 * 3600,
+    "oci_tags": 6 * 3600,
+    "oci_created": 7 * 86400,
+    "image_tags": 6 * 3600,
+    "harbor_tags": 6 * 3600,
+    "github_releases": 3600,
+}
+
+_QUERIES = {"helm": _query_helm, "github": _query_github, "image": _query_image}
+
+
+class _DirWatcher:
+    """Report paths changed under *roots*.
+
+    Uses inotify through ctypes on Linux and falls back to polling file
+    modification times elsewhere.  Directories in SKIP_DIRS are ignored.
+    A root that is missing is picked up once it appears, and when the
+    inotify queue overflows the roots themselves are reported, meaning
+    "anything below may have changed".
+    """
+
+    _IN_MODIFY = 0x002
+    _IN_CLOSE_WRITE = 0x008
+    _IN_MOVED_FROM = 0x040
+    _IN_MOVED_TO = 0x080
+    _IN_CREATE = 0x100
+    _IN_DELETE = 0x200
+    _IN_Q_OVERFLOW = 0x4000
+    _IN_IGNORED = 0x8000
+    _IN_ISDIR = 0x40000000
+    _MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, roots: List[Path]) -> None:
+        self._roots = list(roots)
+        self._watched: Set[Path] = set()
+        self._fd = -1
+        self._wds: Dict[int, Path] = {}
+        self._mtimes: Dict[Path, float] = {}
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            self._fd = -1
+        if self._fd >= 0:
+            self._watch_new_roots()
+        else:
+            self._mtimes = self._snapshot()
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._fd >= 0 else "polling"
+
+    def _walk(self, root: Path):
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith(".")]
+            yield Path(dirpath), filenames
+
+    def _watch_tree(self, root: Path) -> None:
+        for dirpath, _ in self._walk(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), self._MASK)
+            if wd >= 0:
+                self._wds[wd] = dirpath
+
+    def _watch_new_roots(self) -> Set[Path]:
+        """Start watching roots that exist now but were not watched yet."""
+        new = {r for r in self._roots if r not in self._watched and r.is_dir()}
+        for root in new:
+            self._watch_tree(root)
+        self._watched |= new
+        return new
+
+    def _snapshot(self) -> Dict[Path, float]:
+        mtimes: Dict[Path, float] = {}
+        for root in self._roots:
+            if not root.is_dir():
+                continue
+            for dirpath, filenames in self._walk(root):
+                for name in filenames:
+                    try:
+                        mtimes[dirpath / name] = (dirpath / name).stat().st_mtime
+                    except OSError:
+                        pass
+        return mtimes
+
+    def poll(self, timeout: float) -> Set[Path]:
+        """Wait up to *timeout* seconds and return the paths that changed."""
+        if self._fd < 0:
+            time.sleep(timeout)
+            current = self._snapshot()
+            changed = {p for p in current.keys() | self._mtimes.keys()
+                       if current.get(p) != self._mtimes.get(p)}
+            self._mtimes = current
+            return changed
+
+        changed = self._watch_new_roots()
+        ready, _, _ = select.select([self._fd], [], [], 0 if changed else timeout)
+        if not ready:
+            return changed
+        while True:
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _cookie, length = self._EVENT.unpack_from(buf, offset)
+                name = buf[offset + self._EVENT.size:offset + self._EVENT.size + length].rstrip(b"\0")
+                offset += self._EVENT.size + length
+                if mask & self._IN_Q_OVERFLOW:
+                    # Events were dropped (wd is -1): rescan everything
+                    changed.update(self._watched)
+                    continue
+                base = self._wds.get(wd)
+                if base is None:
+                    continue
+                if mask & self._IN_IGNORED:
+                    self._wds.pop(wd, None)
+                    continue
+                path = base / os.fsdecode(name) if name else base
+                if mask & self._IN_ISDIR and mask & (self._IN_CREATE | self._IN_MOVED_TO):
+                    self._watch_tree(path)
+                changed.add(path)
+        return changed
+
+
+def _scan_apps(repo_root: Path, app_dirs: List[Path],
+               categories: Set[str]) -> Dict[str, List[Tuple[str, object]]]:
+    """Scan *app_dirs* and return ``{app_name: [(category, item), ...]}``."""
+    index: Dict[str, List[Tuple[str, object]]] = {
+        str(d.relative_to(repo_root)): [] for d in app_dirs
+    }
+    if "helm" in categories:
+        for item in scan_helm_charts(repo_root, app_dirs):
+            index[item.app_name].append(("helm", item))
+    if "github" in categories:
+        for item in scan_github_release_resources(repo_root, app_dirs):
+            index[item.app_name].append(("github", item))
+    if "image" in categories:
+        for item in scan_values_images(repo_root, app_dirs) + scan_resource_images(repo_root, app_dirs):
+            index[item.app_name].append(("image", item))
+    return index
+
+
+def _check_items(items: List[Tuple[str, object]], cache: VersionCache,
+                 workers: int) -> List[Dict]:
+    """Query *items* concurrently and return one result record per item."""
+    records: List[Dict] = []
+    if not items:
+        return records
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_timed_query, category,
+                        f"{item.app_name}:{_item_fields(category, item)[0]}",
+                        _QUERIES[category], item, cache): (category, item)
+            for category, item in items
+        }
+        for future in as_completed(futures):
+            category, item = futures[future]
+            upd, error, rec = future.result()
+            records.append(_result_record(category, item, upd, error, rec))
+    return records
+
+
+class _WatchState:
+    """Scan index and latest results, shared with the HTTP status handler."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.apps: Dict[str, List[Tuple[str, object]]] = {}
+        self.results: Dict[Tuple[str, str, str], Dict] = {}
+        self.scanned_at = ""
+        self.refreshed_at = ""
+
+    def update(self, apps: Dict[str, List[Tuple[str, object]]], records: List[Dict],
+               removed: Set[str], rescanned: bool) -> None:
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        with self.lock:
+            for app in removed | set(apps):
+                self.apps.pop(app, None)
+                self.results = {k: v for k, v in self.results.items() if k[1] != app}
+            self.apps.update(apps)
+            for r in records:
+                self.results[(r["category"], r["app"], r["name"])] = r
+            if rescanned:
+                self.scanned_at = now
+            self.refreshed_at = now
+
+    def has_errors(self) -> bool:
+        with self.lock:
+            return any(r["status"] == "error" for r in self.results.values())
+
+    def app_names(self) -> List[str]:
+        with self.lock:
+            return list(self.apps)
+
+    def all_items(self) -> List[Tuple[str, object]]:
+        with self.lock:
+            return [pair for items in self.apps.values() for pair in items]
+
+    def document(self, updates_only: bool = False) -> Dict:
+        with self.lock:
+            results = sorted(self.results.values(), key=lambda r: (r["app"], r["category"], r["name"]))
+            doc = {
+                "scanned_at": self.scanned_at,
+                "refreshed_at": self.refreshed_at,
+                "apps": len(self.apps),
+                "checked": len(results),
+                "updates": sum(1 for r in results if r["status"] == "update"),
+                "errors": sum(1 for r in results if r["status"] == "error"),
+            }
+        doc["results"] = [r for r in results if r["status"] == "update"] if updates_only else results
+        return doc
+
+
+def _serve_status(state: _WatchState, listen: str) -> ThreadingHTTPServer:
+    """Serve ``/status``, ``/updates`` and ``/healthz`` on *listen* (host:port)."""
+    host, _, port = listen.rpartition(":")
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            path = self.path.split("?", 1)[0]
+            if path == "/healthz":
+                body = b"ok\n"
+                ctype = "text/plain"
+            elif path in ("/", "/status", "/updates"):
+                body = json.dumps(state.document(updates_only=path == "/updates"),
+                                  indent=2).encode()
+                ctype = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _log_records(records: List[Dict]) -> None:
+    for r in records:
+        if r["status"] == "update":
+            latest = r["candidates"][0]["version"] if r["candidates"] else ""
+            print(f"  UPDATE: {r['app']:40s} {r['name']:45s} {r['current']} -> {latest}", flush=True)
+        elif r["status"] == "error":
+            print(f"  ERROR:  {r['app']:40s} {r['name']:30s} {r['error']}", flush=True)
+
+
+def watch(repo_root: Path, categories: Set[str], workers: int, listen: str,
+          interval: float, ttls: Dict[str, float]) -> int:
+    """Long-running mode: keep the scan index and cache warm, rescan apps
+    whose files change, refresh upstream data as each source's TTL expires
+    and serve the current status over HTTP.
+    """
+    cache = VersionCache(ttls=ttls)
+    state = _WatchState()
+    watcher = _DirWatcher([repo_root / env for env in SCAN_DIRS])
+
+    set_recorder(RequestRecorder())
+    apps = _scan_apps(repo_root, _app_dirs(repo_root), categories)
+    records = _check_items([p for items in apps.values() for p in items], cache, workers)
+    state.update(apps, records, set(), rescanned=True)
+    _log_records(records)
+
+    server = _serve_status(state, listen)
+    print(f"Watching {', '.join(SCAN_DIRS)} ({watcher.backend}), "
+          f"serving status on http://{listen}/status", flush=True)
+
+    last_refresh = time.monotonic()
+    try:
+        while True:
+            changed = watcher.poll(1.0)
+            if changed:
+                # Editors write files in bursts; let them settle before rescanning.
+                time.sleep(0.2)
+                changed |= watcher.poll(0)
+            dirty: Set[Path] = set()
+            for path in changed:
+                try:
+                    parts = path.relative_to(repo_root).parts
+                except ValueError:
+                    continue
+                if len(parts) == 1 and parts[0] in SCAN_DIRS:
+                    # A whole root (overflow or newly created): every app, known or not
+                    dirty |= {d for d in _app_dirs(repo_root) if d.parent.name == parts[0]}
+                    dirty |= {repo_root / app for app in state.app_names()
+                              if Path(app).parts[0] == parts[0]}
+                elif len(parts) >= 2 and parts[0] in SCAN_DIRS and not _skip_path(Path(*parts)):
+                    dirty.add(repo_root / parts[0] / parts[1])
+            dirty = {d for d in dirty if not _skip_path(d.relative_to(repo_root))}
+
+            if dirty:
+                present = sorted(d for d in dirty if (d / "kustomization.yaml").exists())
+                removed = {str(d.relative_to(repo_root)) for d in dirty} - {
+                    str(d.relative_to(repo_root)) for d in present}
+                set_recorder(RequestRecorder())
+                apps = _scan_apps(repo_root, present, categories)
+                records = _check_items([p for items in apps.values() for p in items], cache, workers)
+                state.update(apps, records, removed, rescanned=True)
+                print(f"Rescanned {len(dirty)} app(s): "
+                      f"{', '.join(sorted(str(d.relative_to(repo_root)) for d in dirty))}", flush=True)
+                _log_records(records)
+
+            if time.monotonic() - last_refresh >= interval:
+                last_refresh = time.monotonic()
+                expired = cache.evict_expired()
+                if expired or state.has_errors():
+                    # Items whose sources are still fresh are answered from cache;
+                    # failed lookups are never cached and so are retried here.
+                    set_recorder(RequestRecorder())
+                    records = _check_items(state.all_items(), cache, workers)
+                    state.update({}, records, set(), rescanned=False)
+                    print(f"Refreshed {len(expired)} expired upstream entries", flush=True)
+                    _log_records(records)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
+
 # ---------------------------------------------------------------------------
 # Report formatting
 # ---------------------------------------------------------------------------
@@ -474,6 +901,48 @@ def _print_section(result: CategoryResult) -> None:
         print(f"  ERROR: {e.app_name:40s} {e.resource_name:30s}{src} {e.message}")
 
 
+def _fmt_bytes(n: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GiB"
+
+
+def _print_profile(summary: Dict, wall: float) -> None:
+    """Print the ``--profile`` report built by ``summarize_requests``."""
+    totals = summary["totals"]
+    print("\n=== Profile ===")
+    print(f"  Wall time: {wall:.2f}s, {totals['requests']} requests, "
+          f"{_fmt_bytes(totals['bytes'])}, {totals['errors']} errors")
+
+    header = f"  {'':40s} {'reqs':>5s} {'bytes':>9s} {'errs':>4s} {'total':>8s} {'p50':>7s} {'p95':>7s}"
+    for title, key in (("Per registry", "hosts"), ("Per endpoint", "endpoints")):
+        print(f"\n  {title}:")
+        print(header)
+        for name, st in summary[key].items():
+            print(f"  {name:40s} {st['requests']:5d} {_fmt_bytes(st['bytes']):>9s} "
+                  f"{st['errors']:4d} {st['total_s']:7.2f}s {st['p50_s']:6.3f}s {st['p95_s']:6.3f}s")
+
+    if summary["cache"]:
+        print("\n  Cache:")
+        for kind, counts in summary["cache"].items():
+            print(f"  {kind:40s} {counts['hit']:5d} hit {counts['miss']:5d} miss")
+
+    if summary["slowest_items"]:
+        print("\n  Slowest items:")
+        for it in summary["slowest_items"]:
+            print(f"  {it['latency']:7.2f}s  {it['category']:7s} {it['label']:60s} "
+                  f"{it['requests']} reqs, {it['cache_hits']} cache hits")
+
+    if summary["slowest_requests"]:
+        print("\n  Slowest requests:")
+        for r in summary["slowest_requests"]:
+            status = r["error"] or r["status"]
+            print(f"  {r['latency']:7.2f}s  {r['endpoint']:8s} {r['host']:40s} "
+                  f"{_fmt_bytes(r['size']):>9s} {status}  {r['item']}")
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
@@ -486,17 +955,86 @@ def main() -> int:
     scope.add_argument("--helm", action="store_true", help="Check Helm chart versions only")
     scope.add_argument("--github", action="store_true", help="Check GitHub release resource versions only")
     scope.add_argument("--images", action="store_true", help="Check container image versions only")
+    scope.add_argument("--all", action="store_true",
+                       help="Check Helm charts, GitHub releases and container images")
     parser.add_argument("--workers", type=int, default=8,
                         help="Concurrent registry queries (default: 8)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record every upstream request and print a timing report")
+    parser.add_argument("--profile-json", metavar="PATH",
+                        help="Write the profile summary and raw records as JSON (implies --profile)")
+    parser.add_argument("--profile-otlp", metavar="URL",
+                        help="Export the profile as OTLP/HTTP spans to this collector, "
+                             "e.g. http://localhost:4318 (implies --profile)")
+    parser.add_argument("--format", choices=("text", "jsonl"), default="text",
+                        help="Output format: human-readable text (default) or one JSON "
+                             "record per result as it completes, then a summary record")
+    parser.add_argument("--watch", action="store_true",
+                        help="Run continuously: rescan changed apps, refresh upstream data "
+                             "per source TTL and serve status over HTTP")
+    parser.add_argument("--listen", default="127.0.0.1:8089", metavar="HOST:PORT",
+                        help="Status endpoint address for --watch (default: 127.0.0.1:8089)")
+    parser.add_argument("--interval", type=float, default=60, metavar="SECONDS",
+                        help="How often --watch checks for expired cache entries (default: 60)")
+    parser.add_argument("--ttl", action="append", default=[], metavar="KIND=SECONDS",
+                        help="Override a cache lifetime for --watch, e.g. github_releases=600 "
+                             f"(kinds: {', '.join(DEFAULT_TTLS)})")
+    parser.add_argument("--harbor", nargs="?", const=harbor_base_url(), metavar="URL",
+                        help="List image tags through the Harbor proxy-cache projects first "
+                             f"(default URL: {harbor_base_url()}); Harbor errors fall back upstream")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="Run fully offline from a snapshot written by --export-snapshot")
+    parser.add_argument("--export-snapshot", metavar="PATH",
+                        help="After the run, write all fetched upstream data to PATH "
+                             "(.gz for gzip) for later --snapshot runs")
     args = parser.parse_args()
+    text = args.format == "text"
 
     # Default run (no flags): helm + github. Images remain opt-in via --images.
-    check_helm = args.helm or (not args.github and not args.images)
-    check_github = args.github or (not args.helm and not args.images)
-    check_images = args.images
+    check_helm = args.all or args.helm or (not args.github and not args.images)
+    check_github = args.all or args.github or (not args.helm and not args.images)
+    check_images = args.all or args.images
 
     repo_root = Path(__file__).resolve().parent.parent
+    if args.harbor:
+        set_harbor_lookup(args.harbor)
+
+    if args.watch:
+        # The daemon serves its own status and refetches live data
+        ignored = [flag for flag, on in (
+            ("--format jsonl", not text), ("--snapshot", args.snapshot),
+            ("--export-snapshot", args.export_snapshot), ("--profile", args.profile),
+            ("--profile-json", args.profile_json), ("--profile-otlp", args.profile_otlp),
+        ) if on]
+        if ignored:
+            parser.error(f"--watch cannot be combined with {', '.join(ignored)}")
+        ttls = dict(DEFAULT_TTLS)
+        for spec in args.ttl:
+            kind, _, seconds = spec.partition("=")
+            if kind not in DEFAULT_TTLS or not seconds:
+                parser.error(f"invalid --ttl {spec!r}")
+            ttls[kind] = float(seconds)
+        categories = {c for c, on in (("helm", check_helm), ("github", check_github),
+                                      ("image", check_images)) if on}
+        return watch(repo_root, categories, args.workers, args.listen, args.interval, ttls)
     cache = VersionCache()
+    if args.snapshot:
+        try:
+            cache, created = import_snapshot(Path(args.snapshot))
+        except (OSError, ValueError) as e:
+            print(f"Error: cannot load snapshot: {e}", file=sys.stderr)
+            return 1
+        set_offline(True)
+        if text:
+            print(f"Using snapshot {args.snapshot} ({created}), offline\n")
+
+    profile = bool(args.profile or args.profile_json or args.profile_otlp)
+    recorder: Optional[RequestRecorder] = None
+    # jsonl records carry per-item timings and cache status, which need a recorder
+    if profile or not text:
+        recorder = RequestRecorder()
+        set_recorder(recorder)
+    started = time.perf_counter()
 
     # --- Phase 1: Scan (fast, no network) ---
     helm_items: List[HelmItem] = []
@@ -512,7 +1050,11 @@ def main() -> int:
 
     total_items = len(helm_items) + len(github_items) + len(image_items)
     if total_items == 0:
-        print("No versioned resources found.")
+        if text:
+            print("No versioned resources found.")
+        else:
+            _emit_jsonl({"type": "summary", "checked": 0, "updates": 0, "errors": 0,
+                         "wall_s": round(time.perf_counter() - started, 4), "categories": {}})
         return 0
 
     parts = []
@@ -522,7 +1064,8 @@ def main() -> int:
         parts.append(f"{len(github_items)} GitHub release resources")
     if check_images:
         parts.append(f"{len(image_items)} images")
-    print(f"Scanning {', '.join(parts)}...\n")
+    if text:
+        print(f"Scanning {', '.join(parts)}...\n")
 
     # --- Phase 2: Query (network, parallel) ---
     helm_result = CategoryResult(title="Helm Chart Versions")
@@ -532,6 +1075,8 @@ def main() -> int:
 
     def _print_update(u: Update) -> None:
         """Print an update line with candidates, one per line."""
+        if not text:
+            return
         cur = f"{u.current} ({u.current_date})" if u.current_date else u.current
         src = f"  [{u.source_file}]" if u.source_file else ""
         print(f"  UPDATE: {u.app_name:40s} {u.resource_name:45s} {cur}{src}", flush=True)
@@ -542,49 +1087,60 @@ def main() -> int:
             print(f"    [!] non-semver version names — review before upgrading", flush=True)
 
     def _print_helm_ok(app: str, name: str, ver: str) -> None:
-        print(f"  OK:     {app:40s} {name:45s} {ver:15s}", flush=True)
+        if text:
+            print(f"  OK:     {app:40s} {name:45s} {ver:15s}", flush=True)
 
     def _print_helm_error(e: CheckError) -> None:
-        print(f"  ERROR:  {e.app_name:40s} {e.resource_name:30s} {e.message}", flush=True)
+        if text:
+            print(f"  ERROR:  {e.app_name:40s} {e.resource_name:30s} {e.message}", flush=True)
 
     def _print_image_ok(app: str, name: str, ver: str) -> None:
-        print(f"  OK:     {app:40s} {name:45s} {ver:15s}", flush=True)
+        if text:
+            print(f"  OK:     {app:40s} {name:45s} {ver:15s}", flush=True)
 
     def _print_image_error(e: CheckError) -> None:
-        print(f"  ERROR:  {e.app_name:40s} {e.resource_name:30s} [{e.source_file}] {e.message}", flush=True)
+        if text:
+            print(f"  ERROR:  {e.app_name:40s} {e.resource_name:30s} [{e.source_file}] {e.message}", flush=True)
 
     def _print_github_ok(app: str, name: str, ver: str) -> None:
-        print(f"  OK:     {app:40s} {name:45s} {ver:15s}", flush=True)
+        if text:
+            print(f"  OK:     {app:40s} {name:45s} {ver:15s}", flush=True)
 
     def _print_github_error(e: CheckError) -> None:
-        print(f"  ERROR:  {e.app_name:40s} {e.resource_name:30s} [{e.source_file}] {e.message}", flush=True)
+        if text:
+            print(f"  ERROR:  {e.app_name:40s} {e.resource_name:30s} [{e.source_file}] {e.message}", flush=True)
 
     # Submit all queries
     futures: dict = {}
 
     with ThreadPoolExecutor(max_workers=args.workers) as pool:
         for item in helm_items:
-            f = pool.submit(_query_helm, item, cache)
+            f = pool.submit(_timed_query, "helm", f"{item.app_name}:{item.chart_name}",
+                            _query_helm, item, cache)
             futures[f] = ("helm", item)
 
         for item in github_items:
-            f = pool.submit(_query_github, item, cache)
+            f = pool.submit(_timed_query, "github", f"{item.app_name}:{item.owner_repo}",
+                            _query_github, item, cache)
             futures[f] = ("github", item)
 
         # Track which image items come from values vs resources
         values_sources = {str(i.source_file) for i in scan_values_images(repo_root)} if check_images else set()
 
         for item in image_items:
-            f = pool.submit(_query_image, item, cache)
+            f = pool.submit(_timed_query, "image", f"{item.app_name}:{item.image_ref}",
+                            _query_image, item, cache)
             futures[f] = ("image", item)
 
         for future in as_completed(futures):
             category, item = futures[future]
-            upd, error = future.result()
+            upd, error, rec = future.result()
 
             if category == "helm":
                 item: HelmItem  # type: ignore
                 helm_result.total += 1
+                if not text:
+                    _emit_jsonl(_result_record(category, item, upd, error, rec))
                 if error:
                     err_obj = CheckError(
                         app_name=item.app_name,
@@ -603,6 +1159,8 @@ def main() -> int:
             elif category == "github":
                 item: GitHubReleaseItem  # type: ignore
                 github_result.total += 1
+                if not text:
+                    _emit_jsonl(_result_record(category, item, upd, error, rec))
                 if error:
                     err_obj = CheckError(
                         app_name=item.app_name,
@@ -623,6 +1181,8 @@ def main() -> int:
                 item: ImageItem  # type: ignore
                 target = values_result if item.source_file in values_sources else resource_result
                 target.total += 1
+                if not text:
+                    _emit_jsonl(_result_record(category, item, upd, error, rec))
                 if error:
                     err_obj = CheckError(
                         app_name=item.app_name,
@@ -652,12 +1212,57 @@ def main() -> int:
     total_updates = sum(r.update_count for r in all_results)
     total_errors = sum(r.error_count for r in all_results)
 
-    print(f"\n=== Summary ===")
-    print(f"  Total:   {total_checked} checked, {total_updates} updates available")
-    if total_errors:
-        print(f"  Errors:  {total_errors} (failed to query registry)")
-    if total_updates == 0 and total_errors == 0:
-        print("  All up to date.")
+    wall = time.perf_counter() - started
+    summary = summarize_requests(recorder) if profile else None
+
+    if text:
+        print(f"\n=== Summary ===")
+        print(f"  Total:   {total_checked} checked, {total_updates} updates available")
+        if total_errors:
+            print(f"  Errors:  {total_errors} (failed to query registry)")
+        if total_updates == 0 and total_errors == 0:
+            print("  All up to date.")
+        if summary is not None:
+            _print_profile(summary, wall)
+    else:
+        record: Dict = {
+            "type": "summary",
+            "checked": total_checked,
+            "updates": total_updates,
+            "errors": total_errors,
+            "wall_s": round(wall, 4),
+            "categories": {
+                r.title: {"total": r.total, "updates": r.update_count, "errors": r.error_count}
+                for r in all_results
+            },
+        }
+        if summary is not None:
+            record["profile"] = summary
+        _emit_jsonl(record)
+
+    if args.export_snapshot:
+        count = export_snapshot(cache, Path(args.export_snapshot),
+                                charts={i.chart_name for i in helm_items})
+        if text:
+            print(f"  Snapshot written to {args.export_snapshot} ({count} entries)")
+
+    if summary is not None:
+        if args.profile_json:
+            with open(args.profile_json, "w") as f:
+                json.dump({
+                    "wall_s": round(wall, 4),
+                    "summary": summary,
+                    "requests": [asdict(r) for r in recorder.requests],
+                    "items": [asdict(i) for i in recorder.items],
+                }, f, indent=2)
+            if text:
+                print(f"  Profile written to {args.profile_json}")
+        if args.profile_otlp:
+            err = export_otlp_spans(recorder, args.profile_otlp)
+            if err:
+                print(f"  Failed to export spans to {args.profile_otlp}: {err}", file=sys.stderr)
+            elif text:
+                print(f"  Exported spans to {args.profile_otlp}")
 
     return 0  # always exit 0 — notification only
 
@@ -0,0 +1,248 @@
+"""Render kustomize application directories concurrently, with a render cache.
+
+`kubectl kustomize --enable-helm` has no long-lived or multi-directory mode,
+and a fresh kubectl (plus one helm process per chart) costs far more than
+reading the inputs. :class:`Renderer` therefore renders through a pool of
+worker threads, one subprocess each, and keeps every successful render
+under .render-cache/ keyed by a hash of its inputs:
+
+- every file under the app directory, except remote charts that kustomize
+  downloads into charts/<name>-<version> (pinned by the kustomization);
+- files and directories the kustomizations reference outside it, such as
+  ../../image-prefix.yaml;
+- the kubectl and helm versions and the render command.
+
+An unchanged app is then answered without starting any process. Results are
+streamed as they finish (:meth:`Renderer.render_many`), or waited for one at
+a time through the futures of :meth:`Renderer.submit`.
+"""
+
+import hashlib
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set
+
+from version_utils import load_yaml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CACHE_DIR = REPO_ROOT / ".render-cache"
+CACHE_MAX_AGE_DAYS = 30
+
+KUSTOMIZE_CMD = ["kubectl", "kustomize", "--enable-helm", "--load-restrictor=LoadRestrictionsNone"]
+RENDER_TIMEOUT = 30
+# Renders wait on helm pulls as much as on CPU, so even small machines use a few
+WORKERS = min(8, max(4, os.cpu_count() or 1))
+
+_KUSTOMIZATION_FILES = ("kustomization.yaml", "kustomization.yml", "Kustomization")
+# Kustomization fields that list paths (files or directories)
+_PATH_LISTS = ("resources", "components", "transformers", "generators", "validators",
+               "crds", "patchesStrategicMerge", "configurations", "openapi")
+
+
+@dataclass
+class RenderResult:
+    """Outcome of rendering one application directory."""
+    app_dir: Path
+    ok: bool
+    output: str = ""
+    error: str = ""
+    seconds: float = 0.0
+    cached: bool = False
+    key: str = ""
+
+
+def _kustomization(directory: Path) -> Optional[Path]:
+    for name in _KUSTOMIZATION_FILES:
+        if (directory / name).is_file():
+            return directory / name
+    return None
+
+
+def _referenced_paths(data: dict) -> Iterator[str]:
+    for field in _PATH_LISTS:
+        value = data.get(field)
+        if isinstance(value, list):
+            yield from (v for v in value if isinstance(v, str))
+    for patch in data.get("patches") or []:
+        if isinstance(patch, dict) and isinstance(patch.get("path"), str):
+            yield patch["path"]
+    for field in ("configMapGenerator", "secretGenerator"):
+        for gen in data.get(field) or []:
+            if not isinstance(gen, dict):
+                continue
+            for entry in (gen.get("files") or []) + (gen.get("envs") or []):
+                if isinstance(entry, str):
+                    # "key=path" or "path"
+                    yield entry.split("=", 1)[-1]
+    for chart in data.get("helmCharts") or []:
+        if isinstance(chart, dict):
+            for entry in [chart.get("valuesFile")] + (chart.get("additionalValuesFiles") or []):
+                if isinstance(entry, str):
+                    yield entry
+
+
+def _downloaded_charts(kdir: Path, data: dict) -> Set[Path]:
+    """Chart directories kustomize pulled for remote helmCharts of *data*."""
+    home = (data.get("helmGlobals") or {}).get("chartHome") or "charts"
+    dirs = set()
+    for chart in data.get("helmCharts") or []:
+        if isinstance(chart, dict) and chart.get("repo") and chart.get("name"):
+            name = chart["name"]
+            version = chart.get("version")
+            dirs.add(kdir / home / (f"{name}-{version}" if version else name))
+    return dirs
+
+
+def _under(path: Path, roots: Iterable[Path]) -> bool:
+    return any(path == root or root in path.parents for root in roots)
+
+
+def render_inputs(app_dir: Path) -> List[Path]:
+    """Every file whose content can change what *app_dir* renders to, sorted."""
+    roots = [app_dir.resolve()]
+    skipped: Set[Path] = set()
+    pending = [app_dir.resolve()]
+    while pending:
+        top = pending.pop()
+        if not top.is_dir():
+            continue
+        for dirpath, dirnames, _ in os.walk(top):
+            kfile = _kustomization(Path(dirpath))
+            if kfile is None:
+                continue
+            data = load_yaml(kfile)
+            if not isinstance(data, dict):
+                continue
+            skipped |= _downloaded_charts(Path(dirpath), data)
+            for ref in _referenced_paths(data):
+                if "://" in ref or ref.startswith(("github.com/", "git@")):
+                    continue
+                target = (Path(dirpath) / ref).resolve()
+                if target.exists() and not _under(target, roots):
+                    roots.append(target)
+                    pending.append(target)
+
+    files = []
+    for root in roots:
+        if root.is_file():
+            files.append(root)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames
+                                 if d != ".git" and Path(dirpath, d) not in skipped)
+            files.extend(Path(dirpath, f) for f in filenames)
+    return sorted(set(files))
+
+
+def _tool_version(cmd: List[str]) -> str:
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10, check=False)
+        return result.stdout.strip()
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return ""
+
+
+class Renderer:
+    """Pool that renders application directories, answering from the cache
+    when their inputs are unchanged."""
+
+    def __init__(self, workers: Optional[int] = None, cache_dir: Optional[Path] = CACHE_DIR,
+                 timeout: int = RENDER_TIMEOUT, root: Path = REPO_ROOT) -> None:
+        # Inputs are hashed by their path below *root*, so a checkout of
+        # another commit elsewhere shares cache entries with this one
+        self.root = root.resolve()
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers or WORKERS)
+        self._lock = threading.Lock()
+        self._tools: Optional[str] = None
+        self._pruned = False
+
+    def __enter__(self) -> "Renderer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._pool.shutdown(wait=True)
+
+    def _tools_key(self) -> str:
+        with self._lock:
+            if self._tools is None:
+                self._tools = "\0".join([
+                    " ".join(KUSTOMIZE_CMD),
+                    _tool_version(["kubectl", "version", "--client"]),
+                    _tool_version(["helm", "version", "--short"]),
+                ])
+            return self._tools
+
+    def key(self, app_dir: Path) -> str:
+        h = hashlib.sha256(self._tools_key().encode())
+        for path in render_inputs(app_dir):
+            try:
+                name = path.relative_to(self.root)
+            except ValueError:
+                name = path
+            h.update(str(name).encode() + b"\0")
+            with open(path, "rb") as f:
+                h.update(hashlib.sha256(f.read()).digest())
+        return h.hexdigest()
+
+    def _cache_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.yaml"
+
+    def _store(self, key: str, output: str) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.cache_dir / f".{key}.{threading.get_ident()}"
+        tmp.write_text(output)
+        os.replace(tmp, self._cache_path(key))
+        with self._lock:
+            if self._pruned:
+                return
+            self._pruned = True
+        cutoff = time.time() - CACHE_MAX_AGE_DAYS * 86400
+        for entry in self.cache_dir.iterdir():
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    entry.unlink()
+            except OSError:
+                pass
+
+    def render(self, app_dir: Path) -> RenderResult:
+        """Render *app_dir* now, on the calling thread."""
+        start = time.perf_counter()
+        key = self.key(app_dir)
+        if self.cache_dir is not None:
+            cached = self._cache_path(key)
+            try:
+                output = cached.read_text()
+                os.utime(cached)  # keep it from being pruned
+                return RenderResult(app_dir, True, output, seconds=time.perf_counter() - start,
+                                    cached=True, key=key)
+            except OSError:
+                pass
+
+        try:
+            result = subprocess.run(KUSTOMIZE_CMD + [str(app_dir)], capture_output=True,
+                                    text=True, timeout=self.timeout, check=False)
+            ok, output, error = result.returncode == 0, result.stdout, result.stderr
+        except subprocess.TimeoutExpired:
+            ok, output, error = False, "", f"Command timeout after {self.timeout}s"
+        except FileNotFoundError:
+            ok, output, error = False, "", f"Command not found: {KUSTOMIZE_CMD[0]}"
+        if ok and self.cache_dir is not None:
+            self._store(key, output)
+        return RenderResult(app_dir, ok, output, error, time.perf_counter() - start, key=key)
+
+    def submit(self, app_dir: Path) -> "Future[RenderResult]":
+        """Queue *app_dir* for rendering on the pool."""
+        return self._pool.submit(self.render, app_dir)
+
+    def render_many(self, app_dirs: Iterable[Path]) -> Iterator[RenderResult]:
+        """Render *app_dirs* on the pool, yielding each result as it finishes."""
+        futures = [self.submit(d) for d in app_dirs]
+        for future in as_completed(futures):
+            yield future.result()
@@ -2,26 +2,53 @@
 """Pre-commit checks for Kustomize + Helm GitOps repository."""
 
 import sys
-import subprocess
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 
 # Allow importing sibling module without package setup
 sys.path.insert(0, str(Path(__file__).resolve().parent))
-from version_utils import load_yaml
+
+# yaml, subprocess and version_utils are imported where they are first needed:
+# this hook runs on every commit and most commits touch no application, so the
+# no-op path must stay close to bare interpreter startup (see
+# bench-hook-startup.py).
 
 
 class Checker:
     """Main checker class."""
 
-    def __init__(self, auto_fix: bool = False):
+    def __init__(self, auto_fix: bool = False, render_cache: bool = True,
+                 validate_schemas: bool = True):
         self.auto_fix = auto_fix
+        self.render_cache = render_cache
+        self.validate_schemas = validate_schemas
         self.errors: List[str] = []
         self.warnings: List[str] = []
         self.fixes: List[str] = []
+        self.renderer = None
+        self.renders: Dict[Path, Any] = {}  # app dir -> Future[RenderResult]
+
+    def start_renders(self, app_dirs: List[Path]) -> None:
+        """Queue kustomize builds of *app_dirs* on the render pool.
+
+        They run while the helmCharts fields are checked; see
+        kustomize_render.py. With --fix the build waits for the fixes.
+        """
+        if self.auto_fix:
+            return
+        for app_dir in app_dirs:
+            if app_dir not in self.renders:
+                self.renders[app_dir] = self._renderer().submit(app_dir)
+
+    def _renderer(self):
+        if self.renderer is None:
+            from kustomize_render import CACHE_DIR, Renderer
+            self.renderer = Renderer(cache_dir=CACHE_DIR if self.render_cache else None)
+        return self.renderer
 
     def run_command(self, cmd: List[str], timeout: int = 10) -> Tuple[int, str, str]:
         """Run a shell command and return exit code, stdout, stderr."""
+        import subprocess
         try:
             result = subprocess.run(
                 cmd, capture_output=True, text=True, check=False, timeout=timeout
@@ -159,15 +186,108 @@ class Checker:
 
     def check_kustomize_build(self, app_dir: Path, app_name: str) -> None:
         """Test if kustomize can successfully build the manifests."""
-        code, _, stderr = self.run_command(
-            ["kubectl", "kustomize", "--enable-helm", "--load-restrictor=LoadRestrictionsNone", str(app_dir)],
-            timeout=30
-        )
-        if code != 0:
-            self.errors.append(f"  {app_name}: Kustomize build failed\n{stderr}")
-
-    def check_app_directory(self, app_dir: Path, repo_root: Path) -> bool:
-        """Check a single application directory. Returns True if passed."""
+        future = self.renders.get(app_dir)
+        if future is None:
+            future = self.renders[app_dir] = self._renderer().submit(app_dir)
+        result = future.result()
+        if not result.ok:
+            self.errors.append(f"  {app_name}: Kustomize build failed\n{result.error}")
+        elif result.cached:
+            print("  Kustomize build: unchanged (cached)")
+
+    def check_schemas(self, repo_root: Path) -> None:
+        """Validate the rendered objects of every built app offline.
+
+        See schema_index.py. CRDs come from the rendered output of all apps
+        seen so far; results are cached per render, so only apps whose
+        output changed are parsed and validated again.
+        """
+        if not self.validate_schemas:
+            return
+        results = [future.result() for future in self.renders.values()]
+        results = [r for r in results if r.ok]
+        if not results:
+            return
+
+        import json
+        import yaml
+        from schema_index import SchemaIndex, describe, gvk_key, validate_objects
+        loader = yaml.CSafeLoader if hasattr(yaml, "CSafeLoader") else yaml.SafeLoader
+
+        print("\nSchema validation")
+        index = SchemaIndex.load()
+        parsed: Dict[Path, List[Any]] = {}
+
+        def objects(result) -> List[Any]:
+            if result.app_dir not in parsed:
+                parsed[result.app_dir] = [
+                    o for o in yaml.load_all(result.output, Loader=loader) if o is not None
+                ]
+            return parsed[result.app_dir]
+
+        # CRDs first: an app may use kinds another app (or itself) defines
+        recorded = False
+        for r in results:
+            app = str(r.app_dir.relative_to(repo_root))
+            if index.app_key(app) != r.key:
+                index.update_crds(app, r.key, objects(r))
+                recorded = True
+        if recorded:
+            index.save()
+
+        def cache_path(r) -> Optional[Path]:
+            if self.renderer is None or self.renderer.cache_dir is None:
+                return None
+            return self.renderer.cache_dir / f"{r.key}.schema.json"
+
+        reports: Dict[Path, Dict] = {}
+        pending = []
+        for r in results:
+            path = cache_path(r)
+            try:
+                report = json.loads(path.read_text()) if path else None
+            except (OSError, ValueError):
+                report = None
+            if report and report.get("index") == index.digest:
+                report["cached"] = True
+                reports[r.app_dir] = report
+            else:
+                pending.append(r)
+
+        batch = [(r, obj) for r in pending for obj in objects(r)]
+        verdicts = validate_objects(index, [obj for _, obj in batch])
+        for r in pending:
+            reports[r.app_dir] = {"index": index.digest, "objects": len(objects(r)),
+                                  "errors": [], "missing": {}}
+        for (r, obj), errors in zip(batch, verdicts):
+            report = reports[r.app_dir]
+            if errors is None:
+                gvk = gvk_key(str(obj.get("apiVersion")), str(obj.get("kind")))
+                report["missing"][gvk] = report["missing"].get(gvk, 0) + 1
+            for error in errors or []:
+                report["errors"].append(f"{describe(obj)}: {error}")
+        for r in pending:
+            path = cache_path(r)
+            if path:
+                path.write_text(json.dumps(reports[r.app_dir]))
+
+        for r in results:
+            app = str(r.app_dir.relative_to(repo_root))
+            report = reports[r.app_dir]
+            note = " (cached)" if report.get("cached") else ""
+            print(f"  {app}: {report['objects']} objects, {len(report['errors'])} errors{note}")
+            for error in report["errors"]:
+                self.errors.append(f"  {app}: {error}")
+            for gvk, count in sorted(report["missing"].items()):
+                self.warnings.append(f"  {app}: no schema for {gvk}, {count} object(s) not validated")
+
+    def check_app_directory(self, app_dir: Path, repo_root: Path,
+                            kustomization_data: Optional[Dict] = None) -> bool:
+        """Check a single application directory. Returns True if passed.
+
+        *kustomization_data* is the parsed kustomization.yaml when the caller
+        has loaded it already (see run-hooks.py).
+        """
         kustomization_file = app_dir / "kustomization.yaml"
         if not kustomization_file.exists():
             return True
@@ -176,7 +296,9 @@ class Checker:
         print(f"\n{app_name}")
 
         # Load kustomization.yaml
-        kustomization_data = load_yaml(kustomization_file)
+        if kustomization_data is None:
+            from version_utils import load_yaml
+            kustomization_data = load_yaml(kustomization_file)
         if not kustomization_data:
             self.errors.append(f"  {app_name}: Failed to load kustomization.yaml")
             return False
@@ -238,9 +360,11 @@ class Checker:
 
         print(f"Checking {len(app_dirs)} applications...")
 
-        # Check each directory
+        # Check each directory; kustomize builds run concurrently meanwhile
+        self.start_renders(app_dirs)
         for app_dir in app_dirs:
             self.check_app_directory(app_dir, repo_root)
+        self.check_schemas(repo_root)
 
         # Print fixes
         if self.fixes:
@@ -270,6 +394,12 @@ class Checker:
 
 def get_git_root() -> Path:
     """Get the root directory of the git repository."""
+    # This script lives in scripts/ of the repository; only ask git (a fork
+    # and exec on every commit) when it has been copied elsewhere.
+    root = Path(__file__).resolve().parent.parent
+    if (root / ".git").exists():
+        return root
+    import subprocess
     try:
         result = subprocess.run(
             ["git", "rev-parse", "--show-toplevel"],
@@ -309,6 +439,16 @@ def main():
         action="store_true",
         help="Automatically fix issues (add missing fields)"
     )
+    parser.add_argument(
+        "--no-render-cache",
+        action="store_true",
+        help="Always run kustomize, ignoring cached renders of unchanged apps"
+    )
+    parser.add_argument(
+        "--no-schemas",
+        action="store_true",
+        help="Skip offline schema validation of the rendered manifests"
+    )
     parser.add_argument(
         "files",
         nargs="*",
@@ -317,7 +457,8 @@ def main():
     args = parser.parse_args()
 
     repo_root = get_git_root()
-    checker = Checker(auto_fix=args.fix)
+    checker = Checker(auto_fix=args.fix, render_cache=not args.no_render_cache,
+                      validate_schemas=not args.no_schemas)
     return checker.run_checks(repo_root, files=args.files)
 
 
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Pre-pull pinned container images into the Harbor proxy-cache projects.
+
+Harbor's proxy cache only fetches from upstream when a node pulls, so the
+first pull of a new version during a rollout is slow. This script takes the
+image inventory from check-versions.py's scanners and pulls each image's
+manifest(s) and blobs through the matching proxy project (``docker.io``,
+``ghcr.io``, ... — see production/harbor/script/config.yaml), discarding the
+data, so nodes hit a warm cache.
+
+Usage:
+    scripts/prewarm-harbor.py                      # all pinned images
+    scripts/prewarm-harbor.py --dry-run            # list what would be pulled
+    scripts/prewarm-harbor.py --manifests-only     # resolve manifests, skip blobs
+    scripts/prewarm-harbor.py --rate 5 --workers 8 --platform linux/arm64
+"""
+
+import argparse
+import importlib.util
+import json
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# Allow importing sibling module without package setup
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from version_utils import HARBOR_PREFIX, harbor_base_url, load_yaml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+HARBOR_CONFIG = REPO_ROOT / "production" / "harbor" / "script" / "config.yaml"
+
+_INDEX_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+)
+_MANIFEST_ACCEPT = ", ".join(_INDEX_TYPES + (
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+))
+_USER_AGENT = "harbor-prewarm/1.0"
+_CHUNK = 1 << 20
+
+
+def _load_check_versions():
+    """Import scripts/check-versions.py (hyphenated name) as a module."""
+    path = Path(__file__).resolve().parent / "check-versions.py"
+    spec = importlib.util.spec_from_file_location("check_versions", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------------------------------------------------------------------------
+# Inventory
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Image:
+    project: str       # Harbor proxy project == upstream registry
+    repository: str
+    tag: str
+
+    def __str__(self) -> str:
+        return f"{self.project}/{self.repository}:{self.tag}"
+
+
+def proxy_projects(config_path: Path = HARBOR_CONFIG) -> Set[str]:
+    """Names of the proxy-cache projects declared for Harbor."""
+    config = load_yaml(config_path) or {}
+    return {p["name"] for p in config.get("projects") or [] if p.get("registry")}
+
+
+def collect_images(repo_root: Path, projects: Set[str]) -> Tuple[List[Image], List[str]]:
+    """Pinned images from values/ and resources/, deduplicated.
+
+    Returns *(images, skipped)*; *skipped* lists refs whose registry has no
+    proxy-cache project.
+    """
+    cv = _load_check_versions()
+    items = cv.scan_values_images(repo_root) + cv.scan_resource_images(repo_root)
+    harbor_host = HARBOR_PREFIX.rstrip("/")
+
+    images: Dict[Image, None] = {}
+    skipped: Set[str] = set()
+    for item in items:
+        registry, repository = item.registry, item.repository
+        if registry == harbor_host and "/" in repository:
+            # Already pulled through Harbor: <harbor>/<project>/<repo>
+            registry, repository = repository.split("/", 1)
+        if registry not in projects:
+            skipped.add(f"{registry}/{repository}:{item.current_tag}")
+            continue
+        images[Image(registry, repository, item.current_tag)] = None
+    return list(images), sorted(skipped)
+
+
+# ---------------------------------------------------------------------------
+# Registry client
+# ---------------------------------------------------------------------------
+
+class _RateLimiter:
+    """Spaces requests evenly to at most *rate* per second across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HarborPuller:
+    """Pulls manifests and blobs through Harbor's registry v2 API."""
+
+    def __init__(self, base_url: str, limiter: _RateLimiter, timeout: float = 300):
+        self.base = base_url.rstrip("/")
+        self.limiter = limiter
+        self.timeout = timeout
+        self._tokens: Dict[str, Optional[str]] = {}
+        self._blobs: Set[str] = set()  # digests already pulled in this run
+        self._lock = threading.Lock()
+
+    def _token(self, www_auth: str) -> Optional[str]:
+        """Anonymous bearer token for a ``WWW-Authenticate: Bearer`` challenge."""
+        params = dict(re.findall(r'(\w+)="([^"]*)"', www_auth))
+        realm = params.pop("realm", None)
+        if not realm:
+            return None
+        req = urllib.request.Request(f"{realm}?{urllib.parse.urlencode(params)}",
+                                     headers={"User-Agent": _USER_AGENT})
+        self.limiter.wait()
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            data = json.loads(resp.read())
+        return data.get("token") or data.get("access_token")
+
+    def _open(self, scope: str, path: str, accept: Optional[str] = None):
+        """GET *path*, answering one auth challenge; returns the open response."""
+        headers = {"User-Agent": _USER_AGENT}
+        if accept:
+            headers["Accept"] = accept
+        token = self._tokens.get(scope)
+        for attempt in range(2):
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            self.limiter.wait()
+            req = urllib.request.Request(f"{self.base}/v2/{path}", headers=headers)
+            try:
+                return urllib.request.urlopen(req, timeout=self.timeout)
+            except urllib.error.HTTPError as e:
+                challenge = e.headers.get("WWW-Authenticate", "")
+                if e.code != 401 or attempt or not challenge.startswith("Bearer "):
+                    raise
+                token = self._token(challenge[len("Bearer "):])
+                with self._lock:
+                    self._tokens[scope] = token
+        raise RuntimeError("unreachable")
+
+    def manifest(self, repo: str, reference: str) -> Tuple[dict, str]:
+        with self._open(repo, f"{repo}/manifests/{reference}", _MANIFEST_ACCEPT) as resp:
+            media_type = resp.headers.get("Content-Type", "").split(";")[0]
+            body = json.loads(resp.read())
+        return body, body.get("mediaType") or media_type
+
+    def blob(self, repo: str, digest: str) -> int:
+        """Stream a blob through the proxy; returns bytes read (0 if already pulled)."""
+        with self._lock:
+            if digest in self._blobs:
+                return 0
+            self._blobs.add(digest)
+        size = 0
+        try:
+            with self._open(repo, f"{repo}/blobs/{digest}") as resp:
+                while True:
+                    chunk = resp.read(_CHUNK)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+        except Exception:
+            with self._lock:
+                self._blobs.discard(digest)
+            raise
+        return size
+
+
+# ---------------------------------------------------------------------------
+# Prewarm
+# ---------------------------------------------------------------------------
+
+@dataclass
+class PrewarmResult:
+    image: Image
+    manifests: int = 0
+    blobs: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+    platforms: List[str] = field(default_factory=list)
+
+
+def _platform_matches(entry: dict, platforms: Set[str]) -> bool:
+    if "all" in platforms:
+        return True
+    p = entry.get("platform") or {}
+    name = f"{p.get('os', '')}/{p.get('architecture', '')}"
+    if p.get("variant"):
+        return name in platforms or f"{name}/{p['variant']}" in platforms
+    return name in platforms
+
+
+def prewarm_image(puller: HarborPuller, image: Image, platforms: Set[str],
+                  manifests_only: bool) -> PrewarmResult:
+    result = PrewarmResult(image)
+    start = time.monotonic()
+    repo = f"{image.project}/{image.repository}"
+    try:
+        manifest, media_type = puller.manifest(repo, image.tag)
+        result.manifests += 1
+        if media_type in _INDEX_TYPES:
+            children = [m for m in manifest.get("manifests") or []
+                        if _platform_matches(m, platforms)]
+            images = []
+            for child in children:
+                p = child.get("platform") or {}
+                result.platforms.append(f"{p.get('os')}/{p.get('architecture')}")
+                images.append(puller.manifest(repo, child["digest"])[0])
+                result.manifests += 1
+        else:
+            images = [manifest]
+
+        if not manifests_only:
+            for m in images:
+                digests = [m.get("config", {}).get("digest")]
+                digests += [layer.get("digest") for layer in m.get("layers") or []]
+                for digest in filter(None, digests):
+                    n = puller.blob(repo, digest)
+                    result.blobs += 1
+                    result.bytes += n
+    except urllib.error.HTTPError as e:
+        result.error = f"HTTP {e.code} {e.reason}"
+    except Exception as e:
+        result.error = str(e)
+    result.seconds = time.monotonic() - start
+    return result
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TiB"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Pre-pull pinned images through the Harbor proxy-cache projects."
+    )
+    parser.add_argument("--harbor", default=harbor_base_url(), metavar="URL",
+                        help=f"Harbor base URL (default: {harbor_base_url()})")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Images pulled concurrently (default: 4)")
+    parser.add_argument("--rate", type=float, default=10,
+                        help="Maximum requests per second to Harbor, 0 = unlimited (default: 10)")
+    parser.add_argument("--platform", action="append", metavar="OS/ARCH",
+                        help="Platforms to pull from multi-arch images, repeatable; "
+                             "'all' for every platform (default: linux/amd64)")
+    parser.add_argument("--manifests-only", action="store_true",
+                        help="Only resolve manifests (cheap); do not pull blobs")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="List the images that would be pulled and exit")
+    args = parser.parse_args()
+
+    images, skipped = collect_images(REPO_ROOT, proxy_projects())
+    for ref in skipped:
+        print(f"  skip  {ref} (no proxy-cache project for its registry)")
+    if args.dry_run:
+        for image in images:
+            print(f"  pull  {image}")
+        print(f"{len(images)} image(s) to prewarm, {len(skipped)} skipped")
+        return 0
+
+    platforms = set(args.platform or ["linux/amd64"])
+    puller = HarborPuller(args.harbor, _RateLimiter(args.rate))
+    print(f"Prewarming {len(images)} image(s) through {args.harbor} "
+          f"({args.workers} workers, {args.rate or 'unlimited'} req/s)")
+
+    start = time.monotonic()
+    results: List[PrewarmResult] = []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(prewarm_image, puller, image, platforms, args.manifests_only)
+                   for image in images]
+        for i, fut in enumerate(as_completed(futures), 1):
+            r = fut.result()
+            results.append(r)
+            if r.error:
+                print(f"[{i}/{len(images)}] FAIL {r.image}: {r.error}")
+            else:
+                print(f"[{i}/{len(images)}] ok   {r.image} ({r.manifests} manifest(s), "
+                      f"{r.blobs} blob(s), {_fmt_bytes(r.bytes)}, {r.seconds:.1f}s)")
+
+    failed = [r for r in results if r.error]
+    total = sum(r.bytes for r in results)
+    wall = time.monotonic() - start
+    print(f"Done: {len(results) - len(failed)} ok, {len(failed)} failed, "
+          f"{_fmt_bytes(total)} in {wall:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
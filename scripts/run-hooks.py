@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""Run the repository's YAML checks in one process over one parse per file.
+
+The pre-commit hooks used to be separate processes (check-secrets.py,
+pre-commit-check.py and check-yaml), each reading and parsing the same
+files again. Here every file is parsed at most once into a shared
+:class:`DocumentSet`, and each check is a plugin that picks its files by
+repo-relative path (like pre-commit's ``files``/``exclude``) and reads the
+already parsed documents:
+
+    yaml        every YAML file must parse (replaces check-yaml)
+    secrets     no plaintext Secrets in dev/ and production/ (check-secrets.py)
+    kustomize   helmCharts fields, `kubectl kustomize` and offline schema
+                validation of the affected applications (pre-commit-check.py)
+
+A new check subclasses :class:`Check` and is appended to ``CHECKS``.
+
+Usage:
+    scripts/run-hooks.py [--fix] [files...]        # no files: all tracked YAML
+    scripts/run-hooks.py --only secrets,yaml production/foo/bar.yaml
+"""
+
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Allow importing sibling module without package setup
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# yaml, subprocess and the check modules are imported where they are first
+# needed, so a commit with nothing to check stays cheap (see
+# bench-hook-startup.py).
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+_YAML_FILES = re.compile(r"\.(yaml|yml)$")
+_STRICT_LOADER = None
+
+
+def _strict_loader() -> Any:
+    """SafeLoader (C-accelerated when available) that rejects duplicate keys.
+
+    check-yaml refused duplicate mapping keys, which PyYAML silently accepts
+    (the last one wins), so the yaml check would otherwise be weaker.
+    """
+    global _STRICT_LOADER
+    if _STRICT_LOADER is None:
+        import yaml
+        from yaml.constructor import ConstructorError
+
+        base = yaml.CSafeLoader if hasattr(yaml, "CSafeLoader") else yaml.SafeLoader
+
+        class StrictLoader(base):
+            def construct_mapping(self, node, deep=False):
+                seen = set()
+                for key_node, _ in node.value:
+                    if not isinstance(key_node, yaml.ScalarNode) or key_node.tag.endswith(":merge"):
+                        continue
+                    if key_node.value in seen:
+                        raise ConstructorError(
+                            "while constructing a mapping", node.start_mark,
+                            f"found duplicate key {key_node.value!r}", key_node.start_mark)
+                    seen.add(key_node.value)
+                return super().construct_mapping(node, deep=deep)
+
+        _STRICT_LOADER = StrictLoader
+    return _STRICT_LOADER
+
+
+def _load_script(filename: str, module_name: str) -> Any:
+    """Import a hyphenated sibling script as a module."""
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(module_name, Path(__file__).resolve().parent / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ---------------------------------------------------------------------------
+# Shared documents
+# ---------------------------------------------------------------------------
+
+class YamlFile:
+    """One file of the document set, parsed on first access."""
+
+    def __init__(self, path: Path, rel: str) -> None:
+        self.path = path
+        self.rel = rel
+        self._docs: Optional[List[Any]] = None
+        self.error: Optional[str] = None
+
+    @property
+    def docs(self) -> Optional[List[Any]]:
+        """The file's documents, or None if it does not parse (see *error*)."""
+        if self._docs is None and self.error is None:
+            import yaml
+            try:
+                with open(self.path, "rb") as f:
+                    self._docs = list(yaml.load_all(f, Loader=_strict_loader()))
+            except yaml.YAMLError as e:
+                self.error = f"YAML parse error: {e}"
+            except OSError as e:
+                self.error = f"Error: {e}"
+        return self._docs
+
+
+class DocumentSet:
+    """Files by repo-relative path, each read and parsed at most once."""
+
+    def __init__(self, repo_root: Path) -> None:
+        self.repo_root = repo_root
+        self._files: Dict[str, YamlFile] = {}
+
+    def get(self, path: Path) -> YamlFile:
+        path = path if path.is_absolute() else self.repo_root / path
+        rel = path.relative_to(self.repo_root).as_posix()
+        if rel not in self._files:
+            self._files[rel] = YamlFile(path, rel)
+        return self._files[rel]
+
+    def parsed(self) -> List[YamlFile]:
+        return [f for f in self._files.values() if f._docs is not None or f.error]
+
+
+# ---------------------------------------------------------------------------
+# Checks
+# ---------------------------------------------------------------------------
+
+class Check:
+    """A check over the shared document set.
+
+    *files* and *exclude* select the repo-relative paths the check looks at
+    (``re.search``, as pre-commit does). :meth:`run` gets those files and
+    appends messages to *errors*, *warnings* and *fixes*; a file that does
+    not parse is reported once by the runner, so checks just skip it.
+    """
+
+    name = ""
+    files = _YAML_FILES
+    exclude: Optional["re.Pattern[str]"] = None
+
+    def __init__(self, auto_fix: bool = False) -> None:
+        self.auto_fix = auto_fix
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.fixes: List[str] = []
+
+    def wants(self, rel: str) -> bool:
+        return bool(self.files.search(rel)) and not (self.exclude and self.exclude.search(rel))
+
+    def run(self, files: List[YamlFile], documents: DocumentSet) -> None:
+        raise NotImplementedError
+
+
+class YamlCheck(Check):
+    """Every YAML file parses (multiple documents allowed, no duplicate keys)."""
+
+    name = "yaml"
+    # Helm templates are Go templates, not YAML
+    exclude = re.compile(r".*/templates/.*\.yaml$")
+
+    def run(self, files: List[YamlFile], documents: DocumentSet) -> None:
+        for f in files:
+            f.docs  # parse errors are reported by the runner
+
+
+class SecretsCheck(Check):
+    """No plaintext Secrets, see check-secrets.py."""
+
+    name = "secrets"
+    exclude = re.compile(r"(charts/|\.git/|node_modules/)")
+
+    def run(self, files: List[YamlFile], documents: DocumentSet) -> None:
+        checker = _load_script("check-secrets.py", "check_secrets").SecretChecker(self.auto_fix)
+        paths = checker.get_files_to_check([str(f.path) for f in files], documents.repo_root)
+        for path in paths:
+            f = documents.get(path)
+            if f.docs is not None:
+                checker.check_file(f.path, documents.repo_root, docs=f.docs)
+        self.errors += checker.errors
+        self.fixes += checker.fixes
+
+
+class KustomizeCheck(Check):
+    """helmCharts fields and kustomize build of affected apps, see pre-commit-check.py."""
+
+    name = "kustomize"
+    files = re.compile(r"^(dev|production)/.*\.(yaml|yml)$")
+
+    def run(self, files: List[YamlFile], documents: DocumentSet) -> None:
+        module = _load_script("pre-commit-check.py", "pre_commit_check")
+        checker = module.Checker(self.auto_fix)
+        repo_root = documents.repo_root
+        app_dirs = module.get_app_dirs_from_files([str(f.path) for f in files], repo_root)
+        checker.start_renders(app_dirs)
+        for app_dir in app_dirs:
+            kustomization = documents.get(app_dir / "kustomization.yaml")
+            docs = kustomization.docs
+            if docs is None:
+                continue
+            # An empty or non-mapping file is reported by the checker itself
+            data = docs[0] if docs and isinstance(docs[0], dict) else {}
+            checker.check_app_directory(app_dir, repo_root, kustomization_data=data)
+        checker.check_schemas(repo_root)
+        self.errors += checker.errors
+        self.warnings += checker.warnings
+        self.fixes += checker.fixes
+
+
+CHECKS = [YamlCheck, SecretsCheck, KustomizeCheck]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def tracked_yaml_files(repo_root: Path) -> List[str]:
+    import subprocess
+    result = subprocess.run(["git", "ls-files", "-z", "--", "*.yaml", "*.yml"],
+                            cwd=repo_root, capture_output=True, text=True, check=True)
+    return [f for f in result.stdout.split("\0") if f]
+
+
+def run_checks(checks: List[Check], files: List[str], repo_root: Path) -> int:
+    documents = DocumentSet(repo_root)
+    selected = []
+    for name in files:
+        path = Path(name)
+        path = path if path.is_absolute() else repo_root / path
+        if path.is_file() and _YAML_FILES.search(path.name):
+            selected.append(documents.get(path))
+
+    active = []
+    for check in checks:
+        mine = [f for f in selected if check.wants(f.rel)]
+        if mine:
+            active.append((check, mine))
+    if not active:
+        print("No YAML files to check")
+        return 0
+
+    start = time.perf_counter()
+    timings = []
+    for check, mine in active:
+        check_start = time.perf_counter()
+        check.run(mine, documents)
+        timings.append(f"{check.name} {len(mine)} files {time.perf_counter() - check_start:.2f}s")
+
+    parsed = documents.parsed()
+    broken = sorted((f for f in parsed if f.error), key=lambda f: f.rel)
+    errors = [f"  {f.rel}: {f.error}" for f in broken]
+    for check, _ in active:
+        errors += check.errors
+    fixes = [fix for check, _ in active for fix in check.fixes]
+    warnings = [w for check, _ in active for w in check.warnings]
+
+    print()
+    print(f"Parsed {len(parsed)} files once for {len(active)} checks "
+          f"in {time.perf_counter() - start:.2f}s ({'; '.join(timings)})")
+    if fixes:
+        print("=" * 80)
+        print("FIXES APPLIED:")
+        for fix in fixes:
+            print(fix)
+    if warnings:
+        print("=" * 80)
+        print("WARNINGS:")
+        for warning in warnings:
+            print(warning)
+    print("=" * 80)
+    if errors:
+        print("FAILED - Errors found:")
+        for error in errors:
+            print(error)
+        return 1
+    print("PASSED - All checks successful")
+    return 0
+
+
+def main() -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the YAML checks over one shared parse")
+    parser.add_argument("--fix", action="store_true",
+                        help="Let checks fix what they can (kustomize fields, kubeseal)")
+    parser.add_argument("--only", metavar="NAMES",
+                        help="Comma-separated checks to run (default: all of "
+                             + ", ".join(c.name for c in CHECKS) + ")")
+    parser.add_argument("files", nargs="*",
+                        help="Files passed by pre-commit (default: all tracked YAML files)")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else [c.name for c in CHECKS]
+    unknown = set(names) - {c.name for c in CHECKS}
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(sorted(unknown))}")
+    checks = [c(auto_fix=args.fix) for c in CHECKS if c.name in names]
+    files = args.files or tracked_yaml_files(REPO_ROOT)
+    return run_checks(checks, files, REPO_ROOT)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
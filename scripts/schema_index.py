@@ -0,0 +1,498 @@
+"""Offline OpenAPI validation of rendered manifests, indexed by GVK.
+
+`kubectl kustomize` succeeding says nothing about the objects it emits: a
+misspelt field in a Deployment or an HTTPRoute only fails when Argo CD
+syncs. This module validates rendered objects against
+
+- the Kubernetes API schemas of the cluster's minor version (K8S_VERSION in
+  packer/modules-optional/70-k8s.sh), downloaded once from the Kubernetes
+  repository and trimmed into .render-cache/schemas/kubernetes-<v>.json;
+- the CustomResourceDefinitions found in rendered output (helmCharts with
+  includeCRDs: true), collected into .render-cache/schemas/crds.json and
+  refreshed whenever the app that ships them renders differently.
+
+Both are keyed by GVK ("apps/v1/Deployment"). Schemas are compiled into
+validator functions on first use. Validation results are cached next to
+the render they belong to, keyed by the index digest, so unchanged apps
+cost nothing. Objects without a schema are reported and skipped.
+
+The validator covers what the API server would reject or silently drop:
+unknown fields, wrong types, missing required fields and enum values. It
+does not check formats, patterns or numeric bounds, and checks oneOf like
+anyOf (a value matching several branches passes).
+
+Usage:
+    kubectl kustomize production/foo | scripts/schema_index.py -
+    scripts/schema_index.py rendered.yaml...
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from kustomize_render import CACHE_DIR, REPO_ROOT
+
+SCHEMA_DIR = CACHE_DIR / "schemas"
+K8S_MODULE = REPO_ROOT / "packer" / "modules-optional" / "70-k8s.sh"
+DEFAULT_K8S_VERSION = "v1.36"
+SWAGGER_URL = ("https://raw.githubusercontent.com/kubernetes/kubernetes/"
+               "{version}.0/api/openapi-spec/swagger.json")
+# Connect/read timeout of the download; it runs inside `git commit`
+DOWNLOAD_TIMEOUT = 10
+# After a failed download, runs skip it for this long instead of waiting again
+DOWNLOAD_RETRY_SECONDS = 6 * 3600
+
+MAX_ERRORS_PER_OBJECT = 5
+# Part of the index digest: bump when validation rules change, so cached
+# results of the old rules are not reused
+VALIDATOR_REVISION = 2
+# Below this many objects, forking workers costs more than it saves
+PARALLEL_MIN_OBJECTS = 5000
+
+_QUANTITY = "io.k8s.apimachinery.pkg.api.resource.Quantity"
+_OBJECT_META = "io.k8s.apimachinery.pkg.apis.meta.v1.ObjectMeta"
+# Set before forking validation workers, inherited by them
+_WORK: Optional[Tuple["SchemaIndex", List[dict]]] = None
+
+Check = Callable[[Any, str, List[str]], None]
+
+
+def gvk_key(api_version: str, kind: str) -> str:
+    return f"{api_version}/{kind}"
+
+
+def kubernetes_version() -> str:
+    """The cluster's minor version, as pinned for the node images."""
+    try:
+        m = re.search(r'^K8S_VERSION="(v\d+\.\d+)"', K8S_MODULE.read_text(), re.M)
+        if m:
+            return m.group(1)
+    except OSError:
+        pass
+    return DEFAULT_K8S_VERSION
+
+
+def _trim(schema: Any) -> Any:
+    """Drop what validation never reads; shrinks the swagger by about 60%."""
+    if isinstance(schema, list):
+        return [_trim(v) for v in schema]
+    if not isinstance(schema, dict):
+        return schema
+    trimmed = {}
+    for key, value in schema.items():
+        if key in ("description", "example", "externalDocs"):
+            continue
+        if key in ("properties", "patternProperties", "definitions") and isinstance(value, dict):
+            # Field names, which may well be "description"
+            trimmed[key] = {name: _trim(v) for name, v in value.items()}
+        else:
+            trimmed[key] = _trim(value)
+    return trimmed
+
+
+def _save_json(path: Path, data: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}")
+    tmp.write_text(json.dumps(data, separators=(",", ":")))
+    os.replace(tmp, path)
+
+
+def _load_json(path: Path) -> Any:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def load_builtin(version: str, schema_dir: Path = SCHEMA_DIR,
+                 log: Callable[[str], None] = print) -> Optional[dict]:
+    """The trimmed Kubernetes schemas of *version*, downloading them once.
+
+    Returns None when they are not cached and cannot be fetched; validation
+    then covers CRD kinds only. A failed download is logged once and
+    remembered in a marker file, so runs without network access skip it
+    for DOWNLOAD_RETRY_SECONDS (delete the marker to retry sooner).
+    """
+    path = schema_dir / f"kubernetes-{version}.json"
+    builtin = _load_json(path)
+    if builtin is not None:
+        return builtin
+
+    marker = schema_dir / f"kubernetes-{version}.unavailable"
+    try:
+        if time.time() - marker.stat().st_mtime < DOWNLOAD_RETRY_SECONDS:
+            return None
+    except OSError:
+        pass
+
+    from version_utils import _http
+    url = SWAGGER_URL.format(version=version)
+    try:
+        with _http().urlopen(url, timeout=DOWNLOAD_TIMEOUT) as resp:
+            swagger = json.loads(resp.read())
+    except Exception as e:
+        schema_dir.mkdir(parents=True, exist_ok=True)
+        marker.write_text(f"{url}: {e}\n")
+        log(f"  Kubernetes {version} schemas unavailable ({e}); validating CRD kinds only, "
+            f"not retrying for {DOWNLOAD_RETRY_SECONDS // 3600}h (remove {marker} to retry)")
+        return None
+
+    kinds = {}
+    for name, schema in swagger.get("definitions", {}).items():
+        for gvk in schema.get("x-kubernetes-group-version-kind") or []:
+            api_version = f"{gvk['group']}/{gvk['version']}" if gvk["group"] else gvk["version"]
+            kinds[gvk_key(api_version, gvk["kind"])] = name
+    builtin = {
+        "version": version,
+        "definitions": _trim(swagger.get("definitions", {})),
+        "kinds": kinds,
+    }
+    _save_json(path, builtin)
+    marker.unlink(missing_ok=True)
+    log(f"  Cached Kubernetes {version} schemas ({len(kinds)} kinds)")
+    return builtin
+
+
+def crd_schemas(obj: dict) -> Iterator[Tuple[str, dict]]:
+    """(GVK, openAPIV3Schema) of every served version of a CRD object."""
+    spec = obj.get("spec") or {}
+    group = spec.get("group")
+    kind = (spec.get("names") or {}).get("kind")
+    if not group or not kind:
+        return
+    for version in spec.get("versions") or []:
+        schema = ((version or {}).get("schema") or {}).get("openAPIV3Schema")
+        if version.get("served", True) and isinstance(schema, dict):
+            yield gvk_key(f"{group}/{version['name']}", kind), _trim(schema)
+
+
+def is_crd(obj: Any) -> bool:
+    return (isinstance(obj, dict) and obj.get("kind") == "CustomResourceDefinition"
+            and str(obj.get("apiVersion", "")).startswith("apiextensions.k8s.io/"))
+
+
+# ---------------------------------------------------------------------------
+# Compiled validators
+# ---------------------------------------------------------------------------
+
+def _type_name(value: Any) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, (str, date)):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, dict):
+        return "object"
+    return type(value).__name__
+
+
+# Accepted value types per schema type; YAML timestamps are strings to the
+# API server, and an integer is a valid number
+_ACCEPTS = {
+    "string": {"string"},
+    "integer": {"integer"},
+    "number": {"integer", "number"},
+    "boolean": {"boolean"},
+    "array": {"array"},
+    "object": {"object"},
+}
+
+
+class _Compiler:
+    """Turns schemas into nested closures, once per definition."""
+
+    def __init__(self, definitions: Dict[str, dict]) -> None:
+        self.definitions = definitions
+        self.refs: Dict[str, Check] = {}
+
+    def ref(self, name: str) -> Check:
+        if name not in self.refs:
+            # Placeholder first: definitions are recursive (JSONSchemaProps)
+            slot: List[Check] = []
+            self.refs[name] = lambda value, path, errors: slot[0](value, path, errors)
+            slot.append(self.compile(self.definitions.get(name, {}), name))
+        return self.refs[name]
+
+    def compile(self, schema: dict, name: str = "", structural: bool = True) -> Check:
+        """Validator for *schema*.
+
+        Unknown fields are only reported against the structural schema, as
+        the API server prunes them: the subschemas of allOf, anyOf and oneOf
+        (*structural* False, down to their leaves) only add constraints and
+        may list a subset of the fields. oneOf is checked like anyOf, since
+        its branches often differ only in formats, patterns or bounds, which
+        are not checked; a value matching several branches is accepted.
+        """
+        if "$ref" in schema:
+            return self.ref(schema["$ref"].rsplit("/", 1)[-1])
+
+        checks: List[Check] = []
+        int_or_string = (schema.get("x-kubernetes-int-or-string")
+                         or schema.get("format") == "int-or-string")
+        if name == _QUANTITY:
+            accepts = {"string", "integer", "number"}
+        elif int_or_string:
+            accepts = {"string", "integer"}
+        else:
+            accepts = _ACCEPTS.get(schema.get("type"))
+        if accepts:
+            expected = schema.get("type") if not int_or_string else "integer or string"
+
+            def check_type(value, path, errors, accepts=accepts, expected=expected):
+                if _type_name(value) not in accepts:
+                    errors.append(f"{path or '.'}: expected {expected}, got {_type_name(value)}")
+                    return False
+                return True
+        else:
+            check_type = None
+
+        if "enum" in schema:
+            allowed = schema["enum"]
+
+            def check_enum(value, path, errors):
+                if value not in allowed:
+                    shown = ", ".join(map(str, allowed[:8])) + (", ..." if len(allowed) > 8 else "")
+                    errors.append(f"{path or '.'}: {value!r} is not one of {shown}")
+            checks.append(check_enum)
+
+        properties = {k: self.compile(v, structural=structural)
+                      for k, v in (schema.get("properties") or {}).items()}
+        if schema.get("x-kubernetes-embedded-resource"):
+            # The API server validates these itself, whatever the schema lists
+            for field, implied in (("apiVersion", "string"), ("kind", "string"),
+                                   ("metadata", "object")):
+                properties.setdefault(field, self.compile({"type": implied}))
+        additional = schema.get("additionalProperties")
+        preserve = schema.get("x-kubernetes-preserve-unknown-fields")
+        strict = structural and bool(properties) and additional is None and not preserve
+        closed = structural and additional is False
+        additional_check = (self.compile(additional, structural=structural)
+                            if isinstance(additional, dict) else None)
+        required = schema.get("required") or []
+        if properties or additional_check or required or additional is False:
+
+            def check_object(value, path, errors):
+                if not isinstance(value, dict):
+                    return
+                for field in required:
+                    if field not in value:
+                        errors.append(f"{path or '.'}: missing required field {field!r}")
+                for key, item in value.items():
+                    sub = f"{path}.{key}" if path else str(key)
+                    check = properties.get(key)
+                    if check is not None:
+                        if item is not None:
+                            check(item, sub, errors)
+                    elif additional_check is not None:
+                        if item is not None:
+                            additional_check(item, sub, errors)
+                    elif strict or closed:
+                        errors.append(f"{sub}: unknown field")
+            checks.append(check_object)
+
+        if isinstance(schema.get("items"), dict):
+            item_check = self.compile(schema["items"], structural=structural)
+
+            def check_items(value, path, errors):
+                if isinstance(value, list):
+                    for i, item in enumerate(value):
+                        if item is not None:
+                            item_check(item, f"{path}[{i}]", errors)
+            checks.append(check_items)
+
+        for sub in schema.get("allOf") or []:
+            checks.append(self.compile(sub, structural=False))
+        for junctor in ("anyOf", "oneOf"):
+            branches = [self.compile(s, structural=False) for s in schema.get(junctor) or []]
+            if not branches or int_or_string:
+                continue
+
+            def check_any(value, path, errors, branches=branches):
+                first: List[str] = []
+                for i, branch in enumerate(branches):
+                    found: List[str] = []
+                    branch(value, path, found)
+                    if not found:
+                        return
+                    if i == 0:
+                        first = found
+                errors.extend(first)
+            checks.append(check_any)
+
+        def check(value, path, errors):
+            if len(errors) >= MAX_ERRORS_PER_OBJECT:
+                return
+            if check_type is not None and not check_type(value, path, errors):
+                return
+            for c in checks:
+                c(value, path, errors)
+        return check
+
+
+class SchemaIndex:
+    """Validators by GVK for the built-in kinds and the known CRDs."""
+
+    def __init__(self, builtin: Optional[dict], crds: Optional[dict] = None,
+                 schema_dir: Path = SCHEMA_DIR) -> None:
+        self.builtin = builtin
+        self.crds = crds or {"schemas": {}, "apps": {}}
+        self.schema_dir = schema_dir
+        self._compiler = _Compiler(builtin["definitions"] if builtin else {})
+        self._validators: Dict[str, Optional[Check]] = {}
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def load(cls, schema_dir: Path = SCHEMA_DIR,
+             log: Callable[[str], None] = print) -> "SchemaIndex":
+        builtin = load_builtin(kubernetes_version(), schema_dir, log)
+        return cls(builtin, _load_json(schema_dir / "crds.json"), schema_dir)
+
+    @property
+    def digest(self) -> str:
+        """Identifies the schema set; validation results are cached under it."""
+        if self._digest is None:
+            h = hashlib.sha256(f"{VALIDATOR_REVISION}\0".encode())
+            h.update((self.builtin or {}).get("version", "none").encode())
+            h.update(json.dumps(self.crds["schemas"], sort_keys=True).encode())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def app_key(self, app: str) -> Optional[str]:
+        """Render key of *app* when its CRDs were last collected."""
+        return (self.crds["apps"].get(app) or {}).get("key")
+
+    def update_crds(self, app: str, key: str, objects: Iterable[Any]) -> bool:
+        """Replace the CRDs *app* contributes; True if the index changed."""
+        previous = self.crds["apps"].get(app) or {}
+        schemas = {}
+        for obj in objects:
+            if is_crd(obj):
+                schemas.update(crd_schemas(obj))
+        changed = False
+        for gvk in previous.get("gvks", []):
+            if gvk not in schemas and self.crds["schemas"].pop(gvk, None) is not None:
+                changed = True
+        for gvk, schema in schemas.items():
+            if self.crds["schemas"].get(gvk) != schema:
+                self.crds["schemas"][gvk] = schema
+                changed = True
+        self.crds["apps"][app] = {"key": key, "gvks": sorted(schemas)}
+        if changed:
+            self._digest = None
+            self._validators.clear()
+        return changed
+
+    def save(self) -> None:
+        _save_json(self.schema_dir / "crds.json", self.crds)
+
+    def _crd_schema(self, schema: dict) -> dict:
+        # The API server validates apiVersion, kind and metadata itself
+        if not schema.get("properties"):
+            return schema
+        meta = {"$ref": f"#/definitions/{_OBJECT_META}"} if self.builtin else {
+            "type": "object", "x-kubernetes-preserve-unknown-fields": True}
+        properties = {"apiVersion": {"type": "string"}, "kind": {"type": "string"},
+                      "metadata": meta, **schema["properties"]}
+        return {**schema, "properties": properties}
+
+    def validator(self, gvk: str) -> Optional[Check]:
+        if gvk not in self._validators:
+            check = None
+            crd = self.crds["schemas"].get(gvk)
+            if crd is not None:
+                check = self._compiler.compile(self._crd_schema(crd))
+            elif self.builtin and gvk in self.builtin["kinds"]:
+                check = self._compiler.ref(self.builtin["kinds"][gvk])
+            self._validators[gvk] = check
+        return self._validators[gvk]
+
+    def validate(self, obj: Any) -> Optional[List[str]]:
+        """Errors of one object, or None when its GVK has no schema."""
+        if not isinstance(obj, dict):
+            return ["document is not an object"]
+        check = self.validator(gvk_key(str(obj.get("apiVersion")), str(obj.get("kind"))))
+        if check is None:
+            return None
+        errors: List[str] = []
+        check(obj, "", errors)
+        return errors[:MAX_ERRORS_PER_OBJECT]
+
+
+def _validate_range(bounds: Tuple[int, int]) -> List[Optional[List[str]]]:
+    index, objects = _WORK
+    return [index.validate(o) for o in objects[bounds[0]:bounds[1]]]
+
+
+def validate_objects(index: SchemaIndex, objects: List[Any],
+                     workers: Optional[int] = None) -> List[Optional[List[str]]]:
+    """:meth:`SchemaIndex.validate` for every object, forking workers for big sets."""
+    global _WORK
+    workers = workers or os.cpu_count() or 1
+    if workers < 2 or len(objects) < PARALLEL_MIN_OBJECTS or sys.platform == "win32":
+        return [index.validate(o) for o in objects]
+    import multiprocessing
+    step = -(-len(objects) // (workers * 4))
+    ranges = [(i, min(i + step, len(objects))) for i in range(0, len(objects), step)]
+    _WORK = (index, objects)
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("fork")) as pool:
+            return [r for chunk in pool.map(_validate_range, ranges) for r in chunk]
+    finally:
+        _WORK = None
+
+
+def describe(obj: Any) -> str:
+    if not isinstance(obj, dict):
+        return "?"
+    meta = obj.get("metadata") or {}
+    name = meta.get("name", "?")
+    if meta.get("namespace"):
+        name = f"{meta['namespace']}/{name}"
+    return f"{obj.get('kind', '?')} {name}"
+
+
+def main() -> int:
+    import argparse
+    import yaml
+    parser = argparse.ArgumentParser(description="Validate rendered manifests offline")
+    parser.add_argument("files", nargs="+", help="Rendered YAML files, - for stdin")
+    args = parser.parse_args()
+
+    loader = yaml.CSafeLoader if hasattr(yaml, "CSafeLoader") else yaml.SafeLoader
+    objects = []
+    for name in args.files:
+        text = sys.stdin.read() if name == "-" else Path(name).read_text()
+        objects += [o for o in yaml.load_all(text, Loader=loader) if o is not None]
+
+    index = SchemaIndex.load()
+    # CRDs in the input apply to the rest of it
+    index.update_crds("-", "", objects)
+    failed = 0
+    missing = set()
+    for obj, errors in zip(objects, validate_objects(index, objects)):
+        if errors is None:
+            missing.add(gvk_key(str(obj.get("apiVersion")), str(obj.get("kind"))))
+        for error in errors or []:
+            print(f"{describe(obj)}: {error}")
+        failed += bool(errors)
+    for gvk in sorted(missing):
+        print(f"no schema for {gvk}, not validated")
+    print(f"{len(objects)} objects, {failed} invalid")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
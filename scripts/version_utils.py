@@ -1,16 +1,17 @@
 """Shared utilities for Helm chart and container image version lookups."""
 
 import json
+import os
 import re
 import threading
 import time
 import urllib.error
 import urllib.parse
-import urllib.request
-from dataclasses import dataclass, field
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 try:
     import yaml
@@ -51,10 +52,37 @@ _MAX_TAG_PAGES = 10
 _TAG_PAGE_SIZE = 1000
 
 
+# ---------------------------------------------------------------------------
+# Lazy imports
+# ---------------------------------------------------------------------------
+
+def _http() -> Any:
+    """Return ``urllib.request``, importing it on first use.
+
+    It drags in ``http.client``, ``email`` and ``ssl``, which roughly doubles
+    the import time of this module; the pre-commit hooks only need
+    :func:`load_yaml` and never touch the network.
+    """
+    import urllib.request
+    return urllib.request
+
+
 # ---------------------------------------------------------------------------
 # Age filter
 # ---------------------------------------------------------------------------
 
+def _timestamp_str(value: Any) -> str:
+    """ISO 8601 string for a timestamp field.
+
+    YAML parses unquoted timestamps (Helm index ``created``) into datetime
+    objects; they are formatted the same way whether they come from a live
+    index or a snapshot, so both take the same age decisions.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value or "")
+
+
 def _is_old_enough(timestamp_str: Optional[str]) -> bool:
     """Return True if *timestamp_str* is at least *_MIN_AGE_DAYS* old."""
     if not timestamp_str:
@@ -66,6 +94,301 @@ def _is_old_enough(timestamp_str: Optional[str]) -> bool:
         return False
 
 
+# ---------------------------------------------------------------------------
+# Request instrumentation
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RequestRecord:
+    """One upstream HTTP request or cache lookup made during a check.
+
+    *endpoint* is the request type (``auth``, ``token``, ``tags``,
+    ``manifest``, ``blob``, ``index``, ``releases``) or, for cache lookups,
+    the cache key type.  *cache* is ``"hit"``/``"miss"`` for cache lookups and
+    empty for network requests.
+    """
+    host: str
+    endpoint: str
+    status: int = 0
+    size: int = 0
+    started: float = 0.0
+    latency: float = 0.0
+    cache: str = ""
+    item: str = ""
+    error: str = ""
+
+
+@dataclass
+class ItemRecord:
+    """Timing of one checked item (chart, image or release) as a whole."""
+    label: str
+    category: str
+    started: float = 0.0
+    latency: float = 0.0
+    requests: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+
+
+class RequestRecorder:
+    """Thread-safe collector for :class:`RequestRecord` and :class:`ItemRecord`.
+
+    Requests made inside :meth:`item` are attributed to that item via a
+    thread-local, which works because each item is queried on one worker
+    thread from start to finish.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.requests: List[RequestRecord] = []
+        self.items: List[ItemRecord] = []
+
+    def record(self, rec: RequestRecord) -> None:
+        current: Optional[ItemRecord] = getattr(self._local, "item", None)
+        if current is not None:
+            rec.item = current.label
+            if rec.cache == "hit":
+                current.cache_hits += 1
+            elif rec.cache == "miss":
+                current.cache_misses += 1
+            else:
+                current.requests += 1
+        with self._lock:
+            self.requests.append(rec)
+
+    @contextmanager
+    def item(self, category: str, label: str) -> Iterator[ItemRecord]:
+        """Time the enclosed block as one item and attribute requests to it."""
+        rec = ItemRecord(label=label, category=category, started=time.time())
+        previous = getattr(self._local, "item", None)
+        self._local.item = rec
+        start = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec.latency = time.perf_counter() - start
+            self._local.item = previous
+            with self._lock:
+                self.items.append(rec)
+
+
+_recorder: Optional[RequestRecorder] = None
+
+
+def set_recorder(recorder: Optional[RequestRecorder]) -> None:
+    """Install *recorder* for all subsequent lookups (``None`` disables)."""
+    global _recorder
+    _recorder = recorder
+
+
+def get_recorder() -> Optional[RequestRecorder]:
+    return _recorder
+
+
+@contextmanager
+def record_item(category: str, label: str) -> Iterator[Optional[ItemRecord]]:
+    """Time one item on the active recorder; a no-op when none is installed."""
+    recorder = _recorder
+    if recorder is None:
+        yield None
+        return
+    with recorder.item(category, label) as rec:
+        yield rec
+
+
+def _key_host(identifier: str) -> str:
+    """Best-effort host for a cache key identifier (URL or ``host/repo``)."""
+    if "://" in identifier:
+        return urllib.parse.urlparse(identifier).netloc
+    return identifier.split("/", 1)[0]
+
+
+def _record_cache(key: Tuple[str, str], hit: bool) -> None:
+    recorder = _recorder
+    if recorder is None:
+        return
+    recorder.record(RequestRecord(
+        host=_key_host(key[1]),
+        endpoint=key[0],
+        started=time.time(),
+        cache="hit" if hit else "miss",
+    ))
+
+
+def _urlopen(req: "urllib.request.Request", timeout: float,
+             endpoint: str) -> Tuple[bytes, Any]:
+    """Open *req*, read the whole body and record the request.
+
+    Returns *(body, headers)*.  ``urllib.error.HTTPError`` and other errors
+    propagate unchanged so callers keep their existing error handling.
+    """
+    if _offline:
+        raise OfflineError(f"offline: {endpoint} for {req.full_url} not in snapshot")
+
+    recorder = _recorder
+    if recorder is None:
+        with _http().urlopen(req, timeout=timeout) as resp:
+            return resp.read(), resp.headers
+
+    rec = RequestRecord(
+        host=urllib.parse.urlparse(req.full_url).netloc,
+        endpoint=endpoint,
+        started=time.time(),
+    )
+    start = time.perf_counter()
+    try:
+        with _http().urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+            rec.status = resp.status
+            rec.size = len(body)
+            return body, resp.headers
+    except urllib.error.HTTPError as e:
+        rec.status = e.code
+        # A 401 on the anonymous probe is the expected auth challenge.
+        if not (endpoint == "auth" and e.code == 401):
+            rec.error = f"HTTP {e.code}"
+        raise
+    except Exception as e:
+        rec.error = type(e).__name__
+        raise
+    finally:
+        rec.latency = time.perf_counter() - start
+        recorder.record(rec)
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _latency_stats(records: List[RequestRecord]) -> Dict[str, Any]:
+    latencies = sorted(r.latency for r in records)
+    return {
+        "requests": len(records),
+        "bytes": sum(r.size for r in records),
+        "errors": sum(1 for r in records if r.error),
+        "total_s": round(sum(latencies), 4),
+        "p50_s": round(_percentile(latencies, 50), 4),
+        "p95_s": round(_percentile(latencies, 95), 4),
+    }
+
+
+def summarize_requests(recorder: RequestRecorder, top: int = 10) -> Dict[str, Any]:
+    """Aggregate recorded requests per host and endpoint type.
+
+    Returns a JSON-serialisable dict with per-host and per-endpoint totals,
+    p50/p95 latencies, cache hit/miss counts and the *top* slowest requests
+    and items.
+    """
+    network = [r for r in recorder.requests if not r.cache]
+    lookups = [r for r in recorder.requests if r.cache]
+
+    by_host: Dict[str, List[RequestRecord]] = {}
+    by_endpoint: Dict[str, List[RequestRecord]] = {}
+    for r in network:
+        by_host.setdefault(r.host, []).append(r)
+        by_endpoint.setdefault(r.endpoint, []).append(r)
+
+    cache: Dict[str, Dict[str, int]] = {}
+    for r in lookups:
+        counts = cache.setdefault(r.endpoint, {"hit": 0, "miss": 0})
+        counts[r.cache] += 1
+
+    slowest = sorted(network, key=lambda r: r.latency, reverse=True)[:top]
+    slowest_items = sorted(recorder.items, key=lambda i: i.latency, reverse=True)[:top]
+
+    return {
+        "totals": _latency_stats(network),
+        "hosts": {h: _latency_stats(rs) for h, rs in sorted(by_host.items())},
+        "endpoints": {e: _latency_stats(rs) for e, rs in sorted(by_endpoint.items())},
+        "cache": cache,
+        "slowest_requests": [asdict(r) for r in slowest],
+        "slowest_items": [asdict(i) for i in slowest_items],
+    }
+
+
+def export_otlp_spans(recorder: RequestRecorder, endpoint: str,
+                      service_name: str = "check-versions") -> Optional[str]:
+    """Send recorded items and requests to an OTLP/HTTP collector as spans.
+
+    *endpoint* is the collector base URL (e.g. ``http://otel:4318``); spans
+    are posted as OTLP JSON to ``/v1/traces``.  Each item becomes a span
+    with its requests as child spans, all under one trace for the run.
+
+    Returns an error message, or ``None`` on success.
+    """
+    def _attr(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _span(span_id: str, parent: str, name: str, started: float,
+              latency: float, attrs: List[Dict[str, Any]], error: bool) -> Dict[str, Any]:
+        start_ns = int(started * 1e9)
+        span = {
+            "traceId": trace_id,
+            "spanId": span_id,
+            "name": name,
+            "kind": 3 if parent else 1,  # CLIENT for requests, INTERNAL for items
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(latency * 1e9)),
+            "attributes": attrs,
+            "status": {"code": 2 if error else 1},
+        }
+        if parent:
+            span["parentSpanId"] = parent
+        return span
+
+    trace_id = os.urandom(16).hex()
+    item_ids: Dict[str, str] = {}
+    spans: List[Dict[str, Any]] = []
+
+    for it in recorder.items:
+        span_id = os.urandom(8).hex()
+        item_ids[it.label] = span_id
+        spans.append(_span(span_id, "", f"{it.category} {it.label}", it.started, it.latency, [
+            _attr("check.category", it.category),
+            _attr("check.requests", it.requests),
+            _attr("check.cache_hits", it.cache_hits),
+            _attr("check.cache_misses", it.cache_misses),
+        ], False))
+
+    for r in recorder.requests:
+        if r.cache:
+            continue
+        spans.append(_span(os.urandom(8).hex(), item_ids.get(r.item, ""),
+                           f"{r.endpoint} {r.host}", r.started, r.latency, [
+            _attr("server.address", r.host),
+            _attr("http.response.status_code", r.status),
+            _attr("http.response.body.size", r.size),
+            _attr("check.endpoint", r.endpoint),
+        ], bool(r.error)))
+
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": [_attr("service.name", service_name)]},
+        "scopeSpans": [{"scope": {"name": "version_utils"}, "spans": spans}],
+    }]}
+
+    url = endpoint.rstrip("/")
+    if not url.endswith("/v1/traces"):
+        url += "/v1/traces"
+    req = _http().Request(url, data=json.dumps(payload).encode(), method="POST")
+    req.add_header("Content-Type", "application/json")
+    try:
+        with _http().urlopen(req, timeout=15):
+            return None
+    except urllib.error.HTTPError as e:
+        return f"HTTP {e.code} {e.reason}"
+    except Exception as e:
+        return str(e)
+
+
 # ---------------------------------------------------------------------------
 # Version cache
 # ---------------------------------------------------------------------------
@@ -76,10 +399,17 @@ class VersionCache:
     Supports per-key locking so that expensive operations (e.g. downloading a
     large Helm index.yaml) are only performed once even when multiple threads
     request the same key concurrently.
+
+    *ttls* optionally maps a key type (``helm_index``, ``image_tags``, ...) to
+    a lifetime in seconds; expired entries read as misses so long-running
+    callers refetch each source on its own schedule.  Types without a TTL
+    never expire.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, ttls: Optional[Dict[str, float]] = None) -> None:
         self._data: Dict[Tuple[str, str], Any] = {}
+        self._stored: Dict[Tuple[str, str], float] = {}
+        self._ttls: Dict[str, float] = dict(ttls or {})
         self._lock = threading.Lock()
         self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
 
@@ -89,11 +419,41 @@ class VersionCache:
                 self._key_locks[key] = threading.Lock()
             return self._key_locks[key]
 
+    def _is_expired(self, key: Tuple[str, str], now: float) -> bool:
+        ttl = self._ttls.get(key[0])
+        if ttl is None:
+            return False
+        return now - self._stored.get(key, now) >= ttl
+
+    def _lookup(self, key: Tuple[str, str]) -> Any:
+        value = self._data.get(key)
+        if value is not None and self._is_expired(key, time.monotonic()):
+            return None
+        return value
+
     def get(self, key: Tuple[str, str]) -> Any:
-        return self._data.get(key)
+        value = self._lookup(key)
+        _record_cache(key, value is not None)
+        return value
 
     def put(self, key: Tuple[str, str], value: Any) -> None:
         self._data[key] = value
+        self._stored[key] = time.monotonic()
+
+    def entries(self) -> List[Tuple[Tuple[str, str], Any]]:
+        """Return a point-in-time list of all non-empty *(key, value)* pairs."""
+        with self._lock:
+            return [(k, v) for k, v in self._data.items() if v is not None]
+
+    def evict_expired(self) -> List[Tuple[str, str]]:
+        """Drop expired entries and return their keys."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k in list(self._data) if self._is_expired(k, now)]
+            for k in expired:
+                self._data.pop(k, None)
+                self._stored.pop(k, None)
+        return expired
 
     def get_or_compute(self, key: Tuple[str, str], compute: Callable[[], Any]) -> Any:
         """Return cached value for *key* or run *compute* to produce it.
@@ -107,14 +467,106 @@ class VersionCache:
 
         lock = self._key_lock(key)
         with lock:
-            value = self.get(key)
+            value = self._lookup(key)
             if value is not None:
+                # Computed by another thread while this one waited
+                _record_cache(key, True)
                 return value
             value = compute()
             self.put(key, value)
             return value
 
 
+# ---------------------------------------------------------------------------
+# Offline snapshots
+# ---------------------------------------------------------------------------
+
+SNAPSHOT_VERSION = 1
+
+# Cache key types that hold upstream data worth shipping in a snapshot.
+_SNAPSHOT_KINDS = ("helm_index", "oci_tags", "oci_created", "image_tags", "harbor_tags",
+                   "github_releases")
+
+
+class OfflineError(Exception):
+    """Raised instead of a network request while running from a snapshot."""
+
+
+_offline = False
+
+
+def set_offline(offline: bool) -> None:
+    """When *offline*, every upstream request fails with :class:`OfflineError`."""
+    global _offline
+    _offline = offline
+
+
+def _trim_helm_index(index: dict, charts: Optional[Set[str]]) -> dict:
+    """Keep only *charts* (all when ``None``) and the fields lookups read."""
+    entries = index.get("entries") or {}
+    return {"entries": {
+        name: [{"version": e.get("version", ""), "created": _timestamp_str(e.get("created"))}
+               for e in versions]
+        for name, versions in entries.items()
+        if charts is None or name in charts
+    }}
+
+
+def export_snapshot(cache: VersionCache, path: Path,
+                    charts: Optional[Set[str]] = None) -> int:
+    """Write the upstream data held in *cache* to *path* as a snapshot.
+
+    Helm indexes are trimmed to *charts* and to the version/created fields.
+    A ``.gz`` suffix selects gzip compression.  Returns the entry count.
+    """
+    data: Dict[str, Dict[str, Any]] = {kind: {} for kind in _SNAPSHOT_KINDS}
+    count = 0
+    for (kind, ident), value in cache.entries():
+        if kind not in data:
+            continue
+        if kind == "helm_index":
+            value = _trim_helm_index(value, charts)
+        data[kind][ident] = value
+        count += 1
+
+    doc = {
+        "version": SNAPSHOT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "entries": data,
+    }
+    payload = json.dumps(doc, separators=(",", ":")).encode()
+    if path.suffix == ".gz":
+        import gzip
+        payload = gzip.compress(payload)
+    path.write_bytes(payload)
+    return count
+
+
+def import_snapshot(path: Path) -> Tuple[VersionCache, str]:
+    """Load a snapshot written by :func:`export_snapshot`.
+
+    Returns *(cache, created_timestamp)*.  Raises ``ValueError`` for an
+    unreadable snapshot or an unsupported snapshot version.
+    """
+    payload = path.read_bytes()
+    if payload[:2] == b"\x1f\x8b":
+        import gzip
+        payload = gzip.decompress(payload)
+    try:
+        doc = json.loads(payload)
+    except ValueError as e:
+        raise ValueError(f"{path}: not a snapshot ({e})")
+    if not isinstance(doc, dict) or doc.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path}: unsupported snapshot version "
+                         f"{doc.get('version') if isinstance(doc, dict) else None!r}")
+
+    cache = VersionCache()
+    for kind, values in (doc.get("entries") or {}).items():
+        for ident, value in values.items():
+            cache.put((kind, ident), value)
+    return cache, doc.get("created", "")
+
+
 # ---------------------------------------------------------------------------
 # YAML helpers
 # ---------------------------------------------------------------------------
@@ -292,20 +744,22 @@ def parse_image_ref(ref: str) -> Optional[Tuple[str, str, Optional[str]]]:
 # Generic OCI registry auth
 # ---------------------------------------------------------------------------
 
-def _get_oci_auth_token(registry: str, repository: str) -> Tuple[Optional[str], Optional[str]]:
+def _get_oci_auth_token(registry: str, repository: str,
+                        base_url: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
     """Obtain a Bearer token for an OCI registry by following the WWW-Authenticate challenge.
 
-    Returns *(token, error_message)*.
+    *base_url* overrides ``https://<registry>`` (e.g. a Harbor served over
+    plain HTTP).  Returns *(token, error_message)*.
     """
-    tags_url = f"https://{registry}/v2/{repository}/tags/list"
-    req = urllib.request.Request(tags_url)
+    tags_url = f"{base_url or 'https://' + registry}/v2/{repository}/tags/list"
+    req = _http().Request(tags_url)
     req.add_header("Accept", "application/json")
     req.add_header("User-Agent", _helm_user_agent())
 
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            # Registry allows anonymous access.
-            return None, None
+        _urlopen(req, 15, "auth")
+        # Registry allows anonymous access.
+        return None, None
     except urllib.error.HTTPError as e:
         if e.code != 401:
             return None, f"HTTP {e.code} {e.reason}"
@@ -332,14 +786,14 @@ def _get_oci_auth_token(registry: str, repository: str) -> Tuple[Optional[str],
             token_url += "?" + urllib.parse.urlencode(query)
 
         try:
-            req = urllib.request.Request(token_url)
+            req = _http().Request(token_url)
             req.add_header("User-Agent", _helm_user_agent())
-            with urllib.request.urlopen(req, timeout=20) as resp:
-                data = json.loads(resp.read())
-                token = data.get("token") or data.get("access_token")
-                if not token:
-                    return None, "empty token response from auth server"
-                return token, None
+            body, _ = _urlopen(req, 20, "token")
+            data = json.loads(body)
+            token = data.get("token") or data.get("access_token")
+            if not token:
+                return None, "empty token response from auth server"
+            return token, None
         except urllib.error.HTTPError as ae:
             return None, f"auth HTTP {ae.code} {ae.reason}"
         except Exception as ae:
@@ -373,27 +827,27 @@ def _fetch_oci_tags(registry: str, repository: str,
 
     for _ in range(_MAX_TAG_PAGES):
         try:
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req, timeout=15) as resp:
-                data = json.loads(resp.read())
-                tags = data.get("tags") or []
-                all_tags.extend(tags)
-
-                link_hdr = resp.headers.get("Link", "")
-                if 'rel="next"' not in link_hdr:
-                    break
+            req = _http().Request(url, headers=headers)
+            body, resp_headers = _urlopen(req, 15, "tags")
+            data = json.loads(body)
+            tags = data.get("tags") or []
+            all_tags.extend(tags)
 
-                for part in link_hdr.split(","):
-                    if 'rel="next"' in part:
-                        match = re.search(r"<(.+?)>", part)
-                        if match:
-                            raw_next = match.group(1)
-                            url = urllib.parse.urljoin(f"https://{registry}", raw_next)
-                        else:
-                            return all_tags, None
-                        break
-                else:
+            link_hdr = resp_headers.get("Link", "")
+            if 'rel="next"' not in link_hdr:
+                break
+
+            for part in link_hdr.split(","):
+                if 'rel="next"' in part:
+                    match = re.search(r"<(.+?)>", part)
+                    if match:
+                        raw_next = match.group(1)
+                        url = urllib.parse.urljoin(f"https://{registry}", raw_next)
+                    else:
+                        return all_tags, None
                     break
+            else:
+                break
         except urllib.error.HTTPError as e:
             return all_tags, f"HTTP {e.code} {e.reason}"
         except Exception as e:
@@ -417,25 +871,25 @@ def _get_oci_manifest_created(registry: str, repository: str,
         headers["Authorization"] = f"Bearer {token}"
 
     try:
-        req = urllib.request.Request(url, headers=headers)
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            manifest = json.loads(resp.read())
-            created = manifest.get("annotations", {}).get("org.opencontainers.image.created")
+        req = _http().Request(url, headers=headers)
+        body, _ = _urlopen(req, 15, "manifest")
+        manifest = json.loads(body)
+        created = manifest.get("annotations", {}).get("org.opencontainers.image.created")
+        if created:
+            return created, None
+
+        # Fallback to config blob
+        config = manifest.get("config", {})
+        digest = config.get("digest")
+        if digest:
+            blob_url = f"https://{registry}/v2/{repository}/blobs/{digest}"
+            req = _http().Request(blob_url, headers=headers)
+            body, _ = _urlopen(req, 15, "blob")
+            config_data = json.loads(body)
+            created = config_data.get("created")
             if created:
                 return created, None
-
-            # Fallback to config blob
-            config = manifest.get("config", {})
-            digest = config.get("digest")
-            if digest:
-                blob_url = f"https://{registry}/v2/{repository}/blobs/{digest}"
-                req = urllib.request.Request(blob_url, headers=headers)
-                with urllib.request.urlopen(req, timeout=15) as bresp:
-                    config_data = json.loads(bresp.read())
-                    created = config_data.get("created")
-                    if created:
-                        return created, None
-            return None, "no created timestamp in manifest"
+        return None, "no created timestamp in manifest"
     except urllib.error.HTTPError as e:
         return None, f"HTTP {e.code} {e.reason}"
     except Exception as e:
@@ -463,10 +917,10 @@ def get_latest_helm_version_http(chart_name: str, repo_url: str,
     def _fetch_index() -> Optional[dict]:
         index_url = repo_url + "index.yaml"
         try:
-            req = urllib.request.Request(index_url)
+            req = _http().Request(index_url)
             req.add_header("User-Agent", _helm_user_agent())
-            with urllib.request.urlopen(req, timeout=60) as resp:
-                return yaml.load(resp.read(), Loader=_YAML_LOADER)
+            body, _ = _urlopen(req, 60, "index")
+            return yaml.load(body, Loader=_YAML_LOADER)
         except Exception:
             return None
 
@@ -486,7 +940,7 @@ def get_latest_helm_version_http(chart_name: str, repo_url: str,
 
     for entry in chart_entries:
         ver = entry.get("version", "")
-        created = entry.get("created", "")
+        created = _timestamp_str(entry.get("created"))
         if not ver:
             continue
         if is_prerelease(ver):
@@ -546,15 +1000,22 @@ def get_latest_helm_version_oci(chart_name: str, repo_url: str,
         if api_registry == "registry-1.docker.io" and "/" not in image:
             docker_image = f"library/{image}"
 
-        token, auth_err = _get_oci_auth_token(api_registry, docker_image)
-        if auth_err:
-            return VersionCandidates(error=auth_err)
+        # Only authenticate when a cache miss actually needs the registry.
+        auth: List[Tuple[Optional[str], Optional[str]]] = []
+
+        def _token() -> Tuple[Optional[str], Optional[str]]:
+            if not auth:
+                auth.append(_get_oci_auth_token(api_registry, docker_image))
+            return auth[0]
 
         # Cache tags list per repo
         tags_key = ("oci_tags", f"{api_registry}/{docker_image}")
         tags: Optional[List[str]] = cache.get(tags_key)
 
         if tags is None:
+            token, auth_err = _token()
+            if auth_err:
+                return VersionCandidates(error=auth_err)
             raw_tags, tags_err = _fetch_oci_tags(api_registry, docker_image, token)
             if tags_err:
                 return VersionCandidates(error=tags_err)
@@ -571,11 +1032,19 @@ def get_latest_helm_version_oci(chart_name: str, repo_url: str,
         current_date: Optional[str] = None
 
         for tag in tags[:_MAX_OCI_CANDIDATES]:
-            created, created_err = _get_oci_manifest_created(
-                api_registry, docker_image, tag, token
-            )
-            if created_err:
-                continue
+            # Manifest dates never change for a pushed tag; cache them per tag.
+            created_key = ("oci_created", f"{api_registry}/{docker_image}:{tag}")
+            created = cache.get(created_key)
+            if created is None:
+                token, auth_err = _token()
+                if auth_err:
+                    return VersionCandidates(error=auth_err)
+                created, created_err = _get_oci_manifest_created(
+                    api_registry, docker_image, tag, token
+                )
+                if created_err:
+                    continue
+                cache.put(created_key, created)
             if not _is_old_enough(created):
                 continue
             if tag == current_version and not current_date:
@@ -613,27 +1082,36 @@ def get_latest_github_release_version(owner_repo: str,
 
     *owner_repo* should be ``"owner/repo"`` (e.g. ``"tektoncd/operator"``).
     """
-    url = f"https://api.github.com/repos/{owner_repo}/releases?per_page=25"
-    req = urllib.request.Request(url)
-    req.add_header("Accept", "application/vnd.github+json")
-    req.add_header("User-Agent", _helm_user_agent())
-    req.add_header("X-GitHub-Api-Version", "2022-11-28")
+    # Cache the raw release list per repo (only the fields used below).
+    releases_key = ("github_releases", owner_repo)
+    releases: Optional[List[dict]] = cache.get(releases_key)
 
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            releases = json.loads(resp.read())
-    except urllib.error.HTTPError as e:
-        return VersionCandidates(error=f"HTTP {e.code} {e.reason}")
-    except Exception as e:
-        return VersionCandidates(error=str(e))
+    if releases is None:
+        url = f"https://api.github.com/repos/{owner_repo}/releases?per_page=25"
+        req = _http().Request(url)
+        req.add_header("Accept", "application/vnd.github+json")
+        req.add_header("User-Agent", _helm_user_agent())
+        req.add_header("X-GitHub-Api-Version", "2022-11-28")
+
+        try:
+            body, _ = _urlopen(req, 15, "releases")
+            releases = [
+                {k: r.get(k) for k in ("tag_name", "published_at", "prerelease", "draft")}
+                for r in json.loads(body)
+            ]
+        except urllib.error.HTTPError as e:
+            return VersionCandidates(error=f"HTTP {e.code} {e.reason}")
+        except Exception as e:
+            return VersionCandidates(error=str(e))
+        cache.put(releases_key, releases)
 
     current_date: Optional[str] = None
     collected: List[Tuple[str, str]] = []
     for r in releases:
         if r.get("prerelease") or r.get("draft"):
             continue
-        tag_name = r.get("tag_name", "")
-        published = r.get("published_at", "")
+        tag_name = r.get("tag_name") or ""
+        published = r.get("published_at") or ""
         if not parse_semver(tag_name):
             continue
         if not _is_old_enough(published):
@@ -663,19 +1141,144 @@ def get_latest_github_release_version(owner_repo: str,
     )
 
 
+# ---------------------------------------------------------------------------
+# Harbor proxy-cache lookup
+# ---------------------------------------------------------------------------
+
+_HARBOR_PAGE_SIZE = 100
+_MAX_HARBOR_PAGES = 20
+
+_harbor_url: Optional[str] = None
+
+
+def set_harbor_lookup(base_url: Optional[str]) -> None:
+    """List image tags through the proxy-cache projects of Harbor at *base_url*
+    before going upstream, and take tag dates from them.
+
+    ``None`` disables the Harbor backend.
+    """
+    global _harbor_url
+    _harbor_url = base_url.rstrip("/") if base_url else None
+
+
+def harbor_base_url() -> str:
+    """Base URL of the local Harbor derived from ``HARBOR_PREFIX``."""
+    return "https://" + HARBOR_PREFIX.rstrip("/")
+
+
+def _fetch_harbor_tags(harbor_url: str, project: str,
+                       repository: str) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    """List tagged artifacts of *project*/*repository* through the Harbor
+    ``/api/v2.0`` artifact API, following ``X-Total-Count`` pagination.
+
+    Proxy-cache projects are named after the upstream registry (``docker.io``,
+    ``ghcr.io``, ...), so *project* is the image's registry.
+
+    Returns *([(tag, created), ...], error_message)*; *created* is the image
+    build time when Harbor knows it, else the push time.
+    """
+    # Harbor expects the repository name URL-encoded twice.
+    repo_enc = urllib.parse.quote(urllib.parse.quote(repository, safe=""), safe="")
+    base = (f"{harbor_url}/api/v2.0/projects/{urllib.parse.quote(project, safe='')}"
+            f"/repositories/{repo_enc}/artifacts")
+    headers = {"Accept": "application/json", "User-Agent": "renovate-check/1.0"}
+
+    tagged: List[Tuple[str, str]] = []
+    seen = 0
+    for page in range(1, _MAX_HARBOR_PAGES + 1):
+        query = urllib.parse.urlencode({
+            "page": page,
+            "page_size": _HARBOR_PAGE_SIZE,
+            "with_tag": "true",
+            "with_label": "false",
+            "with_scan_overview": "false",
+        })
+        try:
+            req = _http().Request(f"{base}?{query}", headers=headers)
+            body, resp_headers = _urlopen(req, 10, "harbor")
+        except urllib.error.HTTPError as e:
+            return tagged, f"HTTP {e.code} {e.reason}"
+        except Exception as e:
+            return tagged, str(e)
+
+        artifacts = json.loads(body) or []
+        for art in artifacts:
+            created = (art.get("extra_attrs") or {}).get("created") or ""
+            for tag in art.get("tags") or []:
+                tagged.append((tag.get("name", ""), created or tag.get("push_time") or ""))
+        seen += len(artifacts)
+
+        try:
+            total = int(resp_headers.get("X-Total-Count", "0"))
+        except ValueError:
+            total = 0
+        if not artifacts or seen >= total:
+            break
+
+    return tagged, None
+
+
+def _harbor_tag_dates(registry: str, repository: str,
+                      cache: VersionCache) -> Dict[str, str]:
+    """Dates of the tags Harbor holds for *registry*/*repository*.
+
+    A proxy cache only holds what was pulled through it, so this is never
+    the full tag list; it only supplies dates the registry v2 tag list does
+    not have.  Empty when Harbor lookup is disabled, the repository is
+    unknown to Harbor or Harbor is unreachable.
+    """
+    if not _harbor_url:
+        return {}
+    key = ("harbor_tags", f"{registry}/{repository}")
+    cached = cache.get(key)
+    if cached is not None:
+        return {t: d for t, d in cached}
+
+    tagged, err = _fetch_harbor_tags(_harbor_url, registry, repository)
+    if err:
+        if err.startswith("HTTP 404"):
+            cache.put(key, [])  # no such project/repository: remember the miss
+        return {}
+    dates = {t: d for t, d in tagged if d}
+    cache.put(key, sorted(dates.items()))
+    return dates
+
+
+def _harbor_tag_list(registry: str, repository: str) -> Tuple[List[str], Optional[str]]:
+    """Full tag list of *registry*/*repository* through Harbor's proxy project.
+
+    Harbor answers ``/v2/<project>/<repo>/tags/list`` of a proxy-cache
+    project from the upstream registry with its own credentials, so this
+    avoids public rate limits.  Returns *(tags, error_message)*; an error
+    (or no tags) means Harbor has no usable project for *registry*.
+    """
+    repo = f"{registry}/{repository}"
+    host = urllib.parse.urlparse(_harbor_url).netloc
+    token, err = _get_oci_auth_token(host, repo, _harbor_url)
+    if err:
+        return [], err
+    tags, err = _fetch_all_tags(host, repo, token, _harbor_url)
+    if not err and not tags:
+        err = "no tags"
+    return tags, err
+
+
 # ---------------------------------------------------------------------------
 # Container image tag lookup (Docker Registry v2)
 # ---------------------------------------------------------------------------
 
 
 def _fetch_all_tags(api_registry: str, docker_repo: str,
-                    token: Optional[str]) -> Tuple[List[str], Optional[str]]:
+                    token: Optional[str],
+                    base_url: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
     """Fetch all tags from a Docker Registry v2 API, following pagination.
 
+    *base_url* overrides ``https://<api_registry>``.
     Returns (tags_list, error_message).
     """
+    base_url = base_url or f"https://{api_registry}"
     all_tags: List[str] = []
-    url = f"https://{api_registry}/v2/{docker_repo}/tags/list?n={_TAG_PAGE_SIZE}"
+    url = f"{base_url}/v2/{docker_repo}/tags/list?n={_TAG_PAGE_SIZE}"
     headers = {
         "Accept": "application/json",
         "User-Agent": "renovate-check/1.0",
@@ -685,15 +1288,15 @@ def _fetch_all_tags(api_registry: str, docker_repo: str,
 
     for _ in range(_MAX_TAG_PAGES):
         try:
-            req = urllib.request.Request(url, headers=headers)
-            with urllib.request.urlopen(req, timeout=15) as resp:
-                data = json.loads(resp.read())
+            req = _http().Request(url, headers=headers)
+            body, resp_headers = _urlopen(req, 15, "tags")
+            data = json.loads(body)
 
             tags = data.get("tags") or []
             all_tags.extend(tags)
 
             # Check Link header for next page
-            link_hdr = resp.headers.get("Link", "")
+            link_hdr = resp_headers.get("Link", "")
             if 'rel="next"' not in link_hdr:
                 break
 
@@ -704,9 +1307,7 @@ def _fetch_all_tags(api_registry: str, docker_repo: str,
                     if match:
                         raw_next = match.group(1)
                         # next URL is relative to the registry; make it absolute
-                        next_url = urllib.parse.urljoin(
-                            f"https://{api_registry}", raw_next
-                        )
+                        next_url = urllib.parse.urljoin(base_url, raw_next)
                         url = next_url
                     else:
                         return all_tags, None
@@ -729,9 +1330,17 @@ def get_latest_image_tag(registry: str, repository: str,
     (excluding unstable prereleases).
 
     Returns up to 5 candidates, newest first.  Dates are NOT available from the
-    tag-list API (manifest fetches would be needed), so ``current_date`` is
-    always ``None``.
+    tag-list API (manifest fetches would be needed), so candidates and
+    ``current_date`` are undated unless a Harbor lookup is enabled.
+
+    With a Harbor lookup (:func:`set_harbor_lookup`) the tag list is fetched
+    through the matching proxy-cache project first, which forwards it to
+    the upstream registry; the registry is asked directly only when Harbor
+    fails or has no such project.  The artifacts Harbor holds also supply
+    the dates of the tags that were pulled through it.
     """
+    dates = _harbor_tag_dates(registry, repository, cache)
+
     # Use cache for tags list
     tags_key = ("image_tags", f"{registry}/{repository}")
     version_tags: Optional[List[str]] = cache.get(tags_key)
@@ -746,20 +1355,24 @@ def get_latest_image_tag(registry: str, repository: str,
         if api_registry == "registry-1.docker.io" and "/" not in repository:
             docker_repo = f"library/{repository}"
 
-        token = None
-        if api_registry == "registry-1.docker.io":
-            token, auth_err = _get_oci_auth_token(api_registry, docker_repo)
-            if not token:
-                return VersionCandidates(error=auth_err or "docker hub auth failed")
-
-        tags, err = _fetch_all_tags(api_registry, docker_repo, token)
+        err: Optional[str] = "Harbor lookup disabled"
+        if _harbor_url:
+            tags, err = _harbor_tag_list(registry, docker_repo)
         if err:
-            return VersionCandidates(error=err)
+            token = None
+            if api_registry == "registry-1.docker.io":
+                token, auth_err = _get_oci_auth_token(api_registry, docker_repo)
+                if not token:
+                    return VersionCandidates(error=auth_err or "docker hub auth failed")
+
+            tags, err = _fetch_all_tags(api_registry, docker_repo, token)
+            if err:
+                return VersionCandidates(error=err)
 
         version_tags = sort_semver_tags(
             [t for t in tags if _SCAN_RE.match(t) and not is_prerelease(t)]
         )
         cache.put(tags_key, version_tags or [])
 
-    candidates = [(t, "") for t in (version_tags or [])[:5]]
-    return VersionCandidates(candidates=candidates)
+    candidates = [(t, dates.get(t, "")) for t in (version_tags or [])[:5]]
+    return VersionCandidates(candidates=candidates, current_date=dates.get(current_tag) or None)